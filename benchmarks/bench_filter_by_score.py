@@ -0,0 +1,129 @@
+"""
+Benchmark of loaders.filter_by_score against the previous implementation, which looked up the
+ancestors of every orthologGroup in a list of groups to remove.
+
+Synthetic FastOMA-like documents are generated with deep chains of orthologGroups and wide
+paralogGroups. The outputs of both implementations are also checked to be byte-identical for
+every filtering strategy.
+
+Usage:
+    python benchmarks/bench_filter_by_score.py [--depth 400] [--width 8] [--roots 20] [--seed 0]
+"""
+
+import argparse
+import copy
+import itertools
+import random
+import time
+
+from lxml import etree
+
+from orthoxml.loaders import filter_by_score
+from orthoxml.models import ORTHO_NS
+
+SCORE_ID = "CompletenessScore"
+
+
+def legacy_filter_by_score(xml_tree, score_id, score_threshold, skip_no_scores=True, keep_low_score_parents=False, high_child_as_rhogs=False) -> None:
+    # filter_by_score as it was before the single-pass rewrite.
+    root = xml_tree.getroot()
+    groups_root = root.find('.//{{{0}}}groups'.format(ORTHO_NS))
+    if groups_root is None:
+        raise ValueError("No groups found in the XML tree.")
+    to_rem = []
+    to_append = []
+    for hog in root.iterfind('.//{{{0}}}orthologGroup'.format(ORTHO_NS)):
+        score = hog.find('./{{{0}}}score'.format(ORTHO_NS))
+        if score is None:
+            if skip_no_scores:
+                continue
+            else:
+                to_rem.append(hog)
+                continue
+        score_value = float(score.get('value'))
+        if score.get('id') == score_id and score_value < score_threshold:
+            to_rem.append(hog)
+        if keep_low_score_parents and score.get('id') == score_id and score_value >= score_threshold:
+            for parent in hog.iterancestors():
+                if parent.tag == "{{{0}}}orthologGroup".format(ORTHO_NS):
+                    if parent in to_rem:
+                        to_rem.remove(parent)
+
+        if high_child_as_rhogs and score.get('id') == score_id and score_value >= score_threshold:
+            for parent in hog.iterancestors():
+                if parent in to_rem:
+                    to_append.append(hog)
+                    break
+
+    for h in to_append:
+        groups_root.append(h)
+
+    for h in to_rem:
+        parent = h.getparent()
+        if parent is not None:
+            parent.remove(h)
+            if sum(c.tag == "{{{0}}}orthologGroup".format(ORTHO_NS) for c in parent) + sum(c.tag == "{{{0}}}paralogGroup".format(ORTHO_NS) for c in parent) == 0 and parent.tag != "{{{0}}}groups".format(ORTHO_NS):
+                to_rem.append(parent)
+
+
+def synthetic_tree(depth: int, width: int, roots: int, seed: int = 0) -> etree._ElementTree:
+    """
+    Build a document whose rootHOGs are chains of `depth` nested orthologGroups, each also
+    holding a paralogGroup of `width` small orthologGroups.
+    """
+    rng = random.Random(seed)
+    root = etree.Element(f"{{{ORTHO_NS}}}orthoXML", nsmap={None: ORTHO_NS})
+    groups = etree.SubElement(root, f"{{{ORTHO_NS}}}groups")
+    gene = itertools.count()
+    hog = itertools.count()
+
+    def add_hog(parent):
+        el = etree.SubElement(parent, f"{{{ORTHO_NS}}}orthologGroup", id=f"HOG_{next(hog)}")
+        r = rng.random()
+        if r < 0.9:
+            score_id = SCORE_ID if r < 0.85 else "OtherScore"
+            etree.SubElement(el, f"{{{ORTHO_NS}}}score", id=score_id, value=f"{rng.random():.3f}")
+        for _ in range(rng.randint(0, 2)):
+            etree.SubElement(el, f"{{{ORTHO_NS}}}geneRef", id=str(next(gene)))
+        return el
+
+    for _ in range(roots):
+        node = add_hog(groups)
+        for _ in range(depth):
+            paralog = etree.SubElement(node, f"{{{ORTHO_NS}}}paralogGroup")
+            for _ in range(rng.randint(1, width)):
+                add_hog(paralog)
+            node = add_hog(node)
+    return etree.ElementTree(root)
+
+
+def run(func, tree, **kwargs):
+    tree = copy.deepcopy(tree)
+    start = time.perf_counter()
+    func(tree, SCORE_ID, 0.5, **kwargs)
+    return time.perf_counter() - start, etree.tostring(tree)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=400)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--roots", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tree = synthetic_tree(args.depth, args.width, args.roots, args.seed)
+    n_hogs = sum(1 for _ in tree.getroot().iter(f"{{{ORTHO_NS}}}orthologGroup"))
+    print(f"{n_hogs} orthologGroups, depth {args.depth}")
+
+    for skip_no_scores, keep_low, high_child in itertools.product([False, True], repeat=3):
+        kwargs = dict(skip_no_scores=skip_no_scores, keep_low_score_parents=keep_low, high_child_as_rhogs=high_child)
+        legacy_time, legacy_out = run(legacy_filter_by_score, tree, **kwargs)
+        new_time, new_out = run(filter_by_score, tree, **kwargs)
+        status = "identical" if legacy_out == new_out else "DIFFERENT"
+        print(f"skip={skip_no_scores!s:5} keep_low={keep_low!s:5} high_child={high_child!s:5}  "
+              f"legacy {legacy_time:8.3f}s  single-pass {new_time:7.3f}s  x{legacy_time / new_time:7.1f}  {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# _optional.py
+
+import importlib
+
+
+def import_optional(module_name: str, extra: str):
+    """
+    Import an optional dependency, with an installation hint if it is missing.
+
+    :param module_name: The module to import.
+    :param extra: The name of the orthoxml extra that installs it.
+
+    :return: The imported module.
+    :raises ImportError: If the module is not installed.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(
+            f"'{module_name}' is required for this feature. Install it with: pip install 'orthoxml[{extra}]'"
+        ) from e
@@ -0,0 +1,389 @@
+# cache.py
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import defaultdict
+from collections.abc import MutableSequence
+from typing import Union
+
+from .exceptions import OrthoXMLParsingError
+from .index import file_signature
+from .models import Gene, Species, Taxon, Score, OrthologGroup, ParalogGroup
+
+CACHE_SUFFIX = ".cache"
+CACHE_MAGIC = b"OXMLCACH"
+CACHE_FORMAT_VERSION = 1
+
+# Node kinds of the group arrays.
+KIND_ORTHOLOG = 0
+KIND_PARALOG = 1
+KIND_GENE = 2
+
+_ALIGNMENT = 8
+
+
+class StringTable:
+    """
+    Deduplicated table of strings, stored as UTF-8 bytes plus an offsets array. None is stored as -1.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self.offsets = array("q", [0])
+        self.data = bytearray()
+
+    def add(self, value: str) -> int:
+        if value is None:
+            return -1
+        i = self._index.get(value)
+        if i is None:
+            i = len(self._index)
+            self._index[value] = i
+            self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return i
+
+
+class _StringView:
+    # Read side of StringTable over the mapped arrays.
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, i):
+        if i < 0:
+            return None
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+def _flatten(tree) -> dict[str, array]:
+    strings = StringTable()
+    arrays = {}
+
+    # Genes, grouped by species (CSR offsets per species).
+    gene_id, gene_gene_id, gene_prot_id = array("i"), array("i"), array("i")
+    species_name, species_taxon_id, species_ncbi = array("i"), array("i"), array("i")
+    species_gene_offsets = array("q", [0])
+    for sp in tree.species:
+        species_name.append(strings.add(sp.name))
+        species_taxon_id.append(strings.add(sp.taxonId))
+        species_ncbi.append(strings.add(sp.NCBITaxId))
+        for gene in sp.genes:
+            gene_id.append(strings.add(gene._id))
+            gene_gene_id.append(strings.add(gene.geneId))
+            gene_prot_id.append(strings.add(gene.protId))
+        species_gene_offsets.append(len(gene_id))
+
+    # Taxonomy in preorder with parent pointers.
+    taxon_parent, taxon_id, taxon_name = array("i"), array("i"), array("i")
+    stack = [(tree.taxonomy, -1)] if tree.taxonomy is not None else []
+    while stack:
+        node, parent = stack.pop()
+        position = len(taxon_parent)
+        taxon_parent.append(parent)
+        taxon_id.append(strings.add(node.id))
+        taxon_name.append(strings.add(node.name))
+        stack.extend((child, position) for child in reversed(node.children))
+
+    # Group forest in preorder: ortholog children before paralog children, as in the models.
+    group_parent, group_kind, group_id, group_taxon_id = array("i"), array("i"), array("i"), array("i")
+    generef_offsets, generefs = array("q", [0]), array("i")
+    score_offsets, score_key, score_value = array("q", [0]), array("i"), array("d")
+    root_offsets = array("q")
+    for group in tree.groups:
+        root_offsets.append(len(group_parent))
+        stack = [(group, -1)]
+        while stack:
+            node, parent = stack.pop()
+            position = len(group_parent)
+            group_parent.append(parent)
+            if isinstance(node, Gene):
+                group_kind.append(KIND_GENE)
+                group_id.append(strings.add(node._id))
+                group_taxon_id.append(-1)
+            else:
+                group_kind.append(KIND_PARALOG if isinstance(node, ParalogGroup) else KIND_ORTHOLOG)
+                group_id.append(strings.add(node.id))
+                group_taxon_id.append(strings.add(node.taxonId))
+                generefs.extend(strings.add(gene) for gene in node.geneRefs)
+                for score in node.scores:
+                    score_key.append(strings.add(score.key))
+                    score_value.append(score.value)
+                children = node.orthologGroups + node.paralogGroups
+                stack.extend((child, position) for child in reversed(children))
+            generef_offsets.append(len(generefs))
+            score_offsets.append(len(score_key))
+    root_offsets.append(len(group_parent))
+
+    arrays.update(
+        gene_id=gene_id, gene_geneId=gene_gene_id, gene_protId=gene_prot_id,
+        species_name=species_name, species_taxonId=species_taxon_id, species_NCBITaxId=species_ncbi,
+        species_gene_offsets=species_gene_offsets,
+        taxon_parent=taxon_parent, taxon_id=taxon_id, taxon_name=taxon_name,
+        group_parent=group_parent, group_kind=group_kind, group_id=group_id, group_taxonId=group_taxon_id,
+        generef_offsets=generef_offsets, generefs=generefs,
+        score_offsets=score_offsets, score_key=score_key, score_value=score_value,
+        root_offsets=root_offsets,
+        string_offsets=strings.offsets, string_data=array("B", strings.data),
+    )
+    return arrays
+
+
+def write_cache(tree, path: str, source: str = None) -> None:
+    """
+    Write the genes, species, taxonomy and groups of an OrthoXMLTree to a binary columnar cache.
+
+    The file starts with a magic number and a JSON header describing every array (type code,
+    byte offset, length), followed by the raw 8-byte aligned arrays in native byte order.
+
+    :param tree: The OrthoXMLTree to cache.
+    :param path: Path of the cache file.
+    :param source: The OrthoXML file the tree was loaded from. Its size and modification time
+                   are recorded so stale caches can be detected.
+    """
+    arrays = _flatten(tree)
+
+    header = {
+        "format": CACHE_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "orthoxml_version": tree.orthoxml_version,
+        "source_signature": list(file_signature(source)) if source else None,
+        "arrays": {},
+    }
+    # Array offsets are relative to the 8-byte aligned end of the header.
+    offset = 0
+    for name, values in arrays.items():
+        header["arrays"][name] = [values.typecode, offset, len(values)]
+        offset += len(values) * values.itemsize
+        offset += -offset % _ALIGNMENT
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(CACHE_MAGIC) + 8 + len(header_bytes)
+    data_start += -data_start % _ALIGNMENT
+
+    with open(path, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, values in arrays.items():
+            f.write(values.tobytes())
+            f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+
+
+def _read_header(f) -> tuple[dict, int]:
+    if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+        raise OrthoXMLParsingError("Not an OrthoXML cache file")
+    (header_len,) = struct.unpack("<Q", f.read(8))
+    header = json.loads(f.read(header_len))
+    if header.get("format") != CACHE_FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+        raise OrthoXMLParsingError("Unsupported OrthoXML cache format")
+    data_start = len(CACHE_MAGIC) + 8 + header_len
+    data_start += -data_start % _ALIGNMENT
+    return header, data_start
+
+
+def cache_is_fresh(path: str, source: str) -> bool:
+    """
+    Check whether the cache at path exists and was written from the current version of source.
+    """
+    try:
+        with open(path, "rb") as f:
+            header, _ = _read_header(f)
+        return header["source_signature"] is not None and tuple(header["source_signature"]) == file_signature(source)
+    except (OSError, ValueError, OrthoXMLParsingError):
+        return False
+
+
+class CachedGroups(MutableSequence):
+    """
+    Sequence of the top-level groups stored in a cache file, usable as the list of groups of a tree.
+
+    The models of a rootHOG are only rebuilt from the mapped arrays when it is first accessed.
+    The first modification (assignment, deletion, insertion, append...) rebuilds all the remaining
+    rootHOGs, after which the groups behave as a plain list; concatenation with + returns a list.
+
+    The cache file stays mapped until close is called, directly or through OrthoXMLTree.close.
+    The rootHOGs not rebuilt by then can no longer be accessed.
+    """
+
+    def __init__(self, arrays: dict, strings: _StringView, mapped: mmap.mmap = None, views: list = ()):
+        self._arrays = arrays
+        self._strings = strings
+        self._mapped = mapped
+        self._views = list(views)
+        self._built = [None] * (len(arrays["root_offsets"]) - 1)
+        self._materialized = False
+
+    def __len__(self):
+        return len(self._built)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        group = self._built[i]
+        if group is None and not self._materialized:
+            group = self._built[i] = self._build(i if i >= 0 else len(self) + i)
+        return group
+
+    def _materialize(self) -> None:
+        # Rebuild every rootHOG, so that positions no longer refer to the cache
+        if not self._materialized:
+            for i in range(len(self)):
+                self[i]
+            self._materialized = True
+
+    def __setitem__(self, i, value):
+        self._materialize()
+        self._built[i] = value
+
+    def __delitem__(self, i):
+        self._materialize()
+        del self._built[i]
+
+    def insert(self, i, value):
+        self._materialize()
+        self._built.insert(i, value)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, CachedGroups)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def copy(self) -> list:
+        return list(self)
+
+    def __repr__(self):
+        return f"CachedGroups({len(self)} groups)"
+
+    @property
+    def closed(self) -> bool:
+        return self._mapped is None
+
+    def close(self) -> None:
+        """Release the mapping of the cache file. The rootHOGs already rebuilt stay available."""
+        if self._mapped is None:
+            return
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._arrays = self._strings = None
+        self._mapped.close()
+        self._mapped = None
+
+    def _build(self, i: int) -> Union[OrthologGroup, ParalogGroup, Gene]:
+        if self._mapped is None:
+            raise ValueError("The OrthoXML cache was closed before this rootHOG was accessed")
+        a = self._arrays
+        strings = self._strings
+        start, end = a["root_offsets"][i], a["root_offsets"][i + 1]
+        nodes = []
+        for n in range(start, end):
+            kind = a["group_kind"][n]
+            if kind == KIND_GENE:
+                node = Gene(strings[a["group_id"][n]], None, None)
+            else:
+                cls = ParalogGroup if kind == KIND_PARALOG else OrthologGroup
+                node = cls(
+                    id=strings[a["group_id"][n]],
+                    taxonId=strings[a["group_taxonId"][n]],
+                    scores=[
+                        Score(strings[a["score_key"][s]], a["score_value"][s])
+                        for s in range(a["score_offsets"][n], a["score_offsets"][n + 1])
+                    ],
+                    geneRefs=[
+                        strings[a["generefs"][g]]
+                        for g in range(a["generef_offsets"][n], a["generef_offsets"][n + 1])
+                    ],
+                )
+                parent = a["group_parent"][n]
+                if parent >= 0:
+                    parent_node = nodes[parent - start]
+                    if kind == KIND_PARALOG:
+                        parent_node.paralogGroups.append(node)
+                    else:
+                        parent_node.orthologGroups.append(node)
+            nodes.append(node)
+        return nodes[0]
+
+
+def read_cache(path: str, source: str = None):
+    """
+    Memory-map a cache file written by write_cache.
+
+    Genes, species and taxonomy are rebuilt right away, the groups are rebuilt lazily. The file
+    stays mapped until the close method of the returned groups is called.
+
+    :param path: Path of the cache file.
+    :param source: If given, the OrthoXML file the cache must be fresh for.
+
+    :return: A tuple of genes, species_list, taxonomy, groups and the OrthoXML version.
+    :raises OrthoXMLParsingError: If the file is not a valid cache or is stale for source.
+    """
+    try:
+        f = open(path, "rb")
+    except OSError as e:
+        raise OrthoXMLParsingError(f"Failed to open OrthoXML cache '{path}': {e}")
+    with f:
+        header, data_start = _read_header(f)
+        if source is not None and (header["source_signature"] is None or tuple(header["source_signature"]) != file_signature(source)):
+            raise OrthoXMLParsingError(f"OrthoXML cache '{path}' is stale for {source}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+    arrays = {}
+    for name, (typecode, offset, length) in header["arrays"].items():
+        start = data_start + offset
+        with view[start:start + length * array(typecode).itemsize] as section:
+            arrays[name] = section.cast(typecode)
+    strings = _StringView(arrays["string_offsets"], arrays["string_data"])
+
+    species_list = []
+    genes = defaultdict(Gene)
+    offsets = arrays["species_gene_offsets"]
+    for s in range(len(arrays["species_name"])):
+        species_genes = []
+        for g in range(offsets[s], offsets[s + 1]):
+            gene = Gene(strings[arrays["gene_id"][g]], strings[arrays["gene_geneId"][g]], strings[arrays["gene_protId"][g]])
+            species_genes.append(gene)
+            genes[gene._id] = gene
+        species_list.append(Species(
+            strings[arrays["species_name"][s]],
+            strings[arrays["species_taxonId"][s]],
+            strings[arrays["species_NCBITaxId"][s]],
+            species_genes
+        ))
+
+    taxonomy = None
+    taxa = []
+    for t in range(len(arrays["taxon_parent"])):
+        taxon = Taxon(strings[arrays["taxon_id"][t]], strings[arrays["taxon_name"][t]])
+        parent = arrays["taxon_parent"][t]
+        if parent >= 0:
+            taxa[parent].children.append(taxon)
+        else:
+            taxonomy = taxon
+        taxa.append(taxon)
+
+    groups = CachedGroups(arrays, strings, mapped, views=list(arrays.values()) + [view])
+    return genes, species_list, taxonomy, groups, header["orthoxml_version"]
+
+
+def cache_path(filepath: str) -> str:
+    """Path of the cache sitting next to an OrthoXML file."""
+    return filepath + CACHE_SUFFIX
+
+
+def has_fresh_cache(filepath: str) -> bool:
+    """Check whether a fresh cache sits next to an OrthoXML file."""
+    return os.path.exists(cache_path(filepath)) and cache_is_fresh(cache_path(filepath), filepath)
@@ -4,14 +4,46 @@ import argparse
 import sys
 from orthoxml import OrthoXMLTree
 from orthoxml import __version__
+from orthoxml.index import RootHOGIndex
+from orthoxml.cache import cache_path, has_fresh_cache
+from orthoxml.writers import PAIR_FORMATS
+from orthoxml.loaders import validate_orthoxml_file
 
-def load_tree(filepath, validate, score_id=None, score_threshold=None, filter_strategy=None):
+def validate_file(filepath, jobs=1):
+    """Validate the file in a streaming pass, reporting all the errors, and exit if it is not valid."""
+    try:
+        errors = validate_orthoxml_file(filepath, jobs=jobs)
+    except Exception as e:
+        print(f"Error loading file: {e}")
+        sys.exit(1)
+    if errors:
+        print(f"{filepath} is not valid ({len(errors)} errors):")
+        for error in errors:
+            location = f"line {error.line}" if error.offset is None else f"line {error.line}, offset {error.offset}"
+            print(f"  {location}: {error.message}")
+        sys.exit(1)
+
+def load_cache(filepath):
+    """Load the tree from the fresh cache next to the file, telling the user on stderr."""
+    path = cache_path(filepath)
+    print(f"Loading {filepath} from its cache {path} (use --no-cache to parse the file)", file=sys.stderr)
+    return OrthoXMLTree.load_cache(path, source=filepath)
+
+def load_tree(filepath, validate, score_id=None, score_threshold=None, filter_strategy=None, jobs=1, use_cache=True):
     """Load OrthoXML tree from file without applying any completeness filter."""
+    if validate:
+        # Validate once in bounded memory, then load as usual (the cache may then be used)
+        validate_file(filepath, jobs)
+        validate = False
     try:
         if score_id and not all([score_id, score_threshold, filter_strategy]):
             raise ValueError("If score_id is provided, score_threshold and filter_strategy must also be provided.")
         if score_id and score_threshold and filter_strategy:
-            if filter_strategy == "bottomup":
+            if filter_strategy in ("bottomup", "topdown") and use_cache and not validate and has_fresh_cache(filepath):
+                # Filter the cached groups instead of parsing the file again
+                with load_cache(filepath) as cached:
+                    tree = cached.filter_by_score(score_id, score_threshold, strategy=filter_strategy)
+            elif filter_strategy == "bottomup":
                 tree = OrthoXMLTree.from_file(filepath,
                                               validate=validate,
                                               score_id=score_id,
@@ -27,6 +59,9 @@ def load_tree(filepath, validate, score_id=None, score_threshold=None, filter_st
                                           keep_low_score_parents=False)
             else:
                 raise ValueError("Invalid filter strategy. Use 'bottomup' or 'topdown'.")
+        elif use_cache and not validate and has_fresh_cache(filepath):
+            # A cache written from the current version of the file sits next to it
+            tree = load_cache(filepath)
         else:
             tree = OrthoXMLTree.from_file(filepath,
                                           validate=validate)
@@ -36,7 +71,7 @@ def load_tree(filepath, validate, score_id=None, score_threshold=None, filter_st
         sys.exit(1)
 
 def handle_stats(args):
-    tree = load_tree(args.file, args.validate)
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
     base_stats = tree.base_stats()
     gene_stats = tree.gene_stats()
     print("Base Stats:")
@@ -51,37 +86,98 @@ def handle_stats(args):
             for key, value in base_stats.items():
                 f.write(f"{key},{value}\n")
         print(f"\nStats written to {args.outfile}")
+    if args.level_stats:
+        tree.level_stats(score_id=args.score_name, filepath=args.level_stats)
+        print(f"\nPer-level HOG stats written to {args.level_stats}")
 
 def handle_taxonomy(args):
-    tree = load_tree(args.file, args.validate)
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
     print("Taxonomy Tree:")
     print(tree.taxonomy.to_str())
 
 def handle_export(args):
-    tree = load_tree(args.file, args.validate)
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
     if args.type == "pairs":
-        pairs = tree.to_ortho_pairs(filepath=args.outfile if args.outfile else None)
+        if args.by_species:
+            paths = tree.to_ortho_pairs_by_species(args.by_species, max_open_files=args.max_open_files)
+            print(f"Pairs written to {len(paths)} species pair files in {args.by_species}")
+            return
+        if args.outfile and args.workers > 1:
+            # Workers write their pairs straight to disk
+            shard_paths = tree.to_ortho_pairs_iter(filepath=args.outfile, workers=args.workers, shards=args.shards,
+                                                   format=args.format)
+            if shard_paths:
+                print(f"Pairs written to {len(shard_paths)} shards: {', '.join(shard_paths)}")
+            else:
+                print(f"Pairs written to {args.outfile}")
+            return
+        pairs = tree.to_ortho_pairs(filepath=args.outfile if args.outfile else None, workers=args.workers,
+                                    format=args.format)
         for pair in pairs:
             print(pair)
     elif args.type == "groups":
-        groups = tree.to_ogs(filepath=args.outfile if args.outfile else None)
+        groups = tree.to_ogs(filepath=args.outfile if args.outfile else None, workers=args.workers)
         for group in groups:
             print(group)
     else:
         print("Unknown export type specified.")
 
 def handle_split(args):
-    tree = load_tree(args.file, args.validate)
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
+    if args.outdir:
+        try:
+            manifest = tree.split_to_directory(args.outdir, batch_size=args.batch_size, workers=args.workers, suffix=args.suffix,
+                                              prune_taxonomy=args.prune_taxonomy)
+        except Exception as e:
+            print(f"Error splitting tree: {e}")
+            sys.exit(1)
+        print(f"rootHOG files written to {args.outdir}, listed in {manifest}")
+        return
     trees = tree.split_by_rootHOGs()
     print(f"Split into {len(trees)} trees based on rootHOGs.")
     for idx, t in enumerate(trees):
         print(f"\nTree {idx + 1}:")
         print(t.groups)
 
+def handle_index(args):
+    try:
+        index = RootHOGIndex.build(args.file)
+        path = index.save(args.outfile)
+    except Exception as e:
+        print(f"Error indexing file: {e}")
+        sys.exit(1)
+    print(f"Indexed {len(index)} rootHOGs into {path}")
+
+def handle_cache(args):
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
+    path = cache_path(args.file)
+    try:
+        tree.save_cache(path, source=args.file)
+    except Exception as e:
+        print(f"Error writing cache: {e}")
+        sys.exit(1)
+    print(f"Cache written to {path}")
+
 def handle_filter(args):
 
+    if args.outfile:
+        # Filter and write one rootHOG at a time, in bounded memory
+        if args.validate:
+            validate_file(args.file, args.jobs)
+        try:
+            OrthoXMLTree.filter_file(args.file, args.outfile,
+                                     score_id=args.score_name,
+                                     score_threshold=args.threshold,
+                                     high_child_as_rhogs=args.strategy == "bottomup",
+                                     keep_low_score_parents=False)
+            print(f"Filtered file written to {args.outfile}")
+        except Exception as e:
+            print(f"Error filtering tree: {e}")
+            sys.exit(1)
+        return
+
     try:
-        tree = load_tree(args.file, args.validate,
+        tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache,
                          score_id=args.score_name,
                          score_threshold=args.threshold,
                          filter_strategy=args.strategy)
@@ -90,19 +186,30 @@ def handle_filter(args):
         print(f"Error filtering tree: {e}")
         sys.exit(1)
 
+    try:
+        print(tree.to_orthoxml())
+    except Exception as e:
+        print(f"Error serializing filtered tree to string: {e}")
+        sys.exit(1)
+
+def handle_sweep(args):
+    tree = load_tree(args.file, args.validate, jobs=args.jobs, use_cache=not args.no_cache)
+    try:
+        counts = tree.sweep_thresholds(args.score_name, args.thresholds,
+                                       strategy=args.strategy,
+                                       output_pattern=args.output_pattern)
+    except Exception as e:
+        print(f"Error sweeping thresholds: {e}")
+        sys.exit(1)
+
+    lines = ["threshold,rootHOGs,genes,pairs"]
+    lines.extend(f"{row['threshold']},{row['rootHOGs']},{row['genes']},{row['pairs']}" for row in counts)
     if args.outfile:
-        try:
-            tree.to_orthoxml(args.outfile)
-            print(f"Filtered file written to {args.outfile}")
-        except Exception as e:
-            print(f"Error writing filtered tree: {e}")
-            sys.exit(1)
+        with open(args.outfile, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Sweep written to {args.outfile}")
     else:
-        try:
-            print(tree.to_orthoxml(args.outfile))
-        except Exception as e:
-            print(f"Error serializing filtered tree to string: {e}")
-            sys.exit(1)
+        print("\n".join(lines))
 
 def main():
     parser = argparse.ArgumentParser(
@@ -112,6 +219,10 @@ def main():
                         version=f"%(prog)s {__version__}")
     parser.add_argument("--validate", action="store_true",
                         help="Validate the OrthoXML file")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="With --validate, number of processes validating the rootHOGs in parallel")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse the file even if a fresh cache written by the cache subcommand sits next to it")
 
     # Global argument for the file path
     parser.add_argument("file", help="Path to the OrthoXML file")
@@ -122,6 +233,9 @@ def main():
     # Stats subcommand
     stats_parser = subparsers.add_parser("stats", help="Show statistics of the OrthoXML tree")
     stats_parser.add_argument("--outfile", help="Output file to write stats")
+    stats_parser.add_argument("--level-stats", help="Write the HOG statistics of every taxonomic level to this TSV file")
+    stats_parser.add_argument("--score-name", default="CompletenessScore",
+                              help="With --level-stats, name of the score to summarize (default: CompletenessScore)")
     stats_parser.set_defaults(func=handle_stats)
 
     # Taxonomy subcommand
@@ -132,12 +246,40 @@ def main():
     export_parser = subparsers.add_parser("export", help="Export orthologous pairs or groups")
     export_parser.add_argument("type", choices=["pairs", "groups"], help="Type of export")
     export_parser.add_argument("--outfile", help="Output file to write the export")
+    export_parser.add_argument("--workers", type=int, default=1,
+                               help="Number of processes to split the rootHOGs across (pairs and groups)")
+    export_parser.add_argument("--shards", action="store_true",
+                               help="With --workers and --outfile, keep one output file per worker (<outfile>.<i>)")
+    export_parser.add_argument("--by-species", metavar="DIR",
+                               help="Write one file of pairs per pair of species into this directory (pairs only)")
+    export_parser.add_argument("--max-open-files", type=int, default=256,
+                               help="With --by-species, maximum number of output files open at once")
+    export_parser.add_argument("--format", choices=list(PAIR_FORMATS),
+                               help="Format of the pairs written to --outfile (default: from its extension, "
+                                    ".gz, .zst, .bin or .parquet, else csv)")
     export_parser.set_defaults(func=handle_export)
 
     # Split subcommand
     split_parser = subparsers.add_parser("split", help="Split the tree by rootHOGs")
+    split_parser.add_argument("--outdir", help="Write each batch of rootHOGs as its own OrthoXML file in this directory, "
+                                               "with a manifest.tsv listing the files, instead of printing them")
+    split_parser.add_argument("--batch-size", type=int, default=1, help="With --outdir, number of rootHOGs per file (default: 1)")
+    split_parser.add_argument("--workers", type=int, default=1, help="With --outdir, number of processes writing the files")
+    split_parser.add_argument("--suffix", default=".orthoxml",
+                              help="With --outdir, suffix of the file names, e.g. .orthoxml.gz to compress them (default: .orthoxml)")
+    split_parser.add_argument("--prune-taxonomy", action="store_true",
+                              help="With --outdir, only keep the taxa of the species and levels of the rootHOGs of each file")
     split_parser.set_defaults(func=handle_split)
 
+    # Index subcommand
+    index_parser = subparsers.add_parser("index", help="Build the byte-offset index of the rootHOGs")
+    index_parser.add_argument("--outfile", help="Path of the index file (default: <file>.idx)")
+    index_parser.set_defaults(func=handle_index)
+
+    # Cache subcommand
+    cache_parser = subparsers.add_parser("cache", help="Write a binary cache next to the file, used automatically by later commands")
+    cache_parser.set_defaults(func=handle_cache)
+
     # Filter subcommand
     filter_parser = subparsers.add_parser("filter", help="Filter the OrthoXML tree by a completeness score")
     filter_parser.add_argument(
@@ -159,10 +301,38 @@ def main():
     )
     filter_parser.add_argument(
         "--outfile",
-        help="If provided, write the filtered OrthoXML to this file; otherwise, print to stdout"
+        help="If provided, write the filtered OrthoXML to this file (compressed if it ends in .gz, .bz2, .xz or .zst) "
+             "one rootHOG at a time; otherwise, print to stdout"
 )
     filter_parser.set_defaults(func=handle_filter)
 
+    # Sweep subcommand
+    sweep_parser = subparsers.add_parser("sweep", help="Count the retained rootHOGs, genes and pairs at several score thresholds")
+    sweep_parser.add_argument(
+        "--score-name",
+        required=True,
+        help="Name of the completeness score annotation (e.g. 'CompletenessScore')"
+    )
+    sweep_parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        required=True,
+        help="Threshold values to evaluate"
+    )
+    sweep_parser.add_argument(
+        "--strategy",
+        choices=["bottomup", "topdown"],
+        default="topdown",
+        help="Filtering strategy (bottomup or topdown)"
+    )
+    sweep_parser.add_argument("--outfile", help="Output file to write the counts as CSV")
+    sweep_parser.add_argument(
+        "--output-pattern",
+        help="Also write the filtered OrthoXML of every threshold, e.g. 'filtered_{threshold}.orthoxml'"
+    )
+    sweep_parser.set_defaults(func=handle_sweep)
+
     args = parser.parse_args()
     args.func(args)
 
@@ -0,0 +1,126 @@
+# compression.py
+
+import bz2
+import gzip
+import importlib
+import io
+import lzma
+import os
+
+from ._optional import import_optional
+
+# Leading bytes of the supported compressed formats.
+MAGIC_BYTES = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+# Compression of an output file, from its extension.
+OUTPUT_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+
+
+def detect_compression(filepath: str) -> str:
+    """
+    Detect the compression of a file from its first bytes, whatever its extension.
+
+    :param filepath: Path to the file.
+    :return: "gzip", "bz2", "xz", "zstd", or None for an uncompressed file.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(6)
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _open_gzip(filepath: str):
+    # python-isal decompresses several times faster than zlib, and its threaded reader
+    # decompresses in a background thread while the parser consumes the previous block.
+    try:
+        igzip_threaded = importlib.import_module("isal.igzip_threaded")
+    except ImportError:
+        return gzip.open(filepath, "rb")
+    return igzip_threaded.open(filepath, "rb", threads=1)
+
+
+def open_input(filepath: str):
+    """
+    Open a possibly compressed file for reading its decompressed bytes.
+
+    gzip, bz2 and xz are read with the standard library (gzip with python-isal when it is
+    installed, see the "isal" extra), zstd requires the "zstd" extra.
+
+    :param filepath: Path to the file.
+    :return: A binary file-like object.
+    """
+    compression = detect_compression(filepath)
+    if compression == "gzip":
+        return _open_gzip(filepath)
+    if compression == "bz2":
+        return bz2.open(filepath, "rb")
+    if compression == "xz":
+        return lzma.open(filepath, "rb")
+    if compression == "zstd":
+        zstandard = import_optional("zstandard", "zstd")
+        return zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb"), closefd=True)
+    return open(filepath, "rb")
+
+
+def skip_to(stream, position: int, offset: int) -> int:
+    """
+    Move a stream from position forward to offset, by seeking if it is an uncompressed file
+    and by reading and dropping the bytes in between otherwise.
+
+    :return: The new position.
+    """
+    if isinstance(stream, (io.BufferedReader, io.FileIO)):
+        stream.seek(offset)
+        return offset
+    if offset < position:
+        raise ValueError("Decompressed streams can only be read forward")
+    while position < offset:
+        skipped = len(stream.read(min(offset - position, 1 << 20)))
+        if not skipped:
+            break
+        position += skipped
+    return position
+
+
+def output_compression(filepath: str, compression: str = None) -> str:
+    """
+    The compression of an output file: compression if given, otherwise guessed from the
+    extension of filepath (.gz, .bz2, .xz, .zst), None for an uncompressed file.
+
+    :raises ValueError: If compression is not one of the supported formats.
+    """
+    if compression is None:
+        return OUTPUT_EXTENSIONS.get(os.path.splitext(filepath)[1])
+    if compression not in MAGIC_BYTES.values():
+        raise ValueError(f"Unknown compression '{compression}'. Use one of: {', '.join(MAGIC_BYTES.values())}")
+    return compression
+
+
+def open_output(filepath: str, compression: str = None):
+    """
+    Open a file for writing bytes, compressed according to output_compression.
+    zstd requires the "zstd" extra.
+
+    :param filepath: Path to the file.
+    :param compression: "gzip", "bz2", "xz" or "zstd", guessed from the extension if None.
+    :return: A binary file-like object.
+    """
+    compression = output_compression(filepath, compression)
+    if compression == "gzip":
+        # level 6 compresses almost as well as 9 at a fraction of the time
+        return gzip.open(filepath, "wb", compresslevel=6)
+    if compression == "bz2":
+        return bz2.open(filepath, "wb")
+    if compression == "xz":
+        return lzma.open(filepath, "wb")
+    if compression == "zstd":
+        zstandard = import_optional("zstandard", "zstd")
+        return zstandard.ZstdCompressor().stream_writer(open(filepath, "wb"))
+    return open(filepath, "wb")
@@ -2,3 +2,15 @@
 
 class OrthoXMLParsingError(Exception):
     pass
+
+
+class OrthoXMLValidationError(OrthoXMLParsingError):
+    """
+    An OrthoXML document does not conform to its schema.
+
+    :param errors: All the schema errors as (line, message).
+    """
+
+    def __init__(self, message: str, errors: list[tuple[int, str]] = None):
+        super().__init__(message)
+        self.errors = errors or []
@@ -1,7 +1,12 @@
 # exporters.py
 
+from collections import Counter, defaultdict
+
 from .models import OrthologGroup, ParalogGroup, UnionFind, Taxon, Species
 from .logger import logger
+from ._optional import import_optional
+from .writers import open_pair_writer, write_orthoxml
+from .taxonomy import TaxonomyIndex
 
 def get_ortho_pairs_iterative(root):
     """
@@ -183,96 +188,349 @@ def get_paralog_pairs_recursive(node: OrthologGroup) -> tuple[list[str], list[(s
     return gene_refs, pairs
 
 
-def get_maximal_og(group: OrthologGroup, species_dic: dict[str, str]) -> list[str]:
+def ortho_pairs_of_groups(groups: list[OrthologGroup]) -> list[list[(str, str)]]:
+    """
+    Compute the ortholog pairs of every rootHOG of a batch. Used as a process pool task.
+
+    :param groups: A batch of rootHOGs.
+
+    :return: A list with the ortholog pairs of each rootHOG, in the order of groups.
+    """
+    return [get_ortho_pairs_recursive(group)[1] for group in groups]
+
+
+def write_ortho_pairs_of_groups(task: tuple[list[OrthologGroup], str, str, str]) -> int:
+    """
+    Write the ortholog pairs of a batch of rootHOGs to a file. Used as a process pool task.
+
+    :param task: A tuple of (groups, filepath, sep, format), format being one of writers.PAIR_FORMATS.
+
+    :return: The number of pairs written.
+    """
+    groups, filepath, sep, format = task
+    with open_pair_writer(filepath, format, sep) as writer:
+        for group in groups:
+            writer.write_pairs(get_ortho_pairs_iterative(group))
+    return writer.count
+
+
+def gene_species_map(species_list: list[Species]) -> dict[str, tuple[int, int]]:
+    """
+    Map every gene id to its species, as (position of the species in species_list, position of
+    the gene in species.genes), so the species of a set of genes is found without scanning them.
+    """
+    return {gene._id: (i, j) for i, species in enumerate(species_list) for j, gene in enumerate(species.genes)}
+
+
+def species_subset(species_list: list[Species], gene_ids, gene_species: dict[str, tuple[int, int]]) -> list[Species]:
+    """
+    The species having some of the given genes, each one reduced to these genes. The species and
+    their genes keep their original order. Genes without a species are ignored.
+
+    :param species_list: All the species.
+    :param gene_ids: The gene ids to keep.
+    :param gene_species: The gene_species_map of species_list.
+    """
+    positions = defaultdict(set)
+    for gene_id in gene_ids:
+        location = gene_species.get(gene_id)
+        if location is not None:
+            positions[location[0]].add(location[1])
+
+    subset = []
+    for i in sorted(positions):
+        species = species_list[i]
+        subset.append(Species(
+            name=species.name,
+            genes=[species.genes[j] for j in sorted(positions[i])],
+            taxonId=species.taxonId,
+            NCBITaxId=species.NCBITaxId
+        ))
+    return subset
+
+
+# Header of the file being split, set in every split worker by init_split_worker.
+_split_context = {}
+
+
+def init_split_worker(species_list: list[Species], taxonomy: Taxon, orthoxml_version: str, prune_taxonomy: bool = False) -> None:
+    """
+    Initialize a write_root_hog_shard worker with the header of the file being split.
+    With prune_taxonomy, the taxonomy of every file is pruned to its rootHOGs.
+    """
+    _split_context["species"] = species_list
+    _split_context["gene_species"] = gene_species_map(species_list)
+    _split_context["taxonomy"] = taxonomy
+    _split_context["taxonomy_index"] = TaxonomyIndex(taxonomy) if prune_taxonomy else None
+    _split_context["orthoxml_version"] = orthoxml_version
+
+
+def clear_split_worker() -> None:
+    """Release the header set by init_split_worker, when the shards were written in-process."""
+    _split_context.clear()
+
+
+def write_root_hog_shard(task: tuple[list[OrthologGroup], str]) -> tuple[str, list[str], int, int]:
+    """
+    Write a batch of rootHOGs as an OrthoXML file holding only their genes and species, in a
+    worker initialized by init_split_worker. Used as a process pool task.
+
+    :param task: A tuple of (groups, filepath), the file being compressed according to its extension.
+
+    :return: The filepath, the ids of the rootHOGs, and the numbers of genes and species written.
+    """
+    groups, filepath = task
+    gene_ids = set()
+    for group in groups:
+        gene_ids.update(group.get_all_leaves())
+    species = species_subset(_split_context["species"], gene_ids, _split_context["gene_species"])
+    taxonomy_index = _split_context["taxonomy_index"]
+    taxonomy = taxonomy_index.prune(species, groups) if taxonomy_index is not None else _split_context["taxonomy"]
+    write_orthoxml(filepath, species, taxonomy, groups,
+                   orthoxml_version=_split_context["orthoxml_version"])
+    return filepath, [group.id for group in groups], sum(len(sp.genes) for sp in species), len(species)
+
+
+def get_pairs_array(groups: list, gene_index: dict[str, int], paralogs: bool = False):
+    """
+    Compute the ortholog (or paralog) pairs of the given groups as an (N, 2) int32 NumPy array
+    of gene indices, in the same order as get_ortho_pairs_recursive (get_paralog_pairs_recursive).
+
+    The leaves of every subtree are kept as int32 arrays and the pairs between child branches
+    are emitted as whole cross products with np.repeat/np.tile instead of Python tuples.
+
+    :param groups: The OrthologGroup/ParalogGroup roots to process. Other items are skipped.
+    :param gene_index: Mapping of geneRef ids to dense indices. GeneRefs missing from it are
+                       appended to it with the next free index.
+    :param paralogs: If True, return paralog pairs (LCA is a ParalogGroup) instead of ortholog pairs.
+
+    :return: The (N, 2) int32 array of gene index pairs.
+    """
+    np = import_optional("numpy", "numpy")
+    chunks = []
+
+    def cross(a, b):
+        if len(a) and len(b):
+            chunks.append(np.column_stack((np.repeat(a, len(b)), np.tile(b, len(a)))))
+
+    def subtree_leaves(node):
+        own = np.fromiter(
+            (gene_index.setdefault(gene, len(gene_index)) for gene in node.geneRefs),
+            dtype=np.int32, count=len(node.geneRefs)
+        )
+        child_leaves = [subtree_leaves(child) for child in node.orthologGroups + node.paralogGroups]
+
+        if isinstance(node, ParalogGroup) == paralogs:
+            # Own geneRefs against each child branch.
+            for leaves in child_leaves:
+                cross(own, leaves)
+            # Pairs of different child branches.
+            for i in range(len(child_leaves)):
+                for j in range(i + 1, len(child_leaves)):
+                    cross(child_leaves[i], child_leaves[j])
+            # Own geneRefs with each other.
+            if len(own) > 1:
+                first, second = np.triu_indices(len(own), k=1)
+                chunks.append(np.column_stack((own[first], own[second])))
+
+        return np.concatenate([own] + child_leaves)
+
+    for group in groups:
+        if isinstance(group, (OrthologGroup, ParalogGroup)):
+            subtree_leaves(group)
+
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int32)
+    return np.concatenate(chunks).astype(np.int32, copy=False)
+
+
+def _species_key(name):
+    # Sort key of species names, unknown species (None) last.
+    return (name is None, name or "")
+
+
+def species_pair_counts(species: Counter, branches: list[Counter]) -> Counter:
+    """
+    Count the pairs of genes from different branches of a group per pair of species, from the
+    species of its leaves: S_x S_y - Σ_b s_bx s_by pairs of species x, y, halved for x == y.
+
+    :param species: The number of leaves of each species under the group.
+    :param branches: The same for every branch, each own geneRef being a branch of its own.
+
+    :return: The non-zero counts per (species, species) tuple, the two species in sorted order.
+    """
+    species_pairs = Counter()
+    for counter, sign in [(species, 1)] + [(branch, -1) for branch in branches]:
+        names = sorted(counter, key=_species_key)
+        for i, x in enumerate(names):
+            for y in names[i:]:
+                species_pairs[x, y] += sign * counter[x] * counter[y]
+    counts = Counter()
+    for (x, y), n in species_pairs.items():
+        n = n // 2 if x == y else n
+        if n:
+            counts[x, y] += n
+    return counts
+
+
+def count_pairs(node, paralogs: bool = False, by: str = None, gene_species: dict[str, str] = None):
+    """
+    Count the ortholog (or paralog) pairs of a group without enumerating them, in a single
+    traversal. Pairs are formed at a group between its own geneRefs and child branches: with L
+    leaves, g own geneRefs and child branches of c_i leaves, a group forms (L² - Σc_i² - g) / 2 pairs.
+
+    :param node: The OrthologGroup/ParalogGroup to count the pairs of.
+    :param paralogs: If True, count paralog pairs (LCA is a ParalogGroup) instead of ortholog pairs.
+    :param by: None for the total, "taxon" for a breakdown by taxonId of the LCA group,
+               "species" for a breakdown by species pair.
+    :param gene_species: Mapping of geneRef ids to species names, required with by="species".
+                         GeneRefs missing from it are counted under None.
+
+    :return: The number of pairs, or with by a Counter of pairs per taxonId or per
+             (species, species) tuple, the two species in sorted order.
+    """
+    counts = Counter()
+
+    def visit(node):
+        own = len(node.geneRefs)
+        leaves, squares = own, 0
+        species = Counter(gene_species.get(gene) for gene in node.geneRefs) if by == "species" else None
+        branches = [Counter([gene_species.get(gene)]) for gene in node.geneRefs] if species is not None else None
+
+        for child in node.orthologGroups + node.paralogGroups:
+            child_leaves, child_species = visit(child)
+            leaves += child_leaves
+            squares += child_leaves ** 2
+            if species is not None:
+                species.update(child_species)
+                branches.append(child_species)
+
+        if isinstance(node, ParalogGroup) == paralogs:
+            if by == "species":
+                counts.update(species_pair_counts(species, branches))
+            else:
+                counts[node.taxonId if by == "taxon" else None] += (leaves ** 2 - squares - own) // 2
+        return leaves, species
+
+    visit(node)
+    if by is None:
+        return counts[None]
+    return counts
+
+
+def get_maximal_og(group: OrthologGroup, species_dic: dict[str, str], species_bits: dict[str, int] = None) -> list[str]:
     """
     Given a tree of OrthologGroup (and ParalogGroup) nodes, process any duplication events by
     keeping only the branch (child group) that has the largest number of distinct species, and then
     return a list of gene references (leaves) that remain.
-    
+
     The function uses a global species_dic mapping gene names (after adjusting if they start with "no_")
     to species names.
-    
+
+    A single bottom-up pass computes the species of every subtree as a bitset (an int with one
+    bit per species), so the branch with the most species is picked at each duplication without
+    collecting the leaves of the children again. The surviving genes are then collected in one
+    preorder pass, skipping the subtrees of the branches that were not picked.
+
     Assumptions:
       - A node is considered a leaf if it has no children (i.e. both orthologGroups and paralogGroups are empty).
-      - A duplication event is indicated by a node having an attribute Ev set to "duplication".
-      - Gene references in a node are stored in the list geneRefs.
+      - A duplication event is a ParalogGroup node. The geneRefs of an internal duplication are
+        excluded, and only the first geneRef of a leaf duplication is kept.
+      - Gene references in a node are stored in the list geneRefs. A gene id excluded anywhere in
+        the tree is excluded everywhere.
+
+    :param group: The rootHOG.
+    :param species_dic: Mapping of gene ids to species names. Genes missing from it do not count
+                        as species.
+    :param species_bits: Mapping of species names to bit positions, shared between calls; filled
+                         as new species are met.
     """
     # TODO: remove species_dic
+    species_bits = {} if species_bits is None else species_bits
 
+    # Preorder list of (node, parent position); children come after their parent
+    nodes = []
+    child_positions = []
+    stack = [(group, -1)]
+    while stack:
+        node, parent = stack.pop()
+        position = len(nodes)
+        nodes.append((node, parent))
+        child_positions.append([])
+        if parent != -1:
+            child_positions[parent].append(position)
+        for child in reversed(node.orthologGroups + node.paralogGroups):
+            stack.append((child, position))
+
+    # Bottom-up pass: the species bitset of every subtree
+    n_unknown = 0
+    species = [0] * len(nodes)
+    for position in range(len(nodes) - 1, -1, -1):
+        node, parent = nodes[position]
+        bits = species[position]
+        for gene in node.geneRefs:
+            name = species_dic.get(gene)
+            if name is None:
+                n_unknown += 1
+                continue
+            bit = species_bits.get(name)
+            if bit is None:
+                bit = species_bits[name] = len(species_bits)
+            bits |= 1 << bit
+        species[position] = bits
+        if parent != -1:
+            species[parent] |= bits
+    if n_unknown:
+        logger.debug(f"{n_unknown} genes of the group are not in the species dic")
+
+    # Top-down pass: genes of the picked branches, and genes excluded by the duplications
+    kept = []
     excluded_genes = set()
-    
-    def is_leaf(node) -> bool:
-        """Return True if the node has no children groups."""
-        return not (node.orthologGroups or node.paralogGroups)
-    
-    def traverse_nodes(node):
-        """Generator to yield nodes in pre-order (current node then all children)."""
-        yield node
-        for child in node.orthologGroups:
-            yield from traverse_nodes(child)
-        for child in node.paralogGroups:
-            yield from traverse_nodes(child)
-    
-    # First pass: mark (exclude) gene leaves for non-maximal children of duplication events.
-    for node in traverse_nodes(group):
-        # Check if the node is internal and a duplication event.
-        if not is_leaf(node) and isinstance(node, ParalogGroup):
-            # For children we combine both the ortholog and paralog children.
-            children = node.orthologGroups + node.paralogGroups
-            list_num_species = []
-            # Evaluate distinct species counts for each child branch.
-            for child in children:
-                species_set = set()
-                # Use the convenience function get_all_leaves() to fetch gene ids from the child
-                for gene in child.get_all_leaves():
-                    if gene in species_dic:
-                        species_set.add(species_dic[gene])
-                    else:
-                        logger.debug(f"species not in the dic {gene}")
-                list_num_species.append(len(species_set))
-            # Optionally, warn about potential polytomy (more than one child has the same maximum species count).
-            if list_num_species.count(max(list_num_species)) > 1:
-                logger.debug(f"Polytomy detected: more than one child has the maximal number of species. node: {node}, list: {list_num_species}")
-            
-            # Choose the child with the maximum number of species.
-            if children:
-                max_species = max(list_num_species)
-                index_max = list_num_species.index(max_species)
-                # For all children other than the one selected, exclude all their gene leaves.
-                for i, child in enumerate(children):
-                    if i != index_max:
-                        for gene in child.get_all_leaves():
-                            excluded_genes.add(gene)
-            if node.geneRefs:
-                for gene in node.geneRefs:
-                    excluded_genes.add(gene)
-
-        if is_leaf(node) and isinstance(node, ParalogGroup):
+    stack = [(0, False)]
+    while stack:
+        position, excluded = stack.pop()
+        node = nodes[position][0]
+        children = child_positions[position]
+        if excluded:
+            excluded_genes.update(node.geneRefs)
+            stack.extend((child, True) for child in reversed(children))
+            continue
+
+        if isinstance(node, ParalogGroup) and children:
+            num_species = [bin(species[child]).count("1") for child in children]
+            max_species = max(num_species)
+            if num_species.count(max_species) > 1:
+                logger.debug(f"Polytomy detected: more than one child has the maximal number of species. node: {node.id or node.taxonId}, list: {num_species}")
+            index_max = num_species.index(max_species)
+            excluded_genes.update(node.geneRefs)
+            stack.extend((child, i != index_max) for i, child in reversed(list(enumerate(children))))
+            continue
+
+        if isinstance(node, ParalogGroup):
             # handle paralog groups without ortholog or paralog groups and only generefs
             # Keep the first gene and remove the rest
-            for gene in node.geneRefs[1:]:
-                excluded_genes.add(gene)
+            kept.extend(node.geneRefs[:1])
+            excluded_genes.update(node.geneRefs[1:])
+        else:
+            kept.extend(node.geneRefs)
+        stack.extend((child, False) for child in reversed(children))
+
+    # The list of maximal ortholog gene references is the collection of the genes
+    # of the picked branches that were not excluded anywhere.
+    return [gene for gene in kept if gene not in excluded_genes]
 
-    
-    def collect_leaves(node) -> list[str]:
-        """
-        Recursively collect gene references from the tree that have not been marked as excluded.
-        """
-        leaves = []
-        # Add gene references from the current node if they have not been excluded.
-        for gene in node.geneRefs:
-            if gene not in excluded_genes:
-                leaves.append(gene)
-        # Recurse into the children groups.
-        for child in node.orthologGroups:
-            leaves.extend(collect_leaves(child))
-        for child in node.paralogGroups:
-            leaves.extend(collect_leaves(child))
-        return leaves
 
-    # The list of maximal ortholog gene references is just the collection
-    # of all leaves (geneRefs) from the tree that were not excluded.
-    return collect_leaves(group)
+def maximal_ogs_of_groups(task: tuple[list[OrthologGroup], dict[str, str]]) -> list[list[str]]:
+    """
+    Compute the maximal OG of every rootHOG of a batch. Used as a process pool task.
+
+    :param task: A tuple of (groups, species_dic), see get_maximal_og.
+
+    :return: A list with the maximal OG of each rootHOG, in the order of groups.
+    """
+    groups, species_dic = task
+    species_bits = {}
+    return [get_maximal_og(group, species_dic, species_bits) for group in groups]
 
 
 def get_ogs(pairs: list[(str, str)]) -> dict[str, list[str]]:
@@ -300,12 +558,13 @@ def get_ogs(pairs: list[(str, str)]) -> dict[str, list[str]]:
     
     return groups
 
-def compute_gene_counts_per_level(taxonomy: Taxon, species: list[Species]) -> dict[str, int]:
+def compute_gene_counts_per_level(taxonomy: Taxon, species: list[Species], index: TaxonomyIndex = None) -> dict[str, int]:
     """
     Compute the number of genes per taxon level.
 
     :param taxonomy: The taxonomy tree
     :param species: The list of species
+    :param index: The TaxonomyIndex of taxonomy, built if not given
 
     :return: A dictionary with the taxonId as key and the number of genes as value
     """
@@ -316,28 +575,105 @@ def compute_gene_counts_per_level(taxonomy: Taxon, species: list[Species]) -> di
     for sp in species:
         gene_counts[sp.taxonId] = len(sp.genes)
 
-    # Traverse the tree using DFS and collect nodes in postorder
-    stack = [taxonomy]
-    postorder = []  # this will store nodes in the order they are finished
+    # Sum the counts up the parent pointers, children (higher preorder numbers) first
+    index = index or TaxonomyIndex(taxonomy)
+    totals = [gene_counts.get(taxon.id, 0) for taxon in index.taxa]
+    for i in range(len(totals) - 1, 0, -1):
+        totals[index.parent[i]] += totals[i]
 
-    while stack:
-        node = stack.pop()
-        postorder.append(node)
-        for child in node.children:
-            stack.append(child)
-
-    # Process nodes in reverse postorder (bottom-up)
-    while postorder:
-        node = postorder.pop()  # processing from leaves upward
-        own_count = gene_counts.get(node.id, 0)
-        total_count = own_count
-        for child in node.children:
-            total_count += gene_counts.get(child.id, 0)
-        gene_counts[node.id] = total_count  # store the total gene count externally
+    # Store the totals in postorder (bottom-up)
+    for i in sorted(range(len(totals)), key=lambda i: (index.end[i], -index.depth[i])):
+        gene_counts[index.taxa[i].id] = totals[i]
 
     return gene_counts
 
 
+LEVEL_STATS_COLUMNS = ("taxonId", "name", "hogs", "genes", "duplications", "scored_hogs", "mean_score", "min_score")
+
+
+def compute_level_stats(groups: list, index: TaxonomyIndex, score_id: str = "CompletenessScore") -> dict[str, dict]:
+    """
+    Compute HOG statistics per taxonomic level in a single pass over the groups.
+
+    A HOG is an OrthologGroup, counted at its taxonId, with its genes (leaves). A duplication is
+    a ParalogGroup, counted at its taxonId, or at the level of the OrthologGroup it is in when it
+    has none. The nodes are listed in preorder once and then processed in reverse, children
+    before parents, so the leaves of every node are known without collecting them; the counts
+    are accumulated in lists indexed by the preorder number of the level in the taxonomy.
+
+    :param groups: The top-level groups. Other items are skipped.
+    :param index: The TaxonomyIndex of the taxonomy. Levels missing from it are added after its
+                  taxa, in the order they are met, and groups without a level are under None.
+    :param score_id: The score whose mean and minimum over the HOGs of each level are computed.
+
+    :return: A dict of the levels with at least one HOG or duplication, in the order of the
+             taxonomy, mapping their taxonId to a dict of the LEVEL_STATS_COLUMNS but taxonId.
+             mean_score and min_score are None when no HOG of the level has the score.
+    """
+    levels = {taxon.id: i for i, taxon in reversed(list(enumerate(index.taxa)))}
+    names = [taxon.name for taxon in index.taxa]
+
+    def level(taxon_id):
+        i = levels.get(taxon_id)
+        if i is None:
+            i = levels[taxon_id] = len(names)
+            names.append(None)
+        return i
+
+    # Preorder list of (node, parent position, level of the enclosing OrthologGroup)
+    nodes = []
+    stack = [(group, -1, None) for group in reversed(groups) if isinstance(group, (OrthologGroup, ParalogGroup))]
+    while stack:
+        node, parent, enclosing = stack.pop()
+        position = len(nodes)
+        if isinstance(node, OrthologGroup):
+            node_level = level(node.taxonId)
+            enclosing = node_level
+        else:
+            node_level = level(node.taxonId) if node.taxonId is not None else enclosing
+            if node_level is None:
+                node_level = level(None)
+        nodes.append((node, parent, node_level))
+        for child in reversed(node.orthologGroups + node.paralogGroups):
+            stack.append((child, position, enclosing))
+
+    n = len(names)
+    hogs, genes, duplications, scored = [0] * n, [0] * n, [0] * n, [0] * n
+    score_sum, score_min = [0.0] * n, [None] * n
+    leaves = [len(node.geneRefs) for node, _, _ in nodes]
+    for position in range(len(nodes) - 1, -1, -1):
+        node, parent, i = nodes[position]
+        if parent != -1:
+            leaves[parent] += leaves[position]
+        if isinstance(node, ParalogGroup):
+            duplications[i] += 1
+            continue
+        hogs[i] += 1
+        genes[i] += leaves[position]
+        for score in node.scores:
+            if score.key == score_id:
+                scored[i] += 1
+                score_sum[i] += score.value
+                score_min[i] = score.value if score_min[i] is None else min(score_min[i], score.value)
+                break
+
+    taxon_ids = [None] * n
+    for taxon_id, i in levels.items():
+        taxon_ids[i] = taxon_id
+    return {
+        taxon_ids[i]: {
+            "name": names[i],
+            "hogs": hogs[i],
+            "genes": genes[i],
+            "duplications": duplications[i],
+            "scored_hogs": scored[i],
+            "mean_score": score_sum[i] / scored[i] if scored[i] else None,
+            "min_score": score_min[i],
+        }
+        for i in range(n) if hogs[i] or duplications[i]
+    }
+
+
 # Code from zoo/hog/convert.py for exporting OrthoXML as Gene Tree with Newick format
 
 class TaxonNHXMixin:
@@ -0,0 +1,224 @@
+# filters.py
+
+import math
+from typing import Union
+
+from .models import Gene, OrthologGroup, ParalogGroup
+
+FILTER_STRATEGIES = {
+    # strategy: (keep_low_score_parents, high_child_as_rhogs)
+    "topdown": (False, False),
+    "bottomup": (False, True),
+}
+
+
+def node_score(node: OrthologGroup, score_id: str) -> float:
+    """
+    The score an orthologGroup is filtered on: its first score.
+
+    :return: None if the group has no score, NaN if its first score is not score_id
+             (neither below nor above any threshold), the score value otherwise.
+    """
+    if not node.scores:
+        return None
+    return node.scores[0].value if node.scores[0].key == score_id else math.nan
+
+
+def filter_groups(
+    groups: list[Union[OrthologGroup, ParalogGroup, Gene]],
+    score_id: str,
+    score_threshold: float,
+    skip_no_scores: bool = False,
+    keep_low_score_parents: bool = False,
+    high_child_as_rhogs: bool = False,
+    node_scores: dict[int, float] = None,
+) -> list[Union[OrthologGroup, ParalogGroup, Gene]]:
+    """
+    Filter parsed groups by score, with the same rules as loaders.filter_by_score on the lxml tree.
+
+    The input groups are not modified. Groups whose subtree is unchanged by the filter are
+    shared with the input; only the groups on the path to a removed or promoted group are copied.
+    Children are visited ortholog groups first, as they are stored in the models.
+
+    :param groups: The top-level items of an OrthoXMLTree.
+    :param score_id: The score ID.
+    :param score_threshold: The score threshold.
+    :param skip_no_scores: If True, skip ortholog groups without scores. If False, remove them.
+    :param keep_low_score_parents: If True, keep parents of low-scoring ortholog groups.
+    :param high_child_as_rhogs: If True, add high-scoring children of low-scoring ortholog groups as new ortholog groups at root.
+    :param node_scores: Optional mapping of id(group) to node_score of every orthologGroup, as built
+                        by sweep_groups, to avoid looking the scores up again.
+
+    :return: The filtered top-level items.
+    """
+    # With keep_low_score_parents, a low-scoring ancestor of a high-scoring group is never removed,
+    # so there is nothing to promote
+    promote = high_child_as_rhogs and not keep_low_score_parents
+    promoted = []  # groups moved to the root in traversal order, None once removed
+
+    def visit(node, low_ancestors):
+        # Returns the filtered node (None if removed), whether it or a descendant scores high,
+        # and whether it was promoted to the root.
+        low = high = False
+        if isinstance(node, OrthologGroup):
+            score = node_score(node, score_id) if node_scores is None else node_scores[id(node)]
+            if score is None:
+                low = not skip_no_scores
+            else:
+                low = score < score_threshold
+                high = score >= score_threshold
+        is_promoted = promote and high and low_ancestors > 0
+        if is_promoted:
+            slot = len(promoted)
+            promoted.append(None)
+
+        changed = False
+        high_below = False
+        n_children = n_removed = 0
+        filtered_children = ([], [])
+        for children, filtered in zip((node.orthologGroups, node.paralogGroups), filtered_children):
+            for child in children:
+                result, child_high, child_promoted = visit(child, low_ancestors + low)
+                high_below = high_below or child_high
+                if child_promoted:
+                    # moved groups do not count as removed
+                    changed = True
+                    continue
+                n_children += 1
+                if result is None:
+                    n_removed += 1
+                    changed = True
+                else:
+                    filtered.append(result)
+                    changed = changed or result is not child
+
+        removed = (low and not (keep_low_score_parents and high_below)) or (
+            # all its group children are removed
+            n_removed > 0 and n_removed == n_children
+        )
+        if removed:
+            result = None
+        elif changed:
+            result = type(node)(
+                id=node.id,
+                taxonId=node.taxonId,
+                scores=node.scores,
+                geneRefs=node.geneRefs,
+                orthologGroups=filtered_children[0],
+                paralogGroups=filtered_children[1],
+            )
+        else:
+            result = node
+
+        if is_promoted:
+            promoted[slot] = result
+        return result, high or high_below, is_promoted
+
+    filtered_groups = []
+    for group in groups:
+        if isinstance(group, (OrthologGroup, ParalogGroup)):
+            result, _, _ = visit(group, 0)
+            if result is not None:
+                filtered_groups.append(result)
+        else:
+            filtered_groups.append(group)
+
+    filtered_groups.extend(group for group in promoted if group is not None)
+    return filtered_groups
+
+
+def sweep_groups(
+    groups: list[Union[OrthologGroup, ParalogGroup, Gene]],
+    score_id: str,
+    thresholds: list[float],
+    skip_no_scores: bool = False,
+    keep_low_score_parents: bool = False,
+    high_child_as_rhogs: bool = False,
+) -> tuple[list[dict], dict[int, float]]:
+    """
+    Count what filter_groups would retain at each of several thresholds, in one traversal.
+
+    Every group carries one value per threshold (removed, promoted, leaf count, ortholog pairs of
+    its filtered subtree). The ortholog pairs of a group are counted from the leaf counts of its
+    branches instead of being enumerated: with L leaves, own geneRefs g and child branches of
+    c_i leaves, an orthologGroup holds (L² - Σc_i² - g) / 2 pairs.
+
+    :param groups: The top-level items of an OrthoXMLTree.
+    :param score_id: The score ID.
+    :param thresholds: The score thresholds.
+    :param skip_no_scores: If True, skip ortholog groups without scores. If False, remove them.
+    :param keep_low_score_parents: If True, keep parents of low-scoring ortholog groups.
+    :param high_child_as_rhogs: If True, add high-scoring children of low-scoring ortholog groups as new ortholog groups at root.
+
+    :return: A dict per threshold with the number of rootHOGs, of geneRefs in the retained groups
+             and of ortholog pairs (as in to_ortho_pairs), and the node_score of every
+             orthologGroup by id(group), which can be passed on to filter_groups.
+    """
+    thresholds = list(thresholds)
+    n = len(thresholds)
+    promote = high_child_as_rhogs and not keep_low_score_parents
+    node_scores = {}
+    root_hogs, genes, pairs = [0] * n, [0] * n, [0] * n
+
+    def visit(node, low_ancestors):
+        # Returns, per threshold: removed, promoted, high in subtree, leaf count and ortholog pairs
+        # of the filtered subtree.
+        is_ortholog = isinstance(node, OrthologGroup)
+        if is_ortholog:
+            score = node_scores[id(node)] = node_score(node, score_id)
+            if score is None:
+                low, high = [not skip_no_scores] * n, [False] * n
+            else:
+                low = [score < t for t in thresholds]
+                high = [score >= t for t in thresholds]
+        else:
+            low, high = [False] * n, [False] * n
+        promoted = [promote and high[i] and low_ancestors[i] > 0 for i in range(n)]
+        child_low_ancestors = [low_ancestors[i] + low[i] for i in range(n)]
+
+        own = len(node.geneRefs)
+        leaves, squares, subtree_pairs = [own] * n, [0] * n, [0] * n
+        high_below = [False] * n
+        n_children, n_removed = [0] * n, [0] * n
+        for child in node.orthologGroups + node.paralogGroups:
+            c_removed, c_promoted, c_high, c_leaves, c_pairs = visit(child, child_low_ancestors)
+            for i in range(n):
+                high_below[i] = high_below[i] or c_high[i]
+                if c_promoted[i]:
+                    continue
+                n_children[i] += 1
+                if c_removed[i]:
+                    n_removed[i] += 1
+                else:
+                    leaves[i] += c_leaves[i]
+                    squares[i] += c_leaves[i] ** 2
+                    subtree_pairs[i] += c_pairs[i]
+
+        removed = [
+            (low[i] and not (keep_low_score_parents and high_below[i])) or (0 < n_removed[i] == n_children[i])
+            for i in range(n)
+        ]
+        for i in range(n):
+            if is_ortholog:
+                subtree_pairs[i] += (leaves[i] ** 2 - squares[i] - own) // 2
+            if promoted[i] and not removed[i]:
+                root_hogs[i] += 1
+                genes[i] += leaves[i]
+                pairs[i] += subtree_pairs[i]
+        return removed, promoted, [high[i] or high_below[i] for i in range(n)], leaves, subtree_pairs
+
+    for group in groups:
+        if isinstance(group, (OrthologGroup, ParalogGroup)):
+            removed, _, _, leaves, subtree_pairs = visit(group, [0] * n)
+            for i in range(n):
+                if not removed[i]:
+                    genes[i] += leaves[i]
+                    if isinstance(group, OrthologGroup):
+                        root_hogs[i] += 1
+                        pairs[i] += subtree_pairs[i]
+
+    counts = [
+        {"threshold": t, "rootHOGs": root_hogs[i], "genes": genes[i], "pairs": pairs[i]}
+        for i, t in enumerate(thresholds)
+    ]
+    return counts, node_scores
@@ -0,0 +1,304 @@
+# flat.py
+
+from typing import Iterable, Iterator
+
+from lxml import etree
+from ._optional import import_optional
+from .models import OrthologGroup, ParalogGroup
+
+np = import_optional("numpy", "numpy")
+
+# Node kinds.
+ORTHOLOG = 0
+PARALOG = 1
+
+
+def _expand_group(node, score_id):
+    # (kind, id, taxonId, geneRefs, score, children) of an OrthologGroup/ParalogGroup model.
+    score = next((s.value for s in node.scores if s.key == score_id), np.nan)
+    kind = PARALOG if isinstance(node, ParalogGroup) else ORTHOLOG
+    return kind, node.id, node.taxonId, node.geneRefs, score, node.orthologGroups + node.paralogGroups
+
+
+def _expand_element(el, score_id):
+    # (kind, id, taxonId, geneRefs, score, children) of an <orthologGroup>/<paralogGroup> element.
+    gene_refs = []
+    ortholog_els = []
+    paralog_els = []
+    score = np.nan
+    for child in el:
+        tag = etree.QName(child.tag).localname
+        if tag == "geneRef":
+            gene_refs.append(child.get("id"))
+        elif tag == "orthologGroup":
+            ortholog_els.append(child)
+        elif tag == "paralogGroup":
+            paralog_els.append(child)
+        elif tag == "score" and child.get("id") == score_id and np.isnan(score):
+            score = float(child.get("value"))
+    kind = PARALOG if etree.QName(el.tag).localname == "paralogGroup" else ORTHOLOG
+    return kind, el.get("id"), el.get("taxonId"), gene_refs, score, ortholog_els + paralog_els
+
+
+class FlatHOGForest:
+    """
+    Array-backed representation of a forest of HOGs.
+
+    Every group is a node, numbered in preorder (ortholog children before paralog children, as
+    in the models), and described by NumPy arrays instead of Python objects:
+
+      - kind: ORTHOLOG (0) or PARALOG (1)
+      - parent, first_child, next_sibling: node indices, -1 if absent
+      - depth: depth of the node, 0 for rootHOGs
+      - taxon: index into taxon_ids of the taxonId attribute, -1 if absent
+      - score: value of the score given by score_id, NaN if absent
+      - gene_offsets: CSR offsets of the own geneRefs of each node into genes
+      - genes: gene indices into gene_ids
+      - subtree_end: preorder index following the subtree of a node
+
+    Because nodes are in preorder, [node, subtree_end[node]) is the Euler tour interval of the
+    subtree and genes[gene_offsets[node]:gene_offsets[subtree_end[node]]] are all its leaves.
+    """
+
+    def __init__(self, kind, parent, first_child, next_sibling, depth, taxon, score,
+                 gene_offsets, genes, subtree_end, node_ids, taxon_ids, gene_ids):
+        self.kind = kind
+        self.parent = parent
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+        self.depth = depth
+        self.taxon = taxon
+        self.score = score
+        self.gene_offsets = gene_offsets
+        self.genes = genes
+        self.subtree_end = subtree_end
+        self.node_ids = node_ids
+        self.taxon_ids = taxon_ids
+        self.gene_ids = gene_ids
+        self.roots = np.flatnonzero(parent == -1).astype(np.int32)
+
+    def __repr__(self):
+        return f"FlatHOGForest(nodes={len(self)}, rootHOGs={len(self.roots)}, genes={len(self.genes)})"
+
+    def __len__(self):
+        return len(self.kind)
+
+    @classmethod
+    def from_groups(cls, groups: Iterable, gene_index: dict[str, int] = None, score_id: str = "CompletenessScore") -> "FlatHOGForest":
+        """
+        Build the forest from OrthologGroup/ParalogGroup models. Other items are skipped.
+
+        :param groups: The top-level groups.
+        :param gene_index: Mapping of geneRef ids to gene indices, extended with unknown geneRefs.
+        :param score_id: The score stored in the score array.
+        """
+        builder = _ForestBuilder(gene_index, score_id)
+        for group in groups:
+            if isinstance(group, (OrthologGroup, ParalogGroup)):
+                builder.add_root(group, _expand_group)
+        return builder.finish()
+
+    @classmethod
+    def from_elements(cls, elements: Iterable, gene_index: dict[str, int] = None, score_id: str = "CompletenessScore") -> "FlatHOGForest":
+        """
+        Build the forest directly from top-level <orthologGroup>/<paralogGroup> elements,
+        without creating the model objects. Other elements are skipped.
+
+        :param elements: The top-level group elements, e.g. from iterparse_orthoxml_elements.
+        :param gene_index: Mapping of geneRef ids to gene indices, extended with unknown geneRefs.
+        :param score_id: The score stored in the score array.
+        """
+        builder = _ForestBuilder(gene_index, score_id)
+        for el in elements:
+            if etree.QName(el.tag).localname in ("orthologGroup", "paralogGroup"):
+                builder.add_root(el, _expand_element)
+        return builder.finish()
+
+    def group_order_roots(self):
+        """
+        The rootHOGs in the order of OrthoXMLTree.groups when the file is loaded without
+        flat=True: the top-level ortholog groups, then the paralog groups, each in document order.
+        """
+        return np.concatenate((self.roots[self.kind[self.roots] == ORTHOLOG], self.roots[self.kind[self.roots] == PARALOG]))
+
+    def children(self, node: int) -> Iterator[int]:
+        """Iterate over the child nodes of node."""
+        child = self.first_child[node]
+        while child != -1:
+            yield int(child)
+            child = self.next_sibling[child]
+
+    def subtree(self, node: int) -> range:
+        """The preorder indices of the nodes in the subtree of node, node included."""
+        return range(node, int(self.subtree_end[node]))
+
+    def is_ancestor(self, ancestor: int, node: int) -> bool:
+        """Whether ancestor is node or one of its ancestors, in constant time."""
+        return ancestor <= node < self.subtree_end[ancestor]
+
+    def own_genes(self, node: int):
+        """Gene indices of the geneRefs directly under node."""
+        return self.genes[self.gene_offsets[node]:self.gene_offsets[node + 1]]
+
+    def leaves(self, node: int):
+        """Gene indices of all the geneRefs in the subtree of node, in document order."""
+        return self.genes[self.gene_offsets[node]:self.gene_offsets[self.subtree_end[node]]]
+
+    def leaf_ids(self, node: int) -> list[str]:
+        """GeneRef ids of all the geneRefs in the subtree of node."""
+        return self.gene_ids[self.leaves(node)].tolist()
+
+    def leaf_counts(self):
+        """Number of leaves in the subtree of every node."""
+        return self.gene_offsets[self.subtree_end] - self.gene_offsets[:-1]
+
+    def postorder(self, roots=None):
+        """
+        Node indices in postorder, restricted to the subtrees of roots (default: all rootHOGs),
+        one subtree after the other in the order of roots.
+        """
+        if roots is None:
+            nodes = np.arange(len(self), dtype=np.int32)
+            # A node comes after its whole subtree: sort by end of subtree, ancestors last.
+            return nodes[np.lexsort((-nodes, self.subtree_end[nodes]))]
+        orders = []
+        for r in roots:
+            nodes = np.arange(r, self.subtree_end[r], dtype=np.int32)
+            orders.append(nodes[np.lexsort((-nodes, self.subtree_end[nodes]))])
+        return np.concatenate(orders) if orders else np.empty(0, dtype=np.int32)
+
+    def pairs(self, paralogs: bool = False, roots=None):
+        """
+        Ortholog (or paralog) pairs as an (N, 2) int32 array of gene indices, in the same order
+        as get_pairs_array.
+
+        :param paralogs: If True, return paralog pairs (LCA is a paralog node) instead of ortholog pairs.
+        :param roots: Restrict to the subtrees of these nodes, in this order (default: all
+                      rootHOGs, in document order).
+        """
+        wanted = PARALOG if paralogs else ORTHOLOG
+        chunks = []
+
+        def cross(a, b):
+            if len(a) and len(b):
+                chunks.append(np.column_stack((np.repeat(a, len(b)), np.tile(b, len(a)))))
+
+        for node in self.postorder(roots):
+            if self.kind[node] != wanted:
+                continue
+            own = self.own_genes(node)
+            child_leaves = [self.leaves(child) for child in self.children(node)]
+            for leaves in child_leaves:
+                cross(own, leaves)
+            for i in range(len(child_leaves)):
+                for j in range(i + 1, len(child_leaves)):
+                    cross(child_leaves[i], child_leaves[j])
+            if len(own) > 1:
+                first, second = np.triu_indices(len(own), k=1)
+                chunks.append(np.column_stack((own[first], own[second])))
+
+        if not chunks:
+            return np.empty((0, 2), dtype=np.int32)
+        return np.concatenate(chunks).astype(np.int32, copy=False)
+
+    def pair_counts(self, paralogs: bool = False):
+        """
+        Number of ortholog (or paralog) pairs whose LCA is each node, computed from the leaf
+        counts: (L² - Σc_i² - g) / 2 for a node of L leaves, g own genes and children of c_i leaves.
+
+        :param paralogs: If True, count paralog pairs instead of ortholog pairs.
+        """
+        leaves = self.leaf_counts().astype(np.int64)
+        own = np.diff(self.gene_offsets)
+        squares = np.zeros(len(self), dtype=np.int64)
+        children = np.flatnonzero(self.parent != -1)
+        np.add.at(squares, self.parent[children], leaves[children] ** 2)
+        counts = (leaves ** 2 - squares - own) // 2
+        counts[self.kind != (PARALOG if paralogs else ORTHOLOG)] = 0
+        return counts
+
+    def ortho_pairs(self):
+        """Ortholog pairs of the ortholog rootHOGs, as in OrthoXMLTree.to_ortho_pairs."""
+        return self.pairs(paralogs=False, roots=self.roots[self.kind[self.roots] == ORTHOLOG])
+
+    def paralog_pairs(self):
+        """
+        Paralog pairs of all the top-level groups, as in OrthoXMLTree.to_paralog_pairs: the
+        rootHOGs are visited in the order of group_order_roots.
+        """
+        return self.pairs(paralogs=True, roots=self.group_order_roots())
+
+
+class _ForestBuilder:
+    # Accumulates the nodes of a FlatHOGForest in preorder in Python lists.
+
+    def __init__(self, gene_index: dict[str, int] = None, score_id: str = "CompletenessScore"):
+        self.gene_index = {} if gene_index is None else gene_index
+        self.score_id = score_id
+        self.taxon_index = {}
+        self.kind = []
+        self.parent = []
+        self.first_child = []
+        self.next_sibling = []
+        self.depth = []
+        self.taxon = []
+        self.score = []
+        self.gene_offsets = [0]
+        self.genes = []
+        self.node_ids = []
+
+    def add_root(self, root, expand) -> None:
+        gene_index = self.gene_index
+        last_child = {}
+        stack = [(root, -1, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            i = len(self.kind)
+            kind, node_id, taxon_id, gene_refs, score, children = expand(node, self.score_id)
+
+            self.kind.append(kind)
+            self.parent.append(parent)
+            self.first_child.append(-1)
+            self.next_sibling.append(-1)
+            self.depth.append(depth)
+            self.taxon.append(-1 if taxon_id is None else self.taxon_index.setdefault(taxon_id, len(self.taxon_index)))
+            self.score.append(score)
+            self.node_ids.append(node_id)
+            self.genes.extend(gene_index.setdefault(gene, len(gene_index)) for gene in gene_refs)
+            self.gene_offsets.append(len(self.genes))
+
+            if parent != -1:
+                if self.first_child[parent] == -1:
+                    self.first_child[parent] = i
+                else:
+                    self.next_sibling[last_child[parent]] = i
+                last_child[parent] = i
+            stack.extend((child, i, depth + 1) for child in reversed(children))
+
+    def finish(self) -> FlatHOGForest:
+        n = len(self.kind)
+        depth = np.array(self.depth, dtype=np.int32)
+
+        # The subtree of a node ends at the next node that is not deeper.
+        subtree_end = np.full(n, n, dtype=np.int32)
+        open_nodes = []
+        for i, d in enumerate(self.depth):
+            while open_nodes and self.depth[open_nodes[-1]] >= d:
+                subtree_end[open_nodes.pop()] = i
+            open_nodes.append(i)
+
+        return FlatHOGForest(
+            kind=np.array(self.kind, dtype=np.int8),
+            parent=np.array(self.parent, dtype=np.int32),
+            first_child=np.array(self.first_child, dtype=np.int32),
+            next_sibling=np.array(self.next_sibling, dtype=np.int32),
+            depth=depth,
+            taxon=np.array(self.taxon, dtype=np.int32),
+            score=np.array(self.score, dtype=np.float64),
+            gene_offsets=np.array(self.gene_offsets, dtype=np.int64),
+            genes=np.array(self.genes, dtype=np.int32),
+            subtree_end=subtree_end,
+            node_ids=np.array(self.node_ids, dtype=object),
+            taxon_ids=np.array(list(self.taxon_index), dtype=object),
+            gene_ids=np.array(list(self.gene_index), dtype=object),
+        )
@@ -0,0 +1,324 @@
+# index.py
+
+import csv
+import json
+import os
+import re
+from typing import Iterable, Union
+
+from lxml import etree
+from .compression import open_input, skip_to
+from .exceptions import OrthoXMLParsingError
+from .loaders import _group_from_xml
+from .models import OrthologGroup, ParalogGroup, Gene
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+INDEX_SUFFIX = ".idx"
+INDEX_FORMAT_VERSION = 2
+
+_ATTRS = rb"((?:[^>\"']|\"[^\"]*\"|'[^']*')*?)"
+_ROOT_RE = re.compile(rb"<!--.*?-->|<\?.*?\?>|<!DOCTYPE[^>]*>|<([A-Za-z_][\w.:-]*)" + _ATTRS + rb">", re.S)
+_TAG_RE = re.compile(rb"<!--.*?-->|<(/?)(?:[\w.-]+:)?(orthologGroup|paralogGroup|groups)\b" + _ATTRS + rb"(/?)>", re.S)
+_ID_RE = re.compile(rb"\bid\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+_REF_RE = re.compile(r"&(?:#x([0-9a-fA-F]+)|#([0-9]+)|(amp|lt|gt|quot|apos));|\r\n|[\t\n\r]")
+_ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+
+
+def _attribute_value(raw: bytes) -> str:
+    # The value of an attribute as an XML parser reports it: character and entity references
+    # are replaced in a single pass, and whitespace characters are normalized to spaces
+    def replace(m):
+        if m.group(1):
+            return chr(int(m.group(1), 16))
+        if m.group(2):
+            return chr(int(m.group(2)))
+        return _ENTITIES[m.group(3)] if m.group(3) else " "
+
+    return _REF_RE.sub(replace, raw.decode("utf-8"))
+
+
+def file_signature(filepath: str) -> tuple[int, int]:
+    """
+    Return the (size, mtime in ns) signature of a file, used to detect stale sidecar files.
+    """
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def scan_root_hogs(stream, chunk_size: int = 1 << 24) -> tuple[str, int, list[tuple[str, int, int]]]:
+    """
+    Scan an OrthoXML byte stream once and locate every top-level <orthologGroup> of <groups>.
+
+    The stream is read in chunks and only the group tags are tokenized, so no XML tree is built.
+
+    :param stream: A binary file-like object positioned at the start of the document.
+    :param chunk_size: Number of bytes read at once.
+
+    :return: A tuple of the root start tag, the byte offset of <groups>, and a list of
+             (id, offset, length) entries of the rootHOGs in document order.
+    """
+    root_tag = None
+    groups_offset = None
+    entries = []
+
+    in_groups = False
+    depth = 0
+    hog_start = None
+    hog_id = None
+
+    buf = b""
+    base = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        buf += chunk
+        pos = 0
+
+        if root_tag is None:
+            for m in _ROOT_RE.finditer(buf):
+                if m.group(1) is not None:
+                    root_tag = m.group(0).decode("utf-8")
+                    pos = m.end()
+                    break
+
+        if root_tag is not None:
+            for m in _TAG_RE.finditer(buf, pos):
+                pos = m.end()
+                name = m.group(2)
+                if name is None:
+                    # a comment
+                    continue
+                closing = m.group(1) == b"/"
+                self_closing = m.group(4) == b"/"
+
+                if name == b"groups":
+                    if not closing:
+                        in_groups = True
+                        groups_offset = base + m.start()
+                    else:
+                        in_groups = False
+                    continue
+                if not in_groups:
+                    continue
+
+                if closing:
+                    depth -= 1
+                    if depth == 0 and hog_start is not None:
+                        entries.append((hog_id, hog_start, base + m.end() - hog_start))
+                        hog_start = None
+                    continue
+
+                if depth == 0 and name == b"orthologGroup":
+                    id_match = _ID_RE.search(m.group(3))
+                    hog_id = None
+                    if id_match:
+                        hog_id = _attribute_value(id_match.group(1) if id_match.group(1) is not None else id_match.group(2))
+                    if self_closing:
+                        entries.append((hog_id, base + m.start(), m.end() - m.start()))
+                    else:
+                        hog_start = base + m.start()
+                if not self_closing:
+                    depth += 1
+
+        if not chunk:
+            break
+        if root_tag is None:
+            # The root start tag is not complete yet, keep the whole buffer.
+            continue
+
+        # Keep a possibly incomplete tag or comment at the end of the buffer for the next round.
+        tail = buf.rfind(b"<", pos)
+        comment = buf.find(b"<!--", pos)
+        if comment != -1:
+            tail = comment
+        if tail == -1:
+            tail = len(buf)
+        base += tail
+        buf = buf[tail:]
+
+    if root_tag is None:
+        raise OrthoXMLParsingError("No root element found in the OrthoXML file.")
+    return root_tag, groups_offset, entries
+
+
+class RootHOGIndex:
+    """
+    Byte-offset index of the rootHOGs of an OrthoXML file.
+
+    The index maps the id of every top-level orthologGroup to the byte range it spans in the
+    source file, so single rootHOGs can be parsed without reading the rest of the document.
+    It is stored in a sidecar file next to the source (<source>.idx) and is only reused while
+    the size and modification time of the source are unchanged.
+
+    For a compressed source, the offsets are positions in the decompressed document: rootHOGs
+    are then read by decompressing the source up to them, in file order.
+    """
+
+    def __init__(self, source: str, signature: tuple[int, int], root_tag: str, groups_offset: int, entries: list[tuple[str, int, int]]):
+        self.source = source
+        self.signature = tuple(signature)
+        self.root_tag = root_tag
+        self.groups_offset = groups_offset
+        self.entries = entries
+        self.offsets = {hog_id: (offset, length) for hog_id, offset, length in entries if hog_id is not None}
+
+        n_missing = sum(1 for hog_id, _, _ in entries if hog_id is None)
+        if n_missing:
+            logger.warning(f"{n_missing} rootHOGs without an id attribute cannot be looked up in the index")
+
+    def __repr__(self):
+        return f"RootHOGIndex(source={self.source!r}, rootHOGs={len(self.entries)})"
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, hog_id):
+        return hog_id in self.offsets
+
+    @classmethod
+    def build(cls, filepath: str) -> "RootHOGIndex":
+        """
+        Scan an OrthoXML file and build the index of its rootHOGs.
+
+        :param filepath: Path to the OrthoXML file.
+        """
+        if not os.path.exists(filepath):
+            raise OrthoXMLParsingError(f"OrthoXML file not found: {filepath}")
+        signature = file_signature(filepath)
+        with open_input(filepath) as f:
+            root_tag, groups_offset, entries = scan_root_hogs(f)
+        return cls(filepath, signature, root_tag, groups_offset, entries)
+
+    @staticmethod
+    def sidecar_path(filepath: str) -> str:
+        return filepath + INDEX_SUFFIX
+
+    def save(self, path: str = None) -> str:
+        """
+        Write the index to a sidecar file.
+
+        The first line is a JSON header describing the source, followed by one
+        tab-separated "id, offset, length" line per rootHOG, written with the csv module so
+        that ids holding tabs, quotes or newlines are quoted.
+
+        :param path: Path of the sidecar file (default: <source>.idx).
+        :return: The path the index was written to.
+        """
+        path = path or self.sidecar_path(self.source)
+        header = {
+            "format": INDEX_FORMAT_VERSION,
+            "size": self.signature[0],
+            "mtime_ns": self.signature[1],
+            "root_tag": self.root_tag,
+            "groups_offset": self.groups_offset,
+        }
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(json.dumps(header) + "\n")
+            writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+            writer.writerows(('' if hog_id is None else hog_id, offset, length) for hog_id, offset, length in self.entries)
+        return path
+
+    @classmethod
+    def load(cls, filepath: str, path: str = None) -> "RootHOGIndex":
+        """
+        Read the index of an OrthoXML file from its sidecar file.
+
+        :param filepath: Path to the indexed OrthoXML file.
+        :param path: Path of the sidecar file (default: <filepath>.idx).
+        :raises OrthoXMLParsingError: If the sidecar is missing or does not match the source file.
+        """
+        path = path or cls.sidecar_path(filepath)
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                header = json.loads(f.readline())
+                entries = []
+                for hog_id, offset, length in csv.reader(f, delimiter="\t"):
+                    entries.append((hog_id or None, int(offset), int(length)))
+        except (OSError, ValueError) as e:
+            raise OrthoXMLParsingError(f"Failed to load rootHOG index '{path}': {e}")
+
+        if header.get("format") != INDEX_FORMAT_VERSION:
+            raise OrthoXMLParsingError(f"Unsupported rootHOG index format in '{path}'")
+        index = cls(filepath, (header["size"], header["mtime_ns"]), header["root_tag"], header["groups_offset"], entries)
+        if not index.is_fresh():
+            raise OrthoXMLParsingError(f"rootHOG index '{path}' is stale for {filepath}")
+        return index
+
+    @classmethod
+    def open(cls, filepath: str, rebuild: bool = True) -> "RootHOGIndex":
+        """
+        Load the sidecar index of an OrthoXML file, (re)building it when it is missing or stale.
+
+        :param filepath: Path to the OrthoXML file.
+        :param rebuild: If False, raise instead of rebuilding a missing or stale index.
+        """
+        try:
+            return cls.load(filepath)
+        except OrthoXMLParsingError as e:
+            if not rebuild:
+                raise
+            logger.info(f"Building rootHOG index for {filepath} ({e})")
+
+        index = cls.build(filepath)
+        try:
+            index.save()
+        except OSError as e:
+            logger.warning(f"Could not write rootHOG index next to {filepath}: {e}")
+        return index
+
+    def is_fresh(self) -> bool:
+        """
+        Check that the source file still has the size and modification time recorded in the index.
+        """
+        try:
+            return file_signature(self.source) == self.signature
+        except OSError:
+            return False
+
+    def _envelope(self, fragment: bytes) -> bytes:
+        root_name = self.root_tag[1:].split(None, 1)[0].rstrip(">")
+        return self.root_tag.encode("utf-8") + fragment + f"</{root_name}>".encode("utf-8")
+
+    def read_fragments(self, hog_ids: Iterable[str]) -> list[bytes]:
+        """
+        Read the raw bytes of the given rootHOGs from the source file.
+
+        :param hog_ids: ids of the rootHOGs.
+        :raises KeyError: If one of the ids is not in the index.
+        """
+        hog_ids = list(hog_ids)
+        ranges = [self.offsets[hog_id] for hog_id in hog_ids]
+        fragments = [None] * len(ranges)
+        # Read in file order to keep the seeks sequential, and forward-only in decompressed streams.
+        position = 0
+        with open_input(self.source) as f:
+            for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+                offset, length = ranges[i]
+                position = skip_to(f, position, offset)
+                fragments[i] = f.read(length)
+                position += len(fragments[i])
+        return fragments
+
+    def parse_fragment(self, fragment: bytes) -> Union[OrthologGroup, ParalogGroup, Gene]:
+        """
+        Parse the bytes of a single group wrapped in the root element of the source file.
+        """
+        parser = etree.XMLParser(remove_comments=True)
+        try:
+            root = etree.fromstring(self._envelope(fragment), parser)
+        except etree.XMLSyntaxError as e:
+            raise OrthoXMLParsingError(f"Failed to parse indexed rootHOG: {e}")
+        return _group_from_xml(root[0])
+
+    def load_hogs(self, hog_ids: Iterable[str]) -> list[OrthologGroup]:
+        """
+        Parse only the given rootHOGs from the source file.
+
+        :param hog_ids: ids of the rootHOGs.
+        :raises KeyError: If one of the ids is not in the index.
+        """
+        if not self.is_fresh():
+            raise OrthoXMLParsingError(f"{self.source} changed since the rootHOG index was built")
+        return [self.parse_fragment(fragment) for fragment in self.read_fragments(hog_ids)]
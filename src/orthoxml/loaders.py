@@ -1,20 +1,30 @@
 # loaders.py
 
 import os
-from importlib import resources
-from typing import Union
+from typing import Iterable, Iterator, Union
 
 from lxml import etree
-from .exceptions import OrthoXMLParsingError
+from .compression import detect_compression, open_input
+from .exceptions import OrthoXMLParsingError, OrthoXMLValidationError
 from .models import Gene, Species, OrthologGroup, ParalogGroup, Taxon, ORTHO_NS
 from .logger import get_logger
+from .parallel import imap_in_pool
+from .validation import get_schema, StreamingValidator, ValidationIssue, init_chunk_worker, validate_chunk
 
 
 logger = get_logger(__name__)
 
+def _parser_source(filepath: str):
+    # What lxml reads the document from: the path of an uncompressed file (parsed by libxml2
+    # without going through Python), or the decompressed stream of a compressed one.
+    if detect_compression(filepath) is None:
+        return filepath
+    return open_input(filepath)
+
 def load_orthoxml_file(filepath: str, validate: bool = False) -> etree.ElementTree:
     """
     Load an OrthoXML file from disk, removing all XML comments.
+    The file may be compressed with gzip, bz2, xz or zstd, detected from its first bytes.
     
     :param filepath: Path to the OrthoXML file.
     :param validate: If True, run schema validation after parsing.
@@ -26,7 +36,12 @@ def load_orthoxml_file(filepath: str, validate: bool = False) -> etree.ElementTr
 
     try:
         parser = etree.XMLParser(remove_comments=True)
-        tree = etree.parse(filepath, parser)
+        source = _parser_source(filepath)
+        try:
+            tree = etree.parse(source, parser)
+        finally:
+            if source is not filepath:
+                source.close()
     except Exception as e:
         raise OrthoXMLParsingError(f"Failed to load OrthoXML file: {e}")
 
@@ -53,10 +68,8 @@ def validate_xml(xml_tree, orthoxml_version) -> bool:
     :return: True if the document is valid, False otherwise.
     """
     try:
-        # Load XSD schema from package resources
-        with resources.files('orthoxml.schemas').joinpath(f'orthoxml-{orthoxml_version}.xsd').open('rb') as schema_file:
-            schema_root = etree.XML(schema_file.read())
-            schema = etree.XMLSchema(schema_root)
+        # The schema is compiled once per version
+        schema = get_schema(orthoxml_version)
 
         # Validate
         if schema.validate(xml_tree):
@@ -110,11 +123,336 @@ def parse_orthoxml(xml_tree) -> tuple[list[Species], Taxon, list[Union[OrthologG
 
     return species_list, taxonomy, groups, orthoxml_version
 
+def _release_element(element) -> None:
+    """
+    Free an element consumed during iterparse together with its already processed siblings.
+
+    :param element: The element that has been fully consumed.
+    """
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+def in_group_order(groups: Iterable[Union[OrthologGroup, ParalogGroup, Gene]]) -> list[Union[OrthologGroup, ParalogGroup, Gene]]:
+    """
+    Sort top-level groups in the order of parse_orthoxml: the orthologGroups, then the
+    paralogGroups, then the geneRefs, each in document order.
+    """
+    order = {OrthologGroup: 0, ParalogGroup: 1, Gene: 2}
+    return sorted(groups, key=lambda group: order.get(type(group), 3))
+
+def _group_from_xml(group_el) -> Union[OrthologGroup, ParalogGroup, Gene]:
+    """
+    Build the domain model of a top-level element of <groups>.
+
+    :param group_el: An <orthologGroup>, <paralogGroup> or <geneRef> element.
+
+    :return: The corresponding OrthologGroup, ParalogGroup or Gene instance.
+    """
+    tag = etree.QName(group_el.tag).localname
+    if tag == "orthologGroup":
+        return OrthologGroup.from_xml(group_el)
+    elif tag == "paralogGroup":
+        return ParalogGroup.from_xml(group_el)
+    return Gene.from_xml(group_el)
+
+def _filter_group_element(group_el, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs) -> list:
+    """
+    Apply filter_by_score to a single top-level group element.
+
+    The element is moved into a minimal <orthoXML><groups> envelope so that filter_by_score
+    can operate on it as if it were the only group of the document.
+
+    :return: The top-level group elements that survive the filtering.
+    """
+    envelope = etree.Element(f"{{{ORTHO_NS}}}orthoXML")
+    groups_el = etree.SubElement(envelope, f"{{{ORTHO_NS}}}groups")
+    groups_el.append(group_el)
+    filter_by_score(etree.ElementTree(envelope), score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs)
+    return list(groups_el)
+
+def iterparse_orthoxml_elements(
+    filepath: str,
+    score_id: str = None,
+    score_threshold: float = None,
+    skip_no_scores: bool = False,
+    keep_low_score_parents: bool = False,
+    high_child_as_rhogs: bool = False,
+    validate: bool = False,
+) -> tuple[list[Species], Taxon, Iterator[etree._Element], str]:
+    """
+    Incrementally parse an OrthoXML file without building the full XML tree.
+
+    The species and taxonomy are parsed eagerly, while the top-level elements of <groups> are
+    returned as a lazy iterator. Each element is cleared once the consumer moves on to the next
+    one, so the peak memory is proportional to the largest rootHOG instead of the file.
+    If score_threshold is given, each top-level group is filtered with filter_by_score before
+    being yielded, which may yield several elements (e.g. promoted high-scoring children).
+    Compressed files are decompressed on the fly, as in load_orthoxml_file.
+
+    With validate, every child of the root and every top-level group is validated against the
+    schema before it is filtered and released (see validation.StreamingValidator). The errors
+    are collected and raised together once the groups iterator is exhausted.
+
+    :param filepath: Path to the OrthoXML file.
+    :param score_id: The score ID to filter by.
+    :param score_threshold: The score threshold to filter by.
+    :param skip_no_scores: If True, skip ortholog groups without scores. If False, remove them.
+    :param keep_low_score_parents: If True, keep parents of low-scoring ortholog groups.
+    :param high_child_as_rhogs: If True, add high-scoring children of low-scoring ortholog groups as new rootHOGs.
+    :param validate: If True, validate the document while it is parsed.
+
+    :return: A tuple of species_list, taxonomy, group elements iterator, and the OrthoXML version.
+    :raises OrthoXMLParsingError: If file is missing or unparsable.
+    :raises OrthoXMLValidationError: From the groups iterator, if the document is not valid.
+    """
+    if not os.path.exists(filepath):
+        raise OrthoXMLParsingError(f"OrthoXML file not found: {filepath}")
+
+    source = _parser_source(filepath)
+    context = etree.iterparse(source, events=("start", "end"), remove_comments=True)
+
+    def close_source():
+        if source is not filepath:
+            source.close()
+
+    species_list = []
+    taxonomy = None
+    orthoxml_version = None
+    validator = None
+    groups_depth = None
+    depth = 0
+    try:
+        for event, el in context:
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    orthoxml_version = el.get("version", None)
+                    if validate:
+                        validator = StreamingValidator(el)
+                elif el.tag == f"{{{ORTHO_NS}}}groups":
+                    groups_depth = depth
+                    if validator is not None:
+                        validator.start_groups(el)
+                    break
+                continue
+
+            depth -= 1
+            if depth == 1 and validator is not None:
+                validator.check_header(el)
+            if el.tag == f"{{{ORTHO_NS}}}species":
+                species_list.append(Species.from_xml(el))
+                _release_element(el)
+            elif el.tag == f"{{{ORTHO_NS}}}taxonomy":
+                taxon_el = el.find(f"{{{ORTHO_NS}}}taxon")
+                if taxon_el is not None:
+                    taxonomy = Taxon.from_xml(taxon_el)
+                _release_element(el)
+            elif depth == 1 and validator is not None:
+                _release_element(el)
+    except etree.XMLSyntaxError as e:
+        close_source()
+        raise OrthoXMLParsingError(f"Failed to load OrthoXML file: {e}")
+
+    def finish_validation():
+        if validator is None:
+            return
+        errors = validator.finish()
+        if errors:
+            details = "\n".join(f"  line {error.line}: {error.message}" for error in errors)
+            raise OrthoXMLValidationError(
+                f"OrthoXML file is not valid for version {orthoxml_version} ({len(errors)} errors):\n{details}",
+                errors,
+            )
+
+    def iter_group_elements():
+        if groups_depth is None:
+            close_source()
+            finish_validation()
+            return
+        depth = groups_depth
+        try:
+            for event, el in context:
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1 and validator is not None and el.tag != f"{{{ORTHO_NS}}}groups":
+                    # misplaced after <groups>
+                    validator.check_header(el)
+                if depth != groups_depth:
+                    continue
+                if validator is not None:
+                    validator.check_group(el)
+                if score_threshold:
+                    yield from _filter_group_element(el, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs)
+                else:
+                    yield el
+                _release_element(el)
+        except etree.XMLSyntaxError as e:
+            raise OrthoXMLParsingError(f"Failed to load OrthoXML file: {e}")
+        finally:
+            close_source()
+        finish_validation()
+
+    return species_list, taxonomy, iter_group_elements(), orthoxml_version
+
+def iterparse_orthoxml(
+    filepath: str,
+    score_id: str = None,
+    score_threshold: float = None,
+    skip_no_scores: bool = False,
+    keep_low_score_parents: bool = False,
+    high_child_as_rhogs: bool = False,
+    validate: bool = False,
+) -> tuple[list[Species], Taxon, Iterator[Union[OrthologGroup, ParalogGroup, Gene]], str]:
+    """
+    Incrementally parse an OrthoXML file without building the full XML tree.
+
+    Same as iterparse_orthoxml_elements, but the groups iterator builds the domain model of
+    one top-level group at a time. The groups are yielded in document order, unlike
+    parse_orthoxml which lists the orthologGroups first (see in_group_order).
+
+    :return: A tuple of species_list, taxonomy, groups iterator, and the OrthoXML version.
+    :raises OrthoXMLParsingError: If file is missing or unparsable.
+    """
+    species_list, taxonomy, group_elements, orthoxml_version = iterparse_orthoxml_elements(
+        filepath, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs, validate
+    )
+    groups = (_group_from_xml(group_el) for group_el in group_elements)
+    return species_list, taxonomy, groups, orthoxml_version
+
+def validate_orthoxml_file(filepath: str, jobs: int = 1, chunk_size: int = 1 << 24) -> list[ValidationIssue]:
+    """
+    Validate an OrthoXML file against the schema of its version without building the full XML tree.
+
+    With a single job, the file is validated in one streaming pass. With several jobs, the header
+    (species, taxonomy, scores) is validated first, then <groups> is sliced at rootHOG boundaries
+    found by the rootHOG index (see index.RootHOGIndex) into slices of about chunk_size bytes,
+    each validated in a pool of processes. In that mode the errors also hold the byte offset of
+    their line in the (decompressed) file.
+
+    :param filepath: Path to the OrthoXML file, possibly compressed.
+    :param jobs: Number of processes validating the rootHOGs.
+    :param chunk_size: Minimum size of the slices of <groups> in bytes, with several jobs.
+
+    :return: All the schema errors as ValidationIssue (line, message, offset), empty if the file is valid.
+    :raises OrthoXMLParsingError: If file is missing or unparsable.
+    """
+    if jobs > 1:
+        return _validate_in_chunks(filepath, jobs, chunk_size)
+    _, _, group_elements, _ = iterparse_orthoxml_elements(filepath, validate=True)
+    try:
+        for _ in group_elements:
+            pass
+    except OrthoXMLValidationError as e:
+        return e.errors
+    return []
+
+def _validate_header(filepath: str) -> StreamingValidator:
+    # Validate the children of the root up to the start of <groups>
+    if not os.path.exists(filepath):
+        raise OrthoXMLParsingError(f"OrthoXML file not found: {filepath}")
+    source = _parser_source(filepath)
+    validator = None
+    depth = 0
+    try:
+        for event, el in etree.iterparse(source, events=("start", "end"), remove_comments=True):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    validator = StreamingValidator(el)
+                elif el.tag == f"{{{ORTHO_NS}}}groups":
+                    validator.start_groups(el)
+                    break
+                continue
+            depth -= 1
+            if depth == 1:
+                validator.check_header(el)
+                _release_element(el)
+    except etree.XMLSyntaxError as e:
+        raise OrthoXMLParsingError(f"Failed to load OrthoXML file: {e}")
+    finally:
+        if source is not filepath:
+            source.close()
+    return validator
+
+def _groups_slices(filepath: str, root_tag: str, groups_offset: int, starts: list[int]) -> Iterator[tuple]:
+    # validate_chunk tasks of the content of <groups>, sliced at the given offsets, read sequentially
+    with open_input(filepath) as f:
+        line = 1
+        position = 0
+        while position < groups_offset:
+            block = f.read(min(groups_offset - position, 1 << 24))
+            if not block:
+                return
+            line += block.count(b"\n")
+            position += len(block)
+
+        head = b""
+        while b">" not in head:
+            block = f.read(1 << 12)
+            if not block:
+                return
+            head += block
+        groups_tag = head[:head.index(b">") + 1]
+        groups_name = groups_tag[1:-1].split(None, 1)[0].rstrip(b"/")
+        if groups_tag.endswith(b"/>"):
+            return
+        root_name = root_tag[1:].split(None, 1)[0].rstrip(">").encode("utf-8")
+        prefix = (root_tag.encode("utf-8") + groups_tag).replace(b"\r", b" ").replace(b"\n", b" ")
+        suffix = b"</" + groups_name + b"></" + root_name + b">"
+
+        line += groups_tag.count(b"\n")
+        position += len(groups_tag)
+        buf = head[len(groups_tag):]
+        boundaries = [offset for offset in starts if offset > position] + [None]
+        for end in boundaries:
+            if end is None:
+                chunk = buf + f.read()
+                chunk = chunk[:chunk.rfind(b"</" + groups_name)]
+            elif end - position <= len(buf):
+                chunk, buf = buf[:end - position], buf[end - position:]
+            else:
+                chunk = buf + f.read(end - position - len(buf))
+                buf = b""
+            yield prefix, chunk, suffix, position, line
+            line += chunk.count(b"\n")
+            position += len(chunk)
+
+def _validate_in_chunks(filepath: str, jobs: int, chunk_size: int) -> list[ValidationIssue]:
+    from .index import RootHOGIndex
+
+    validator = _validate_header(filepath)
+    if validator.schema is None:
+        return validator.finish()
+
+    try:
+        index = RootHOGIndex.load(filepath)
+    except OrthoXMLParsingError:
+        # not saved: validating does not write next to the file
+        index = RootHOGIndex.build(filepath)
+    starts = []
+    for _, offset, _ in index.entries:
+        if not starts or offset - starts[-1] >= chunk_size:
+            starts.append(offset)
+    tasks = _groups_slices(filepath, index.root_tag, index.groups_offset, starts)
+    for result in imap_in_pool(validate_chunk, tasks, jobs, initializer=init_chunk_worker, initargs=validator.chunk_worker_args()):
+        validator.add_chunk(result)
+    return validator.finish()
+
 def filter_by_score(xml_tree, score_id, score_threshold, skip_no_scores=True, keep_low_score_parents=False, high_child_as_rhogs=False) -> None:
     """
     Filter OrthoXML document by score. Works in-place.
 
-    Code from https://github.com/DessimozLab/FastOMA/blob/main/FastOMA/zoo/hog/filter_orthoxml.py
+    Same behavior as the filter of https://github.com/DessimozLab/FastOMA/blob/main/FastOMA/zoo/hog/filter_orthoxml.py
+    but decided in a single traversal of the groups: a stack holds the state of the open ancestors,
+    so every orthologGroup is only visited once instead of scanning its ancestors.
+
+    An orthologGroup is removed if its score is below the threshold (or it has no score and
+    skip_no_scores is False). A group whose group children all got removed is removed as well.
 
     :param xml_tree: An instance of the XML tree.
     :param score_id: The score ID.
@@ -127,42 +465,61 @@ def filter_by_score(xml_tree, score_id, score_threshold, skip_no_scores=True, ke
     groups_root = root.find('.//{{{0}}}groups'.format(ORTHO_NS))
     if groups_root is None:
         raise ValueError("No groups found in the XML tree.")
-    to_rem = []
-    to_append = []
-    for hog in root.iterfind('.//{{{0}}}orthologGroup'.format(ORTHO_NS)):
-        hog_id = hog.get('id')
-        score = hog.find('./{{{0}}}score'.format(ORTHO_NS))
-        if score is None:
-            if skip_no_scores:
-                continue
-            else:
+    ortholog_tag = "{{{0}}}orthologGroup".format(ORTHO_NS)
+    paralog_tag = "{{{0}}}paralogGroup".format(ORTHO_NS)
+    score_tag = "{{{0}}}score".format(ORTHO_NS)
+    # With keep_low_score_parents, a low-scoring ancestor of a high-scoring group is never removed,
+    # so there is nothing to promote
+    promote = high_child_as_rhogs and not keep_low_score_parents
+
+    to_rem = []     # removed groups whose parent is kept
+    to_append = []  # groups moved to the root, in document order
+    # Per open group: [low, high, promoted, has high descendant, number of group children, removed children]
+    stack = []
+    low_ancestors = 0
+    for event, hog in etree.iterwalk(groups_root, events=("start", "end"), tag=(ortholog_tag, paralog_tag)):
+        if event == "start":
+            low = high = False
+            if hog.tag == ortholog_tag:
+                score = hog.find(score_tag)
+                if score is None:
+                    low = not skip_no_scores
+                else:
+                    score_value = float(score.get('value'))
+                    if score.get('id') == score_id:
+                        low = score_value < score_threshold
+                        high = not low
+            promoted = promote and high and low_ancestors > 0
+            if promoted:
+                to_append.append(hog)
+            if low:
+                low_ancestors += 1
+            stack.append([low, high, promoted, False, 0, []])
+            continue
+
+        low, high, promoted, high_below, n_children, removed_children = stack.pop()
+        if low:
+            low_ancestors -= 1
+        removed = (low and not (keep_low_score_parents and high_below)) or (
+            # all its group children are removed (moved groups do not count)
+            len(removed_children) > 0 and len(removed_children) == n_children
+        )
+        if not removed:
+            to_rem.extend(removed_children)
+
+        if promoted or not stack:
+            # The parent is the groups element
+            if removed:
                 to_rem.append(hog)
-                continue
-        score_value = float(score.get('value'))
-        if score.get('id') == score_id and score_value < score_threshold:
-            to_rem.append(hog)
-        if keep_low_score_parents and score.get('id') == score_id and score_value >= score_threshold:
-            # remove all parents of this score from remove list
-            for parent in hog.iterancestors():
-                if parent.tag == "{{{0}}}orthologGroup".format(ORTHO_NS):
-                    if parent in to_rem:
-                        to_rem.remove(parent)
-        
-        if high_child_as_rhogs and score.get('id') == score_id and score_value >= score_threshold:
-            # check if this is a child of a low-scoring ortholog group
-            for parent in hog.iterancestors():
-                if parent in to_rem:
-                    # this is a high scoring child of a low-scoring ortholog group
-                    # add this ortholog group as a new ortholog group at root
-                    to_append.append(hog)
-                    break
-    
+        else:
+            parent = stack[-1]
+            parent[3] = parent[3] or high or high_below
+            parent[4] += 1
+            if removed:
+                parent[5].append(hog)
+
     for h in to_append:
         groups_root.append(h)
 
     for h in to_rem:
-        parent = h.getparent()
-        if parent is not None:
-            parent.remove(h)
-            if sum(c.tag == "{{{0}}}orthologGroup".format(ORTHO_NS) for c in parent) + sum(c.tag == "{{{0}}}paralogGroup".format(ORTHO_NS) for c in parent) == 0 and parent.tag != "{{{0}}}groups".format(ORTHO_NS):
-                to_rem.append(parent)
+        h.getparent().remove(h)
@@ -0,0 +1,264 @@
+# lookup.py
+
+from collections import defaultdict
+from typing import Iterable, Iterator, Union
+
+from .models import Gene, OrthologGroup, ParalogGroup
+
+ORTHOLOG = "ortholog"
+PARALOG = "paralog"
+UNRELATED = "unrelated"
+
+
+class GeneIndex:
+    """
+    Index of where every geneRef occurs in a list of groups, to answer per-gene queries by
+    walking up from the gene instead of enumerating whole rootHOGs.
+
+    The index holds, for every geneRef id, the (rootHOG position, group) of each group listing it,
+    and for every group its parent and its position among the parent's children.
+    It must be rebuilt if the groups are modified in place.
+    """
+
+    def __init__(self, groups: list[Union[OrthologGroup, ParalogGroup, Gene]]):
+        self.groups = groups
+        self.occurrences = defaultdict(list)
+        self.parents = {}
+        self._lca = {}
+
+        for position, group in enumerate(groups):
+            if not isinstance(group, (OrthologGroup, ParalogGroup)):
+                continue
+            stack = [group]
+            while stack:
+                node = stack.pop()
+                for gene_id in node.geneRefs:
+                    occurrences = self.occurrences[gene_id]
+                    # a gene listed twice by the same group is found through a single entry
+                    if not occurrences or occurrences[-1][1] is not node:
+                        occurrences.append((position, node))
+                children = node.orthologGroups + node.paralogGroups
+                for i, child in enumerate(children):
+                    self.parents[id(child)] = (node, i)
+                stack.extend(children)
+
+    def __contains__(self, gene_id: str) -> bool:
+        return gene_id in self.occurrences
+
+    def ancestors(self, node: Union[OrthologGroup, ParalogGroup]) -> list[Union[OrthologGroup, ParalogGroup]]:
+        """The chain of groups from node (included) up to its rootHOG."""
+        chain = [node]
+        while id(chain[-1]) in self.parents:
+            chain.append(self.parents[id(chain[-1])][0])
+        return chain
+
+    def _postorder_chain_nodes(self, nodes: list) -> list:
+        # The groups on the ancestor chains of nodes (all in the same rootHOG), in the postorder
+        # of the rootHOG: each group after its subtree, children in their model order.
+        children_on_chain = defaultdict(dict)
+        root = None
+        for node in nodes:
+            for group in self.ancestors(node):
+                parent = self.parents.get(id(group))
+                if parent is None:
+                    root = group
+                    break
+                parent_node, i = parent
+                if i in children_on_chain[id(parent_node)]:
+                    break
+                children_on_chain[id(parent_node)][i] = group
+
+        ordered = []
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                ordered.append(node)
+                continue
+            stack.append((node, True))
+            on_chain = children_on_chain.get(id(node), {})
+            stack.extend((on_chain[i], False) for i in sorted(on_chain, reverse=True))
+        return ordered
+
+    def lca(self, position: int) -> "RootLCA":
+        """The LCA structure of the rootHOG at position in groups, built on first use."""
+        if position not in self._lca:
+            self._lca[position] = RootLCA(self.groups[position])
+        return self._lca[position]
+
+    def relationship(self, gene_a: str, gene_b: str) -> tuple[str, str]:
+        """
+        Classify a pair of genes by the kind of their lowest common ancestor group.
+
+        Genes listed by several groups are located by their first occurrence.
+
+        :return: A tuple of ORTHOLOG, PARALOG or UNRELATED (different rootHOGs, unknown
+                 gene, or gene_a == gene_b) and the taxonId of the LCA group (None if unrelated).
+        """
+        occurrences_a = self.occurrences.get(gene_a)
+        occurrences_b = self.occurrences.get(gene_b)
+        if not occurrences_a or not occurrences_b or gene_a == gene_b:
+            return UNRELATED, None
+        position, node_a = occurrences_a[0]
+        position_b, node_b = occurrences_b[0]
+        if position != position_b:
+            return UNRELATED, None
+        lca = self.lca(position).query(node_a, node_b)
+        return (PARALOG if isinstance(lca, ParalogGroup) else ORTHOLOG), lca.taxonId
+
+    def _nodes_by_root(self, gene_id: str, paralogs: bool) -> dict[int, list]:
+        # The groups listing gene_id, by rootHOG position.
+        nodes_of_root = defaultdict(list)
+        for position, node in self.occurrences.get(gene_id, []):
+            # ortholog pairs are only collected from OrthologGroup rootHOGs
+            if paralogs or isinstance(self.groups[position], OrthologGroup):
+                nodes_of_root[position].append(node)
+        return nodes_of_root
+
+    def _pairs_in_root(self, gene_id: str, nodes: list, paralogs: bool, leaves: dict) -> list[(str, str)]:
+        chain_nodes = self._postorder_chain_nodes(nodes)
+        on_chain = {id(node) for node in chain_nodes}
+        pairs = []
+        for node in chain_nodes:
+            if isinstance(node, ParalogGroup) == paralogs:
+                pairs.extend(_pairs_of_gene_at(node, gene_id, on_chain, leaves))
+        return pairs
+
+    def pairs_of_gene(self, gene_id: str, paralogs: bool = False) -> list[(str, str)]:
+        """
+        The ortholog (or paralog) pairs containing gene_id, in the order and orientation of
+        get_ortho_pairs_recursive (get_paralog_pairs_recursive) over the rootHOGs.
+
+        Only the groups on the ancestor chains of the gene are visited; at each of them, the pairs
+        whose lowest common ancestor is that group are generated between the branch holding the
+        gene and the other branches.
+
+        :param gene_id: The geneRef id.
+        :param paralogs: If True, return paralog pairs instead of ortholog pairs.
+        """
+        nodes_of_root = self._nodes_by_root(gene_id, paralogs)
+        pairs = []
+        for position in sorted(nodes_of_root):
+            pairs.extend(self._pairs_in_root(gene_id, nodes_of_root[position], paralogs, {}))
+        return pairs
+
+    def iter_pairs_of_genes(self, gene_ids: Iterable[str], paralogs: bool = False) -> Iterator[tuple[str, list[(str, str)]]]:
+        """
+        The pairs of many genes, grouped by rootHOG: every rootHOG holding query genes is visited
+        once, sharing the leaves of its branches between the query genes.
+
+        :param gene_ids: The geneRef ids.
+        :param paralogs: If True, return paralog pairs instead of ortholog pairs.
+
+        :return: An iterator of (gene_id, pairs) in rootHOG order, query order within a rootHOG.
+                 A gene occurring in several rootHOGs is yielded once per rootHOG, and the
+                 concatenation of its pairs is pairs_of_gene(gene_id).
+        """
+        queries_of_root = defaultdict(list)
+        for gene_id in dict.fromkeys(gene_ids):
+            for position, nodes in self._nodes_by_root(gene_id, paralogs).items():
+                queries_of_root[position].append((gene_id, nodes))
+
+        for position in sorted(queries_of_root):
+            leaves = {}
+            for gene_id, nodes in queries_of_root[position]:
+                yield gene_id, self._pairs_in_root(gene_id, nodes, paralogs, leaves)
+
+
+class RootLCA:
+    """
+    Lowest common ancestor queries between the groups of a rootHOG in constant time.
+
+    The Euler tour of the groups (every group listed on entry and again after each of its
+    children) is indexed with a sparse table of range-minimum depths: the LCA of two groups
+    is the shallowest group of the tour between their first visits.
+    """
+
+    def __init__(self, root: Union[OrthologGroup, ParalogGroup]):
+        self.nodes = []
+        self.depth = []
+        self.first = {}
+        euler = []
+
+        stack = [(root, 0, None)]
+        while stack:
+            node, depth, parent = stack.pop()
+            if node is None:
+                # back to the parent after one of its children
+                euler.append(parent)
+                continue
+            i = len(self.nodes)
+            self.nodes.append(node)
+            self.depth.append(depth)
+            self.first[id(node)] = len(euler)
+            euler.append(i)
+            for child in reversed(node.orthologGroups + node.paralogGroups):
+                stack.append((None, 0, i))
+                stack.append((child, depth + 1, None))
+
+        # sparse[k][j] is the shallowest node of euler[j:j + 2**k]
+        depth = self.depth
+        self.sparse = [euler]
+        k = 1
+        while 1 << k <= len(euler):
+            previous = self.sparse[-1]
+            half = 1 << (k - 1)
+            self.sparse.append([
+                a if depth[a] <= depth[b] else b
+                for a, b in zip(previous, previous[half:])
+            ])
+            k += 1
+
+    def query(self, node_a, node_b):
+        """The lowest common ancestor group of two groups of the rootHOG."""
+        left, right = self.first[id(node_a)], self.first[id(node_b)]
+        if left > right:
+            left, right = right, left
+        k = (right - left + 1).bit_length() - 1
+        a, b = self.sparse[k][left], self.sparse[k][right - (1 << k) + 1]
+        return self.nodes[a if self.depth[a] <= self.depth[b] else b]
+
+
+def _pairs_of_gene_at(node, gene_id: str, on_chain: set, leaves: dict) -> list[(str, str)]:
+    # The pairs containing gene_id whose LCA is node, in the order of get_ortho_pairs_recursive.
+    # on_chain holds the ids of the groups whose subtree contains gene_id, leaves caches the
+    # leaves of the groups by id.
+    own = node.geneRefs
+    children = node.orthologGroups + node.paralogGroups
+    has_gene = [id(child) in on_chain for child in children]
+    own_has_gene = gene_id in own
+
+    def leaves_of(i):
+        key = id(children[i])
+        if key not in leaves:
+            leaves[key] = children[i].get_all_leaves()
+        return leaves[key]
+
+    def cross(first, second, second_has_gene):
+        # Pairs (r, s) of first x second containing gene_id
+        count = second.count(gene_id) if second_has_gene else 0
+        result = []
+        for r in first:
+            if r == gene_id:
+                result.extend((r, s) for s in second)
+            elif count:
+                result.extend([(r, gene_id)] * count)
+        return result
+
+    pairs = []
+    # Own geneRefs with each child branch.
+    for i in range(len(children)):
+        if own_has_gene or has_gene[i]:
+            pairs.extend(cross(own, leaves_of(i), has_gene[i]))
+    # Pairs of different child branches.
+    for i in range(len(children)):
+        for j in range(i + 1, len(children)):
+            if has_gene[i] or has_gene[j]:
+                pairs.extend(cross(leaves_of(i), leaves_of(j), has_gene[j]))
+    # Own geneRefs with each other.
+    if own_has_gene:
+        for i in range(len(own)):
+            for j in range(i + 1, len(own)):
+                if own[i] == gene_id or own[j] == gene_id:
+                    pairs.append((own[i], own[j]))
+    return pairs
@@ -0,0 +1,86 @@
+# parallel.py
+
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Sequence
+
+
+def partition_by_weight(items: Sequence, n_parts: int, weight: Callable = len) -> list[list[int]]:
+    """
+    Split items into at most n_parts bins of similar total weight.
+
+    Uses the longest-processing-time-first heuristic: items are assigned from the heaviest
+    to the lightest, each to the currently lightest bin. Empty bins are dropped.
+
+    :param items: The items to distribute.
+    :param n_parts: The number of bins.
+    :param weight: Function returning the weight of an item.
+
+    :return: A list of bins, each a list of item positions in ascending order.
+    """
+    weights = [weight(item) for item in items]
+    order = sorted(range(len(items)), key=lambda i: weights[i], reverse=True)
+
+    bins = [[] for _ in range(max(1, n_parts))]
+    heap = [(0, b) for b in range(len(bins))]
+    for i in order:
+        load, b = heapq.heappop(heap)
+        bins[b].append(i)
+        heapq.heappush(heap, (load + weights[i], b))
+
+    return [sorted(positions) for positions in bins if positions]
+
+
+def map_in_pool(func: Callable, tasks: Iterable, workers: int) -> list:
+    """
+    Apply func to every task in a pool of worker processes and return the results in task order.
+
+    func and the tasks must be picklable. With a single worker, everything runs in-process.
+
+    :param func: A module-level function taking a single task.
+    :param tasks: The tasks, one per call of func.
+    :param workers: The number of worker processes.
+    """
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        return list(executor.map(func, tasks))
+
+
+def imap_in_pool(func: Callable, tasks: Iterable, workers: int, initializer: Callable = None, initargs: tuple = (), max_pending: int = None, finalizer: Callable = None) -> Iterator:
+    """
+    Lazily apply func to every task in a pool of worker processes, yielding the results in task order.
+
+    Unlike map_in_pool, the tasks are only pulled from their iterable when fewer than
+    max_pending of them are queued, so large tasks (e.g. chunks of a file) are never all in
+    memory at once. With a single worker, everything runs in-process.
+
+    :param func: A module-level function taking a single task.
+    :param tasks: The tasks, one per call of func.
+    :param workers: The number of worker processes.
+    :param initializer: Called with initargs in every worker (and in-process) before the tasks.
+    :param max_pending: Maximum number of tasks submitted and not yet yielded (default: 2 * workers).
+    :param finalizer: With a single worker, called in-process once the tasks are done or the
+                      iteration is abandoned, to release the state set by initializer.
+    """
+    if workers <= 1:
+        try:
+            if initializer is not None:
+                initializer(*initargs)
+            for task in tasks:
+                yield func(task)
+        finally:
+            if finalizer is not None:
+                finalizer()
+        return
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
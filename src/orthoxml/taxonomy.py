@@ -0,0 +1,283 @@
+# taxonomy.py
+
+from typing import Iterable, Union
+
+from .models import Taxon, Species, OrthologGroup, ParalogGroup
+
+
+class TaxonomyIndex:
+    """
+    Flat index of a Taxon tree, built once in a single traversal.
+
+    The taxa are numbered in preorder: taxa[i] is the i-th Taxon, parent[i] the number of its
+    parent (-1 for the root) and depth[i] its depth. The subtree of taxon i spans the numbers
+    [i, end[i]) of this Euler tour, and its leaves are leaves[leaf_start[i]:leaf_end[i]], so
+    ancestry checks, leaf sets and leaf counts do not walk the tree. Taxa are looked up by id
+    in a dict, and lowest common ancestors are answered in constant time from a sparse table
+    over the Euler tour, built on the first query.
+
+    The index is a snapshot: build a new one after modifying the taxonomy in place.
+
+    Example:
+        >>> index = TaxonomyIndex(otree.taxonomy)
+        >>> index.leaf_taxa("4")
+        [Taxon(id=1, name=Homo sapiens, children=[]), Taxon(id=2, name=Pan troglodytes, children=[])]
+        >>> index.lca(["1", "3"]).name
+        'Root'
+        >>> pruned = index.prune(otree.species[:2])
+    """
+
+    def __init__(self, taxonomy: Taxon):
+        """
+        :param taxonomy: The root of the taxonomy.
+        """
+        self.root = taxonomy
+        self.taxa = []
+        self.parent = []
+        self.depth = []
+        self.end = []
+        self.leaf_start = []
+        self.leaf_end = []
+        self.leaves = []
+
+        # Iterative preorder; an inner taxon is pushed again as (None, i, ...) to close its
+        # intervals once its children are numbered
+        stack = [(taxonomy, -1, 0)]
+        while stack:
+            taxon, parent, depth = stack.pop()
+            if taxon is None:
+                self.end[parent] = len(self.taxa)
+                self.leaf_end[parent] = len(self.leaves)
+                continue
+            i = len(self.taxa)
+            self.taxa.append(taxon)
+            self.parent.append(parent)
+            self.depth.append(depth)
+            self.end.append(i + 1)
+            self.leaf_start.append(len(self.leaves))
+            self.leaf_end.append(len(self.leaves))
+            if not taxon.children:
+                self.leaves.append(i)
+                self.leaf_end[i] = len(self.leaves)
+                continue
+            stack.append((None, i, depth))
+            for child in reversed(taxon.children):
+                stack.append((child, i, depth + 1))
+
+        self._by_id = {}
+        for i, taxon in enumerate(self.taxa):
+            self._by_id.setdefault(taxon.id, i)
+        self._leaf_by_name = {}
+        for i in self.leaves:
+            self._leaf_by_name.setdefault(self.taxa[i].name, i)
+        self._euler = None
+
+    def __repr__(self):
+        return f"TaxonomyIndex(taxa={len(self.taxa)}, leaves={len(self.leaves)})"
+
+    def __len__(self):
+        # The number of leaves, as len() of the root Taxon, without walking the tree
+        return len(self.leaves)
+
+    def __contains__(self, taxon_id):
+        return taxon_id in self._by_id
+
+    def __getitem__(self, taxon_id: str) -> Taxon:
+        """
+        The taxon with an id.
+
+        :raises KeyError: If no taxon has this id.
+        """
+        return self.taxa[self._by_id[taxon_id]]
+
+    def get(self, taxon_id: str, default=None) -> Taxon:
+        """The taxon with an id, default if there is none."""
+        i = self._by_id.get(taxon_id)
+        return default if i is None else self.taxa[i]
+
+    def parent_of(self, taxon_id: str) -> Taxon:
+        """The parent of a taxon, None for the root."""
+        parent = self.parent[self._by_id[taxon_id]]
+        return None if parent == -1 else self.taxa[parent]
+
+    def ancestors(self, taxon_id: str) -> list[Taxon]:
+        """The ancestors of a taxon, from its parent up to the root."""
+        ancestors = []
+        i = self.parent[self._by_id[taxon_id]]
+        while i != -1:
+            ancestors.append(self.taxa[i])
+            i = self.parent[i]
+        return ancestors
+
+    def depth_of(self, taxon_id: str) -> int:
+        """The depth of a taxon, 0 for the root."""
+        return self.depth[self._by_id[taxon_id]]
+
+    def leaf_count(self, taxon_id: str) -> int:
+        """The number of leaves under a taxon (1 for a leaf), as len() of the Taxon."""
+        i = self._by_id[taxon_id]
+        return self.leaf_end[i] - self.leaf_start[i]
+
+    def number(self, taxon_id: str) -> int:
+        """The preorder number of a taxon, None if no taxon has this id."""
+        return self._by_id.get(taxon_id)
+
+    def is_ancestor(self, ancestor_id: str, taxon_id: str) -> bool:
+        """Whether a taxon is an ancestor of another one, or the taxon itself."""
+        i, j = self._by_id[ancestor_id], self._by_id[taxon_id]
+        return i <= j < self.end[i]
+
+    def leaf_taxa(self, taxon_id: str) -> list[Taxon]:
+        """The leaves under a taxon, in the order of the taxonomy."""
+        i = self._by_id[taxon_id]
+        return [self.taxa[leaf] for leaf in self.leaves[self.leaf_start[i]:self.leaf_end[i]]]
+
+    def _build_euler(self) -> None:
+        # Euler tour of the taxa (each taxon is visited before its children and again after each
+        # of them), the first visit of each taxon, and a sparse table of the shallowest taxon of
+        # every range of 2^k visits of the tour.
+        tour = []
+        first = [0] * len(self.taxa)
+        children = [[] for _ in self.taxa]
+        for i in range(1, len(self.taxa)):
+            children[self.parent[i]].append(i)
+        stack = [(0, 0)]
+        while stack:
+            i, next_child = stack.pop()
+            if next_child == 0:
+                first[i] = len(tour)
+            tour.append(i)
+            if next_child < len(children[i]):
+                stack.append((i, next_child + 1))
+                stack.append((children[i][next_child], 0))
+
+        depth = self.depth
+        table = [tour]
+        span = 1
+        while 2 * span <= len(tour):
+            previous = table[-1]
+            table.append([
+                a if depth[a] <= depth[b] else b
+                for a, b in zip(previous, previous[span:])
+            ])
+            span *= 2
+        self._euler = (first, table)
+
+    def _lca(self, i: int, j: int) -> int:
+        first, table = self._euler
+        a, b = first[i], first[j]
+        if a > b:
+            a, b = b, a
+        k = (b - a + 1).bit_length() - 1
+        x, y = table[k][a], table[k][b - (1 << k) + 1]
+        return x if self.depth[x] <= self.depth[y] else y
+
+    def lca_number(self, numbers: Iterable[int]) -> int:
+        """The preorder number of the lowest common ancestor of taxa given by number, None if there are none."""
+        if self._euler is None:
+            self._build_euler()
+        lca = None
+        for i in numbers:
+            lca = i if lca is None else self._lca(lca, i)
+        return lca
+
+    def lca(self, taxon_ids: Iterable[str]) -> Taxon:
+        """
+        The lowest common ancestor of taxa, in constant time per taxon.
+
+        :param taxon_ids: The ids of the taxa.
+        :return: The lowest common ancestor, None if taxon_ids is empty.
+        :raises KeyError: If no taxon has one of the ids.
+        """
+        lca = self.lca_number(self._by_id[taxon_id] for taxon_id in taxon_ids)
+        return None if lca is None else self.taxa[lca]
+
+    def species_lca(self, species: Iterable[Species]) -> Taxon:
+        """
+        The lowest common ancestor of the taxa of species (see species_number). Species missing
+        from the taxonomy are ignored.
+
+        :return: The lowest common ancestor, None if none of the species is in the taxonomy.
+        """
+        numbers = (self.species_number(sp) for sp in species)
+        lca = self.lca_number(i for i in numbers if i is not None)
+        return None if lca is None else self.taxa[lca]
+
+    def species_number(self, species: Species) -> int:
+        """
+        The preorder number of the taxon of a species: the taxon whose id is its taxonId, or else
+        the leaf named after the species. None if there is neither.
+        """
+        i = self.number(species.taxonId)
+        if i is None:
+            i = self._leaf_by_name.get(species.name)
+        return i
+
+    def induced_taxonomy(self, numbers: Iterable[int]) -> Taxon:
+        """
+        The smallest taxonomy that holds the given taxa with all their ancestors below their
+        lowest common ancestor, as new Taxon objects keeping the order of the children.
+
+        The paths to the root are followed through the parent pointers and stop at the first
+        taxon already kept, so the time is proportional to the size of the result rather than
+        to the size of the taxonomy.
+
+        :param numbers: Preorder numbers of the taxa to keep, e.g. from species_number.
+        :return: The root of the induced taxonomy, or a copy of the root alone if numbers is empty.
+        """
+        kept = set()
+        targets = set()
+        for i in numbers:
+            targets.add(i)
+            while i != -1 and i not in kept:
+                kept.add(i)
+                i = self.parent[i]
+        if not kept:
+            root = self.taxa[0]
+            return Taxon(root.id, root.name)
+
+        # Copy the kept taxa in preorder, so the children keep their original order
+        copies = {}
+        kept_children = {}
+        for i in sorted(kept):
+            taxon = self.taxa[i]
+            copies[i] = Taxon(taxon.id, taxon.name)
+            kept_children[i] = []
+            if self.parent[i] != -1:
+                copies[self.parent[i]].children.append(copies[i])
+                kept_children[self.parent[i]].append(i)
+
+        # Start at the lowest common ancestor: skip the ancestors with a single kept child
+        i = 0
+        while len(kept_children[i]) == 1 and i not in targets:
+            i = kept_children[i][0]
+        return copies[i]
+
+    def prune(self, species: Iterable[Species], groups: Iterable[Union[OrthologGroup, ParalogGroup]] = ()) -> Taxon:
+        """
+        The minimal taxonomy of a subset of a tree: the taxa of the given species and the levels
+        (taxonId) of the given groups and of their subgroups, with their ancestors up to their
+        lowest common ancestor (see induced_taxonomy). Species and levels missing from the
+        taxonomy are ignored.
+
+        :param species: The species of the subset.
+        :param groups: The groups of the subset.
+        :return: The root of the pruned taxonomy.
+        """
+        numbers = set()
+        for sp in species:
+            i = self.species_number(sp)
+            if i is not None:
+                numbers.add(i)
+
+        stack = [g for g in groups if isinstance(g, (OrthologGroup, ParalogGroup))]
+        while stack:
+            group = stack.pop()
+            i = self.number(group.taxonId)
+            if i is not None:
+                numbers.add(i)
+            stack.extend(group.orthologGroups)
+            stack.extend(group.paralogGroups)
+
+        return self.induced_taxonomy(numbers)
+
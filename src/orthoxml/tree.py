@@ -1,12 +1,23 @@
 # tree.py
 
-from collections import defaultdict
+import io
+import os
+import shutil
+from collections import Counter, defaultdict
 from typing import Union
-from .loaders import load_orthoxml_file, parse_orthoxml, filter_by_score
-from .exceptions import OrthoXMLParsingError
+from .loaders import load_orthoxml_file, parse_orthoxml, filter_by_score, iterparse_orthoxml, iterparse_orthoxml_elements, in_group_order
+from .exceptions import OrthoXMLParsingError, OrthoXMLValidationError
+from .index import RootHOGIndex
+from .cache import write_cache, read_cache
 from lxml import etree
 from .models import Gene, Species, OrthologGroup, ParalogGroup, Taxon, ORTHO_NS, NSMAP
-from .exporters import get_ortho_pairs_recursive, get_paralog_pairs_recursive, get_ortho_pairs_iterative, get_maximal_og, compute_gene_counts_per_level, OrthoxmlToNewick
+from .exporters import get_ortho_pairs_recursive, get_paralog_pairs_recursive, get_ortho_pairs_iterative, get_maximal_og, compute_gene_counts_per_level, compute_level_stats, LEVEL_STATS_COLUMNS, OrthoxmlToNewick, ortho_pairs_of_groups, write_ortho_pairs_of_groups, maximal_ogs_of_groups, get_pairs_array, count_pairs, species_pair_counts, gene_species_map, species_subset, init_split_worker, clear_split_worker, write_root_hog_shard
+from .parallel import partition_by_weight, map_in_pool, imap_in_pool
+from .filters import filter_groups, sweep_groups, FILTER_STRATEGIES
+from .lookup import GeneIndex
+from .taxonomy import TaxonomyIndex
+from .writers import LRUWriterPool, species_filenames, species_pair_path, open_pair_writer, pair_format, write_orthoxml
+from ._optional import import_optional
 
 class OrthoXMLTree:
     def __init__(
@@ -16,7 +27,9 @@ class OrthoXMLTree:
         groups: list[Union[OrthologGroup, ParalogGroup, Gene]],
         taxonomy: Taxon,
         xml_tree: etree.ElementTree,
-        orthoxml_version: str = None
+        orthoxml_version: str = None,
+        index: RootHOGIndex = None,
+        forest: "FlatHOGForest" = None
     ):
         self.genes = genes
         self.species = species
@@ -24,14 +37,34 @@ class OrthoXMLTree:
         self.taxonomy = taxonomy
         self.xml_tree = xml_tree
         self.orthoxml_version = orthoxml_version
+        self.index = index
+        self.forest = forest
+        self._gene_index = None
+        self._taxonomy_index = None
 
     def debug_repr(self) -> str:
         return f"OrthoXMLTree(genes={self.genes}, species={self.species}, groups={self.groups}, taxonomy={self.taxonomy}, orthoxml_version={self.orthoxml_version})"
         
     def __repr__(self) -> str:
-        number_of_rHOGs = len([g for g in self.groups if isinstance(g, OrthologGroup)])
-        return f"OrthoXMLTree(genes=[{len(self.genes)} genes], species=[{len(self.species)} species], groups(number of rHOGs)=[{number_of_rHOGs} rHOGs], taxonomy=[{len(self.taxonomy)} taxons], orthoxml_version={self.orthoxml_version})"
+        if self._is_flat():
+            from .flat import ORTHOLOG
+            number_of_rHOGs = int((self.forest.kind[self.forest.roots] == ORTHOLOG).sum())
+        else:
+            number_of_rHOGs = len([g for g in self.groups if isinstance(g, OrthologGroup)])
+        return f"OrthoXMLTree(genes=[{len(self.genes)} genes], species=[{len(self.species)} species], groups(number of rHOGs)=[{number_of_rHOGs} rHOGs], taxonomy=[{len(self.taxonomy_index())} taxons], orthoxml_version={self.orthoxml_version})"
     
+    def _is_flat(self) -> bool:
+        # Loaded with flat=True: the groups only exist as the arrays of self.forest
+        return self.forest is not None and not self.groups
+
+    def _require_groups(self, method: str) -> None:
+        if self._is_flat():
+            raise ValueError(
+                f"{method} needs the group objects but the tree was loaded with flat=True; "
+                "use the *_array methods, count_ortho_pairs, count_paralog_pairs or forest, "
+                "or load the file without flat=True."
+            )
+
     def base_stats(self) -> dict:
         """
         Compute statistics about the OrthoXML tree.
@@ -43,8 +76,8 @@ class OrthoXMLTree:
         return {
             "genes": len(self.genes),
             "species": len(self.species),
-            "groups": len(self.groups),
-            "taxonomy": len(self.taxonomy),
+            "groups": len(self.forest.roots) if self._is_flat() else len(self.groups),
+            "taxonomy": len(self.taxonomy_index()),
             "orthoxml_version": self.orthoxml_version
         }
     
@@ -59,7 +92,7 @@ class OrthoXMLTree:
         Returns:
             dict: number of genes per taxonId level in the OrthoXML tree
         """
-        gene_counts_per_level = compute_gene_counts_per_level(self.taxonomy, self.species)
+        gene_counts_per_level = compute_gene_counts_per_level(self.taxonomy, self.species, self.taxonomy_index())
 
         if filepath:
             with open(filepath, "w") as f:
@@ -69,6 +102,32 @@ class OrthoXMLTree:
         
         return gene_counts_per_level
 
+    def level_stats(self, score_id: str = "CompletenessScore", filepath: str = None, sep: str = "\t") -> dict[str, dict]:
+        """
+        Compute HOG statistics per taxonomic level in a single pass over the groups: the number
+        of HOGs (ortholog groups) at each taxonId, their genes, the number of duplications
+        (paralog groups) and the number, mean and minimum of the scores of the HOGs.
+        Write to file if specified, one line per level.
+
+        Args:
+            score_id: ID of the score to summarize (default: CompletenessScore)
+            filepath: Path to write the stats to
+            sep: Separator to use when writing to file (default: tab)
+        Returns:
+            dict: the statistics of each taxonId level with HOGs or duplications, see exporters.compute_level_stats
+        """
+        self._require_groups("level_stats")
+        stats = compute_level_stats(self.groups, self.taxonomy_index(), score_id)
+
+        if filepath:
+            with open(filepath, "w") as f:
+                f.write(sep.join(LEVEL_STATS_COLUMNS) + "\n")
+                for level, row in stats.items():
+                    values = [level] + [row[column] for column in LEVEL_STATS_COLUMNS[1:]]
+                    f.write(sep.join("" if value is None else str(value) for value in values) + "\n")
+
+        return stats
+
     @classmethod
     def from_file(
         cls, 
@@ -81,6 +140,8 @@ class OrthoXMLTree:
         high_child_as_rhogs: bool = False,
 
         validate: bool = False,
+        streaming: bool = False,
+        flat: bool = False,
     ) -> "OrthoXMLTree":
         """
         Create an OrthoXMLTree instance from an OrthoXML file.
@@ -92,7 +153,17 @@ class OrthoXMLTree:
             score_id: ID of the score to filter by (default: None) e.g. CompletenessScore
             keep_low_score_parents: behavior of the filtering
             high_child_as_rhogs: behavior of the filtering
-            validate: Validate the XML file against the schema (default: False)
+            validate: Validate the XML file against the schema (default: False). With streaming or
+                flat, the file is validated while it is parsed, one rootHOG at a time, and all the
+                errors are reported together with their line numbers.
+            streaming: Parse the file incrementally without keeping the lxml tree in memory (default: False).
+                The resulting instance has no xml_tree, so to_gene_tree is not available. The groups
+                are in the same order as with the default load: the top-level orthologGroups, then
+                the paralogGroups, then the geneRefs, each in document order.
+            flat: Stream the groups straight into a FlatHOGForest, stored in forest, without creating
+                the group objects (default: False). groups is left empty, and the methods that walk
+                the group objects raise ValueError: use the *_array methods, count_ortho_pairs,
+                count_paralog_pairs or forest. Requires numpy.
 
         Returns:
             OrthoXMLTree: Initialized OrthoXMLTree instance
@@ -101,17 +172,39 @@ class OrthoXMLTree:
             OrthoXMLParsingError: If there's an error loading or parsing the file
         """
         try:
-            # Load XML document and validate against schema
-            xml_tree = load_orthoxml_file(filepath, validate)
-            
-            # Apply the filter if specified
-            # TODO: Refactor this to be able to filter after the loading too
-            # TODO: Better abstraction for the name of the arg CompletenessScore_threshold
-            if score_threshold:
-                filter_by_score(xml_tree, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs)
+            forest = None
+            if flat:
+                from .flat import FlatHOGForest
 
-            # Parse XML elements into domain models
-            species_list, taxonomy, groups, orthoxml_version = parse_orthoxml(xml_tree)
+                species_list, taxonomy, elements, orthoxml_version = iterparse_orthoxml_elements(
+                    filepath, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs, validate
+                )
+                gene_index = {}
+                for species in species_list:
+                    for gene in species.genes:
+                        gene_index.setdefault(gene._id, len(gene_index))
+                forest = FlatHOGForest.from_elements(elements, gene_index, score_id=score_id or "CompletenessScore")
+                groups = []
+                xml_tree = None
+            elif streaming:
+                # Parse the file incrementally, filtering each rootHOG as it is read
+                species_list, taxonomy, groups_iter, orthoxml_version = iterparse_orthoxml(
+                    filepath, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs, validate
+                )
+                # In the order of the default load: orthologGroups, paralogGroups, then geneRefs
+                groups = in_group_order(groups_iter)
+                xml_tree = None
+            else:
+                # Load XML document and validate against schema
+                xml_tree = load_orthoxml_file(filepath, validate)
+
+                # Apply the filter if specified
+                # TODO: Better abstraction for the name of the arg CompletenessScore_threshold
+                if score_threshold:
+                    filter_by_score(xml_tree, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs)
+
+                # Parse XML elements into domain models
+                species_list, taxonomy, groups, orthoxml_version = parse_orthoxml(xml_tree)
 
             # TODO: Parse genes one time and avoid duplicate representations
             genes = defaultdict(Gene)
@@ -129,14 +222,243 @@ class OrthoXMLTree:
                 groups=groups,
                 taxonomy=taxonomy,
                 xml_tree=xml_tree,
-                orthoxml_version=orthoxml_version
+                orthoxml_version=orthoxml_version,
+                forest=forest
             )
 
         except etree.XMLSyntaxError as e:
             raise OrthoXMLParsingError(f"Invalid XML syntax: {str(e)}") from e
+        except OrthoXMLValidationError:
+            raise
         except Exception as e:
             raise OrthoXMLParsingError(f"Error parsing OrthoXML: {str(e)}") from e
 
+    @classmethod
+    def iter_root_hogs(
+        cls,
+        filepath: str,
+
+        score_threshold: float = None,
+        score_id: str = None,
+        skip_no_scores: bool = False,
+        keep_low_score_parents: bool = False,
+        high_child_as_rhogs: bool = False,
+    ):
+        """
+        Lazily iterate over the rootHOGs of an OrthoXML file.
+
+        Each rootHOG is yielded as its own OrthoXMLTree, sharing the genes, species and
+        taxonomy of the file, so all export methods can be used on it. Only one rootHOG is
+        parsed at a time and it is released as soon as the caller moves on to the next one.
+        The top-level groups are yielded in document order.
+
+        Example:
+            >>> for rhog_tree in OrthoXMLTree.iter_root_hogs("file.orthoxml"):
+            ...     pairs = rhog_tree.to_ortho_pairs()
+
+        Args:
+            filepath: Path to the OrthoXML file
+
+            score_threshold: Threshold value to filter by score (default: None)
+            score_id: ID of the score to filter by (default: None) e.g. CompletenessScore
+            keep_low_score_parents: behavior of the filtering
+            high_child_as_rhogs: behavior of the filtering
+
+        Yields:
+            OrthoXMLTree: a tree holding a single rootHOG in its groups
+
+        Raises:
+            OrthoXMLParsingError: If there's an error loading or parsing the file
+        """
+        species_list, taxonomy, groups_iter, orthoxml_version = iterparse_orthoxml(
+            filepath, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs
+        )
+
+        genes = defaultdict(Gene)
+        for species in species_list:
+            for gene in species.genes:
+                genes[gene._id] = gene
+
+        if not taxonomy:
+            taxonomy = Taxon(id='0', name='root')
+
+        for group in groups_iter:
+            if isinstance(group, OrthologGroup):
+                yield cls(
+                    genes=genes,
+                    species=species_list,
+                    groups=[group],
+                    taxonomy=taxonomy,
+                    xml_tree=None,
+                    orthoxml_version=orthoxml_version
+                )
+
+    @classmethod
+    def filter_file(
+        cls,
+        filepath: str,
+        outfile: str,
+
+        score_threshold: float,
+        score_id: str,
+        skip_no_scores: bool = False,
+        keep_low_score_parents: bool = False,
+        high_child_as_rhogs: bool = False,
+
+        validate: bool = False,
+        pretty: bool = True,
+        compression: str = None,
+    ) -> int:
+        """
+        Filter an OrthoXML file by score into a new OrthoXML file in bounded memory.
+
+        The rootHOGs are parsed, filtered and written one at a time, so the peak memory is
+        proportional to the largest rootHOG instead of the file. The output is the same as
+        from_file(...).to_orthoxml(outfile) with the same filter.
+
+        Args:
+            filepath: Path to the OrthoXML file
+            outfile: Path of the filtered OrthoXML file
+
+            score_threshold: Threshold value to filter by score
+            score_id: ID of the score to filter by e.g. CompletenessScore
+            keep_low_score_parents: behavior of the filtering
+            high_child_as_rhogs: behavior of the filtering
+            validate: Validate the input file while it is parsed (default: False)
+            pretty: pretty-print with indentation
+            compression: "gzip", "bz2", "xz" or "zstd" compression of outfile
+                (default: from its extension, e.g. .gz)
+
+        Returns:
+            int: The number of top-level groups written
+
+        Raises:
+            OrthoXMLParsingError: If there's an error loading or parsing the file
+        """
+        species_list, taxonomy, groups_iter, orthoxml_version = iterparse_orthoxml(
+            filepath, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs, validate
+        )
+        if not taxonomy:
+            taxonomy = Taxon(id='0', name='root')
+
+        return write_orthoxml(outfile, species_list, taxonomy, groups_iter,
+                              orthoxml_version=orthoxml_version, pretty=pretty, compression=compression)
+
+    @classmethod
+    def from_index(cls, filepath: str, rebuild_index: bool = True) -> "OrthoXMLTree":
+        """
+        Create an OrthoXMLTree instance holding only the header (species and taxonomy) of an
+        OrthoXML file, together with a byte-offset index of its rootHOGs.
+
+        The groups are not parsed; use get_root_hog or load_hogs to parse single rootHOGs.
+        The index is read from the sidecar file <filepath>.idx and rebuilt when it is missing
+        or does not match the size and modification time of the file.
+
+        Args:
+            filepath: Path to the OrthoXML file
+            rebuild_index: Whether to rebuild a missing or stale index (default: True)
+
+        Returns:
+            OrthoXMLTree: Initialized OrthoXMLTree instance with empty groups
+
+        Raises:
+            OrthoXMLParsingError: If there's an error loading the file or the index
+        """
+        index = RootHOGIndex.open(filepath, rebuild=rebuild_index)
+
+        # Only the header is consumed, the groups iterator is never started.
+        species_list, taxonomy, _, orthoxml_version = iterparse_orthoxml(filepath)
+
+        genes = defaultdict(Gene)
+        for species in species_list:
+            for gene in species.genes:
+                genes[gene._id] = gene
+
+        if not taxonomy:
+            taxonomy = Taxon(id='0', name='root')
+
+        return cls(
+            genes=genes,
+            species=species_list,
+            groups=[],
+            taxonomy=taxonomy,
+            xml_tree=None,
+            orthoxml_version=orthoxml_version,
+            index=index
+        )
+
+    @classmethod
+    def load_cache(cls, path: str, source: str = None) -> "OrthoXMLTree":
+        """
+        Create an OrthoXMLTree instance from a binary cache written by save_cache.
+
+        The cache is memory-mapped; the genes, species and taxonomy are rebuilt right away
+        while each rootHOG is only rebuilt when it is first accessed in groups.
+        The instance has no xml_tree, so to_gene_tree is not available.
+
+        groups is a cache.CachedGroups rather than a list: it supports the list operations
+        (indexing, iteration, +, append, assignment...), the first modification rebuilding all
+        the rootHOGs. The file stays mapped until close is called, e.g. by using the tree as a
+        context manager; the rootHOGs not accessed by then are no longer available.
+
+        Example:
+            >>> with OrthoXMLTree.load_cache("data/sample.orthoxml.cache") as otree:
+            ...     pairs = otree.to_ortho_pairs()
+
+        Args:
+            path: Path of the cache file
+            source: If given, the OrthoXML file the cache must have been written from.
+                The cache is rejected if the size or modification time of source changed.
+
+        Returns:
+            OrthoXMLTree: Initialized OrthoXMLTree instance
+
+        Raises:
+            OrthoXMLParsingError: If the cache is invalid or stale
+        """
+        genes, species_list, taxonomy, groups, orthoxml_version = read_cache(path, source)
+
+        if not taxonomy:
+            taxonomy = Taxon(id='0', name='root')
+
+        return cls(
+            genes=genes,
+            species=species_list,
+            groups=groups,
+            taxonomy=taxonomy,
+            xml_tree=None,
+            orthoxml_version=orthoxml_version
+        )
+
+    def close(self) -> None:
+        """
+        Release the cache file mapped by load_cache. Does nothing for trees not loaded from a cache.
+        """
+        close = getattr(self.groups, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self) -> "OrthoXMLTree":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def save_cache(self, path: str, source: str = None) -> None:
+        """
+        Write the genes, species, taxonomy and groups of the tree to a compact binary cache
+        that load_cache can map back without parsing any XML.
+
+        The groups are stored as flat arrays (parent index, node kind, taxonId, CSR offsets
+        into the geneRefs and scores) sharing a single string table.
+
+        Args:
+            path: Path of the cache file
+            source: The OrthoXML file the tree was loaded from, recorded to detect stale caches.
+                The CLI only picks up caches written with a source.
+        """
+        write_cache(self, path, source)
+
     @classmethod
     def from_string(cls,
                     xml_str: str,
@@ -181,6 +503,152 @@ class OrthoXMLTree:
         except Exception as e:
             raise OrthoXMLParsingError(f"Error parsing OrthoXML: {str(e)}") from e
 
+    def get_root_hog(self, hog_id: str) -> OrthologGroup:
+        """
+        Get a single rootHOG by its id.
+
+        If the tree was created with from_index, only the byte range of this rootHOG is read
+        and parsed from the file.
+
+        Args:
+            hog_id: id attribute of the rootHOG
+        Returns:
+            OrthologGroup: the rootHOG
+        Raises:
+            KeyError: If there is no rootHOG with this id
+        """
+        return self.load_hogs([hog_id])[0]
+
+    def load_hogs(self, hog_ids: list[str]) -> list[OrthologGroup]:
+        """
+        Get several rootHOGs by their ids.
+
+        If the tree was created with from_index, only the byte ranges of these rootHOGs are
+        read and parsed from the file.
+
+        Args:
+            hog_ids: id attributes of the rootHOGs
+        Returns:
+            list[OrthologGroup]: the rootHOGs, in the order of hog_ids
+        Raises:
+            KeyError: If one of the ids is not a rootHOG of the tree
+        """
+        if self.index is not None:
+            return self.index.load_hogs(hog_ids)
+
+        self._require_groups("load_hogs")
+        root_hogs = {g.id: g for g in self.groups if isinstance(g, OrthologGroup)}
+        return [root_hogs[hog_id] for hog_id in hog_ids]
+
+    def filter_by_score(
+        self,
+        score_id: str,
+        score_threshold: float,
+        strategy: str = "topdown",
+        skip_no_scores: bool = False,
+    ) -> "OrthoXMLTree":
+        """
+        Filter the loaded groups by score, without parsing the file again.
+
+        The tree is not modified. The returned tree shares the genes, species, taxonomy and
+        every group whose subtree is unchanged by the filter, so many thresholds can be tried
+        cheaply on the same loaded tree.
+
+        Example:
+            >>> for threshold in [0.3, 0.5, 0.7]:
+            ...     filtered = otree.filter_by_score("CompletenessScore", threshold, strategy="bottomup")
+
+        Args:
+            score_id: ID of the score to filter by e.g. CompletenessScore
+            score_threshold: Threshold value to filter by score
+            strategy: "topdown" removes low-scoring groups with their subtree, "bottomup" also
+                turns their high-scoring descendants into rootHOGs (default: topdown)
+            skip_no_scores: Keep ortholog groups without scores instead of removing them (default: False)
+
+        Returns:
+            OrthoXMLTree: The filtered tree, without xml_tree
+
+        Raises:
+            ValueError: If the strategy is unknown
+        """
+        if strategy not in FILTER_STRATEGIES:
+            raise ValueError("Invalid filter strategy. Use 'bottomup' or 'topdown'.")
+        keep_low_score_parents, high_child_as_rhogs = FILTER_STRATEGIES[strategy]
+
+        self._require_groups("filter_by_score")
+        groups = filter_groups(
+            self.groups, score_id, score_threshold, skip_no_scores, keep_low_score_parents, high_child_as_rhogs
+        )
+        return OrthoXMLTree(
+            genes=self.genes,
+            species=self.species,
+            groups=groups,
+            taxonomy=self.taxonomy,
+            xml_tree=None,
+            orthoxml_version=self.orthoxml_version
+        )
+
+    def sweep_thresholds(
+        self,
+        score_id: str,
+        thresholds: list[float],
+        strategy: str = "topdown",
+        skip_no_scores: bool = False,
+        output_pattern: str = None,
+    ) -> list[dict]:
+        """
+        Count what filter_by_score retains at each of several thresholds, in a single traversal
+        of the groups.
+
+        Example:
+            >>> otree.sweep_thresholds("CompletenessScore", [0.3, 0.5, 0.7])
+            [{'threshold': 0.3, 'rootHOGs': 12, 'genes': 80, 'pairs': 1450}, ...]
+
+        Args:
+            score_id: ID of the score to filter by e.g. CompletenessScore
+            thresholds: Threshold values to evaluate
+            strategy: "topdown" or "bottomup", as in filter_by_score (default: topdown)
+            skip_no_scores: Keep ortholog groups without scores instead of removing them (default: False)
+            output_pattern: If given, also write the filtered OrthoXML of every threshold to
+                output_pattern.format(threshold=threshold), e.g. "filtered_{threshold}.orthoxml".
+                The scores looked up during the sweep are reused for these.
+
+        Returns:
+            list[dict]: Per threshold, the number of rootHOGs, of geneRefs in the retained groups
+            and of ortholog pairs (as counted by to_ortho_pairs).
+
+        Raises:
+            ValueError: If the strategy is unknown or output_pattern has no {threshold} field
+        """
+        if strategy not in FILTER_STRATEGIES:
+            raise ValueError("Invalid filter strategy. Use 'bottomup' or 'topdown'.")
+        if output_pattern and "{threshold" not in output_pattern:
+            raise ValueError("output_pattern must contain a {threshold} field.")
+        keep_low_score_parents, high_child_as_rhogs = FILTER_STRATEGIES[strategy]
+
+        self._require_groups("sweep_thresholds")
+        counts, node_scores = sweep_groups(
+            self.groups, score_id, thresholds, skip_no_scores, keep_low_score_parents, high_child_as_rhogs
+        )
+
+        if output_pattern:
+            for row in counts:
+                groups = filter_groups(
+                    self.groups, score_id, row["threshold"], skip_no_scores, keep_low_score_parents,
+                    high_child_as_rhogs, node_scores=node_scores
+                )
+                filtered = OrthoXMLTree(
+                    genes=self.genes,
+                    species=self.species,
+                    groups=groups,
+                    taxonomy=self.taxonomy,
+                    xml_tree=None,
+                    orthoxml_version=self.orthoxml_version
+                )
+                filtered.to_orthoxml(output_pattern.format(threshold=row["threshold"]))
+
+        return counts
+
     def split_by_rootHOGs(self, prune_genes=True, prune_species=True, prune_taxonomy=False) -> list["OrthoXMLTree"]:
         """
         Split the current OrthoXMLTree into multiple trees based on the root HOGs.
@@ -188,53 +656,48 @@ class OrthoXMLTree:
         Params:
             prune_genes: Whether to prune genes not in the root HOGs (default: True)
             prune_species: Whether to prune species not in the root HOGs (default: True)
-            prune_taxonomy: Whether to prune taxonomy not in the root HOGs (default: False)
+            prune_taxonomy: Whether to prune taxonomy not in the root HOGs (default: False). The taxonomy of
+                each tree only keeps the taxa of its species and of its levels, up to their lowest common
+                ancestor, computed from a TaxonomyIndex built once
         Returns:
             list[OrthoXMLTree]: List of OrthoXMLTree instances created from the root HOGs.
         """
+        self._require_groups("split_by_rootHOGs")
         # Identify root HOGs: OrthologGroups with no parent.
         root_hogs = [g for g in self.groups if isinstance(g, OrthologGroup)]
 
+        # Locate every gene once instead of scanning all the genes for every rootHOG
+        gene_order = {gene_id: i for i, gene_id in enumerate(self.genes)}
+        gene_species = gene_species_map(self.species)
+        taxonomy_index = self.taxonomy_index() if prune_taxonomy else None
+
         trees = []
         for hog in root_hogs:
+            hog_leaves = set(hog.get_all_leaves())
             if prune_genes:
                 # Pruning the genes
-                hog_leaves = hog.get_all_leaves()
-                genes_subset = {k: v for k, v in self.genes.items() if k in hog_leaves}
+                genes_subset = {k: self.genes[k] for k in sorted(hog_leaves.intersection(gene_order), key=gene_order.get)}
             else:
                 # Use the original genes
                 genes_subset = self.genes
 
             if prune_species:
                 # Pruning the species
-                species_subset = []
-                for species in self.species:
-                    species_genes_in_subset = []
-                    for gene in species.genes:
-                        if gene._id in genes_subset:
-                            species_genes_in_subset.append(gene)
-                    if species_genes_in_subset:
-                        species_subset.append(Species(
-                            name=species.name,
-                            genes=species_genes_in_subset,
-                            taxonId=species.taxonId,
-                            NCBITaxId = species.NCBITaxId
-                        ))
+                hog_species = species_subset(self.species, genes_subset, gene_species)
             else:
                 # Use the original species
-                species_subset = self.species
+                hog_species = self.species
             
             if prune_taxonomy:
-                # Pruning the taxonomy
-                # TODO
-                raise(NotImplementedError("Pruning taxonomy is not yet implemented."))
+                # Pruning the taxonomy to the species and levels of the rootHOG
+                taxonomy = taxonomy_index.prune(hog_species if prune_species else species_subset(self.species, hog_leaves, gene_species), [hog])
             else:
                 # Use the original taxonomy
                 taxonomy = self.taxonomy
 
             trees.append(OrthoXMLTree(
                 genes=genes_subset,
-                species=species_subset,
+                species=hog_species,
                 groups=[hog],
                 taxonomy=taxonomy,
                 xml_tree=self.xml_tree,
@@ -242,79 +705,117 @@ class OrthoXMLTree:
             ))
         return trees
 
+    def split_to_directory(self, directory: str, batch_size: int = 1, workers: int = 1, suffix: str = ".orthoxml", prune_taxonomy: bool = False) -> str:
+        """
+        Write the rootHOGs to a directory, batch_size rootHOGs per OrthoXML file, each file
+        holding only the genes and species of its rootHOGs, and the full taxonomy unless
+        prune_taxonomy is set.
+
+        The species of the genes are located with a map built once, and the files are written
+        by a pool of processes. A tab-separated manifest, manifest.tsv, lists every file with the
+        ids of its rootHOGs and its numbers of genes and species, one line per file in the
+        order of the rootHOGs, e.g. to submit one cluster job per file.
+
+        Args:
+            directory: Output directory, created if needed
+            batch_size: Number of rootHOGs per file (default: 1)
+            workers: Number of processes writing the files (default: 1)
+            suffix: Suffix of the file names, rootHOGs_<i><suffix>. The files are compressed
+                according to its extension, e.g. ".orthoxml.gz"
+            prune_taxonomy: Only keep the taxa of the species and levels of the rootHOGs of
+                each file, as split_by_rootHOGs (default: False)
+
+        Returns:
+            str: The path of the manifest
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._require_groups("split_to_directory")
+        os.makedirs(directory, exist_ok=True)
+        root_hogs = [g for g in self.groups if isinstance(g, OrthologGroup)]
+        n_files = -(-len(root_hogs) // batch_size)
+        width = len(str(max(n_files - 1, 0)))
+
+        tasks = (
+            (root_hogs[start:start + batch_size], os.path.join(directory, f"rootHOGs_{i:0{width}d}{suffix}"))
+            for i, start in enumerate(range(0, len(root_hogs), batch_size))
+        )
+        manifest_path = os.path.join(directory, "manifest.tsv")
+        with open(manifest_path, "w", encoding="utf-8") as manifest:
+            manifest.write("file\trootHOGs\tgenes\tspecies\n")
+            for filepath, hog_ids, n_genes, n_species in imap_in_pool(
+                write_root_hog_shard, tasks, workers,
+                initializer=init_split_worker, initargs=(self.species, self.taxonomy, self.orthoxml_version, prune_taxonomy),
+                finalizer=clear_split_worker
+            ):
+                hog_ids = ",".join("" if hog_id is None else hog_id for hog_id in hog_ids)
+                manifest.write(f"{os.path.basename(filepath)}\t{hog_ids}\t{n_genes}\t{n_species}\n")
+        return manifest_path
+
     def to_orthoxml(
         self,
         filepath: str = None,
         pretty: bool = True,
         origin: str = "orthoXML.org",
-        origin_version: str = "1.0"
+        origin_version: str = "1.0",
+        compression: str = None,
     ) -> str:
         """
         Serialize the current OrthoXMLTree into a brand-new OrthoXML string (or file).
 
+        The document is written incrementally with an OrthoXMLWriter: each species, the taxonomy
+        and each group are serialized and flushed one at a time instead of building a copy of
+        the whole tree.
+
         Args:
             filepath: if given, write bytes to this path and return None
             pretty: pretty-print with indentation
             origin: value for the root @origin attribute
             origin_version: value for the root @originVersion attribute
+            compression: "gzip", "bz2", "xz" or "zstd" compression of the file
+                (default: from the extension of filepath, e.g. .gz)
 
         Returns:
             The OrthoXML document as a Unicode string (if filepath is None).
         """
-        # Create root <orthoXML> element
-        root = etree.Element(
-            f"{{{ORTHO_NS}}}orthoXML",
-            nsmap=NSMAP,
-            version=self.orthoxml_version or "",
-            origin=origin,
-            originVersion=origin_version
-        )
-
-        # Append all <species> blocks
-        for sp in self.species:
-            # species.to_xml() already builds <species><database>… structure
-            root.append(sp.to_xml())
-
-        # Build <taxonomy> … </taxonomy>
-        tax_el = etree.Element(f"{{{ORTHO_NS}}}taxonomy")
-        tax_el.append(self.taxonomy.to_xml())
-        root.append(tax_el)
-
-        # Build <groups> … </groups>
-        groups_el = etree.Element(f"{{{ORTHO_NS}}}groups")
-        for grp in self.groups:
-            if isinstance(grp, (OrthologGroup, ParalogGroup)):
-                groups_el.append(grp.to_xml())
+        self._require_groups("to_orthoxml")
+        output = filepath or io.BytesIO()
+        write_orthoxml(output, self.species, self.taxonomy, self.groups,
+                       orthoxml_version=self.orthoxml_version, pretty=pretty, compression=compression,
+                       origin=origin, origin_version=origin_version)
+        if filepath:
+            return None
 
-            elif isinstance(grp, Gene):
-                # top-level geneRef → <geneRef id="…"/>
-                gr = etree.Element(f"{{{ORTHO_NS}}}geneRef")
-                gr.set("id", grp._id)
-                groups_el.append(gr)
+        return output.getvalue().decode("utf-8")
 
-            else:
-                raise TypeError(
-                    f"Cannot serialize group element of type {type(grp)}: {grp}"
-                )
-
-        root.append(groups_el)
+    def _root_hog_batches(self, workers: int) -> tuple[list[OrthologGroup], list[list[int]]]:
+        """
+        Split the rootHOGs into load-balanced batches, one per worker.
+        The work of a rootHOG is estimated by the square of its leaf count, as its number of pairs is.
 
-        # Serialize to bytes (with XML declaration)
-        xml_bytes = etree.tostring(
-            root,
-            pretty_print=pretty,
-            xml_declaration=True,
-            encoding="utf-8"
-        )
+        Returns:
+            The list of rootHOGs and the batches as lists of positions in it.
+        """
+        root_hogs = [g for g in self.groups if isinstance(g, OrthologGroup)]
+        bins = partition_by_weight(root_hogs, workers, weight=lambda hog: len(hog) ** 2)
+        return root_hogs, bins
 
-        if filepath:
-            with open(filepath, "wb") as f:
-                f.write(xml_bytes)
-            return None
+    def _ortho_pairs_parallel(self, workers: int) -> list[list[(str, str)]]:
+        """
+        Compute the ortholog pairs of every rootHOG in a pool of processes.
 
-        return xml_bytes.decode("utf-8")
+        Returns:
+            The ortholog pairs of each rootHOG, in the order of self.groups.
+        """
+        root_hogs, bins = self._root_hog_batches(workers)
+        results = map_in_pool(ortho_pairs_of_groups, [[root_hogs[i] for i in positions] for positions in bins], workers)
+        pairs_of_hog = [None] * len(root_hogs)
+        for positions, batch_pairs in zip(bins, results):
+            for i, hog_pairs in zip(positions, batch_pairs):
+                pairs_of_hog[i] = hog_pairs
+        return pairs_of_hog
 
-    def to_ortho_pairs(self, filepath=None, sep=",") -> list[(str, str)]:
+    def to_ortho_pairs(self, filepath=None, sep=",", workers=1, format=None) -> list[(str, str)]:
         """
         Recursively traverse the tree and return all of the
         ortholog pairs in the tree.
@@ -322,76 +823,421 @@ class OrthoXMLTree:
 
         Args:
             filepath: Path to write the pairs to
+            workers: Number of processes to split the rootHOGs across (default: 1)
+            format: Output format, one of writers.PAIR_FORMATS ("csv", "csv.gz", "csv.zst", "bin",
+                "parquet"). Guessed from the extension of filepath by default.
         Returns:
             list[(str, str)]: List of ortholog pairs
         """
+        self._require_groups("to_ortho_pairs")
         pairs = []
-        for ortho in self.groups:
-            if isinstance(ortho, OrthologGroup):
-                _, valid_pairs = get_ortho_pairs_recursive(ortho)
-                pairs.extend(valid_pairs)
+        if workers > 1:
+            for hog_pairs in self._ortho_pairs_parallel(workers):
+                pairs.extend(hog_pairs)
+        else:
+            for ortho in self.groups:
+                if isinstance(ortho, OrthologGroup):
+                    _, valid_pairs = get_ortho_pairs_recursive(ortho)
+                    pairs.extend(valid_pairs)
         
         if filepath:
-            with open(filepath, "w") as f:
-                f.writelines(f"{a}{sep}{b}\n" for a, b in pairs)
+            with open_pair_writer(filepath, format, sep) as writer:
+                writer.write_pairs(pairs)
 
         return pairs
     
-    def to_ortho_pairs_iter(self, filepath=None, sep=","):
+    def to_ortho_pairs_iter(self, filepath=None, sep=",", workers=1, shards=False, format=None):
         """
         Generator-based method that traverses all groups in self.groups (assuming they come
         from a tree of gene groups) and yields valid ortholog pairs.
         
         If a filepath is provided, the pairs are written to the file as they are generated.
         Otherwise, a generator is returned.
+
+        With workers > 1 and a filepath, the rootHOGs are split across a pool of processes,
+        balanced by their leaf counts, and each worker writes its own shard <filepath>.<i>.
+        The shards are then concatenated into filepath unless shards is True. Binary and Parquet
+        files cannot be concatenated: without shards, the pairs computed by the workers are
+        written to filepath by the main process.
         
         Args:
         filepath (str): Optional file path to which the pairs should be written.
         sep (str): Separator used when writing pairs to a file.
+        workers (int): Number of processes to split the rootHOGs across.
+        shards (bool): Keep the per-worker shard files instead of merging them into filepath.
+        format (str): Output format, one of writers.PAIR_FORMATS. Guessed from the extension of
+            filepath by default.
         
         Returns:
         If no filepath is provided, returns a generator that yields tuples (geneRef1, geneRef2).
+        With shards, returns the list of shard paths.
         """
+        self._require_groups("to_ortho_pairs_iter")
         def pair_generator():
             for group in self.groups:
                 if isinstance(group, OrthologGroup):
                     yield from get_ortho_pairs_iterative(group)
+
+        def parallel_pair_generator():
+            for hog_pairs in self._ortho_pairs_parallel(workers):
+                yield from hog_pairs
         
         if filepath:
-            with open(filepath, "w") as f:
-                for a, b in pair_generator():
-                    f.write(f"{a}{sep}{b}\n")
+            format = pair_format(filepath, format)
+
+        # Concatenated text, gzip and zstd streams are valid files of the same format
+        if filepath and workers > 1 and (shards or format.startswith("csv")):
+            root_hogs, bins = self._root_hog_batches(workers)
+            shard_paths = [f"{filepath}.{i}" for i in range(len(bins))]
+            tasks = [([root_hogs[i] for i in positions], path, sep, format) for positions, path in zip(bins, shard_paths)]
+            map_in_pool(write_ortho_pairs_of_groups, tasks, workers)
+            if shards:
+                return shard_paths
+            with open(filepath, "wb") as f:
+                for path in shard_paths:
+                    with open(path, "rb") as shard:
+                        shutil.copyfileobj(shard, f)
+                    os.remove(path)
+            return
+        elif filepath:
+            with open_pair_writer(filepath, format, sep) as writer:
+                writer.write_pairs(parallel_pair_generator() if workers > 1 else pair_generator())
             # Optionally return nothing or a status.
             return
+        elif workers > 1:
+            return parallel_pair_generator()
         else:
             return pair_generator()
     
+    def to_flat(self, score_id: str = "CompletenessScore") -> "FlatHOGForest":
+        """
+        Build the array-backed FlatHOGForest of the groups. Requires numpy.
+
+        Gene indices follow the order of self.genes, so forest.gene_ids[i] is the i-th gene.
+
+        Args:
+            score_id: ID of the score stored in forest.score (default: CompletenessScore)
+
+        Returns:
+            FlatHOGForest: The forest of the groups
+        """
+        if self._is_flat():
+            return self.forest
+        from .flat import FlatHOGForest
+
+        gene_index = {gene_id: i for i, gene_id in enumerate(self.genes)}
+        return FlatHOGForest.from_groups(self.groups, gene_index, score_id=score_id)
+
+    def to_ortho_pairs_by_species(self, directory: str, sep=",", max_open_files=256) -> dict[tuple[str, str], str]:
+        """
+        Write the ortholog pairs into one file per pair of species, as the pairs are generated.
+
+        Each pair goes to <directory>/<speciesA>__<speciesB>.csv, the two species names in sorted
+        order, with the gene of speciesA first. Species names sharing a file name get a short hash
+        appended, see writers.species_filenames. GeneRefs of genes missing from the species are
+        written under the species "unknown". At most max_open_files files are open at once, the
+        least recently used ones being closed and reopened for appending when needed.
+
+        Args:
+            directory: Directory to write the files to, created if missing
+            sep: Separator to use when writing to file
+            max_open_files: Maximum number of output files open at the same time
+        Returns:
+            dict[tuple[str, str], str]: The path of the file of each pair of species with pairs
+        """
+        self._require_groups("to_ortho_pairs_by_species")
+        os.makedirs(directory, exist_ok=True)
+        species_of = {gene._id: species.name for species in self.species for gene in species.genes}
+        filenames = species_filenames([species.name for species in self.species] + ["unknown"])
+
+        paths = {}
+        with LRUWriterPool(max_open=max_open_files) as pool:
+            for group in self.groups:
+                if not isinstance(group, OrthologGroup):
+                    continue
+                for a, b in get_ortho_pairs_iterative(group):
+                    species_a, species_b = species_of.get(a, "unknown"), species_of.get(b, "unknown")
+                    if species_b < species_a:
+                        a, b, species_a, species_b = b, a, species_b, species_a
+                    path = paths.get((species_a, species_b))
+                    if path is None:
+                        path = paths[species_a, species_b] = species_pair_path(directory, species_a, species_b, filenames=filenames)
+                    pool.write(path, f"{a}{sep}{b}\n")
+        return paths
+
+    def _pairs_array(self, groups, paralogs):
+        np = import_optional("numpy", "numpy")
+        if self._is_flat():
+            # Loaded with flat=True: there is no object graph to walk
+            pairs = self.forest.paralog_pairs() if paralogs else self.forest.ortho_pairs()
+            return pairs, self.forest.gene_ids
+        gene_index = {gene_id: i for i, gene_id in enumerate(self.genes)}
+        pairs = get_pairs_array(groups, gene_index, paralogs=paralogs)
+        ids = np.array(list(gene_index), dtype=object)
+        return pairs, ids
+
+    def to_ortho_pairs_array(self):
+        """
+        Vectorized version of to_ortho_pairs returning NumPy arrays instead of Python tuples.
+        Requires numpy.
+
+        Example:
+            >>> pairs, ids = otree.to_ortho_pairs_array()
+            >>> ids[pairs]  # (N, 2) array of geneRef ids
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The (N, 2) int32 array of gene indices of the
+            ortholog pairs, in the order of to_ortho_pairs, and the array of geneRef ids
+            of each index.
+        """
+        return self._pairs_array([g for g in self.groups if isinstance(g, OrthologGroup)], paralogs=False)
+
+    def to_paralog_pairs_array(self):
+        """
+        Vectorized version of to_paralog_pairs returning NumPy arrays instead of Python tuples.
+        Requires numpy.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The (N, 2) int32 array of gene indices of the
+            paralog pairs, in the order of to_paralog_pairs, and the array of geneRef ids
+            of each index.
+        """
+        return self._pairs_array(self.groups, paralogs=True)
+
+    def gene_index(self) -> GeneIndex:
+        """
+        Index of the geneRef occurrences in the groups, built on first use and rebuilt
+        when groups is replaced. Call it again with a fresh tree after modifying groups in place.
+
+        Returns:
+            GeneIndex: The index used by the per-gene pair queries
+        """
+        self._require_groups("gene_index")
+        if self._gene_index is None or self._gene_index.groups is not self.groups:
+            self._gene_index = GeneIndex(self.groups)
+        return self._gene_index
+
+    def taxonomy_index(self) -> TaxonomyIndex:
+        """
+        Index of the taxonomy (lookup by id, parents, depths, leaf counts and lowest common
+        ancestors), built on first use and rebuilt when taxonomy is replaced. Call it again
+        with a fresh tree after modifying the taxonomy in place.
+
+        Example:
+            >>> otree.taxonomy_index()["4"].name
+            'Primates'
+
+        Returns:
+            TaxonomyIndex: The index of self.taxonomy
+        """
+        if self._taxonomy_index is None or self._taxonomy_index.root is not self.taxonomy:
+            self._taxonomy_index = TaxonomyIndex(self.taxonomy)
+        return self._taxonomy_index
+
+    def species_lca(self, species_names: list[str]) -> Taxon:
+        """
+        The taxonomic lowest common ancestor of species, given by name.
+
+        Args:
+            species_names: The names of the species
+
+        Returns:
+            Taxon: The lowest common ancestor, None if none of the species is in the taxonomy
+
+        Raises:
+            KeyError: If a name is not the name of a species of the tree
+        """
+        by_name = {sp.name: sp for sp in self.species}
+        return self.taxonomy_index().species_lca(by_name[name] for name in species_names)
+
+    def _count_pairs(self, paralogs: bool, by: str):
+        if by not in (None, "rootHOG", "species", "taxon"):
+            raise ValueError("Invalid breakdown. Use None, 'rootHOG', 'species' or 'taxon'.")
+        root_types = (OrthologGroup, ParalogGroup) if paralogs else OrthologGroup
+
+        if self._is_flat():
+            # Loaded with flat=True: count from the leaf counts of the forest, visiting the
+            # rootHOGs in the order of groups so that rootHOGs without id get the same keys
+            from .flat import ORTHOLOG
+            forest = self.forest
+            node_counts = forest.pair_counts(paralogs)
+            roots = [
+                (position, int(root)) for position, root in enumerate(forest.group_order_roots())
+                if paralogs or forest.kind[root] == ORTHOLOG
+            ]
+            if by == "rootHOG":
+                return {
+                    (forest.node_ids[root] if forest.node_ids[root] is not None else position):
+                        int(node_counts[root:forest.subtree_end[root]].sum())
+                    for position, root in roots
+                }
+            if by is None:
+                return sum(int(node_counts[root:forest.subtree_end[root]].sum()) for _, root in roots)
+            wanted = forest.kind != ORTHOLOG if paralogs else forest.kind == ORTHOLOG
+            if by == "species":
+                species_of = {gene._id: species.name for species in self.species for gene in species.genes}
+                gene_species = [species_of.get(gene_id) for gene_id in forest.gene_ids]
+            counts = defaultdict(int)
+            for _, root in roots:
+                for node in forest.subtree(root):
+                    if not wanted[node]:
+                        continue
+                    if by == "taxon":
+                        taxon = forest.taxon[node]
+                        counts[forest.taxon_ids[taxon] if taxon >= 0 else None] += int(node_counts[node])
+                    elif node_counts[node]:
+                        branches = [Counter([gene_species[gene]]) for gene in forest.own_genes(node)]
+                        branches.extend(Counter(gene_species[gene] for gene in forest.leaves(child)) for child in forest.children(node))
+                        for key, n in species_pair_counts(sum(branches, Counter()), branches).items():
+                            counts[key] += n
+            return dict(counts)
+
+        gene_species = None
+        if by == "species":
+            gene_species = {gene._id: species.name for species in self.species for gene in species.genes}
+
+        if by == "rootHOG":
+            return {
+                (group.id if group.id is not None else position): count_pairs(group, paralogs)
+                for position, group in enumerate(self.groups) if isinstance(group, root_types)
+            }
+        if by is None:
+            return sum(count_pairs(group, paralogs) for group in self.groups if isinstance(group, root_types))
+        counts = defaultdict(int)
+        for group in self.groups:
+            if isinstance(group, root_types):
+                for key, n in count_pairs(group, paralogs, by=by, gene_species=gene_species).items():
+                    counts[key] += n
+        return dict(counts)
+
+    def count_ortho_pairs(self, by: str = None):
+        """
+        Count the ortholog pairs of to_ortho_pairs without generating them.
+
+        The counts are computed from the leaf counts of the branches of every group,
+        so the cost is linear in the size of the tree instead of quadratic in its leaves.
+
+        Example:
+            >>> otree.count_ortho_pairs()
+            1450
+            >>> otree.count_ortho_pairs(by="species")
+            {('Homo sapiens', 'Mus musculus'): 12, ...}
+
+        Args:
+            by: None for the total, "rootHOG" for a dict of counts per rootHOG id (position
+                in groups for rootHOGs without id), "taxon" per taxonId of the group the pairs
+                are formed at, or "species" per pair of species names (in sorted order).
+        Returns:
+            int or dict: The number of ortholog pairs, or the counts per key
+        Raises:
+            ValueError: If by is not a known breakdown
+        """
+        return self._count_pairs(False, by)
+
+    def count_paralog_pairs(self, by: str = None):
+        """
+        Count the paralog pairs of to_paralog_pairs without generating them.
+
+        Args:
+            by: None, "rootHOG", "taxon" or "species", as in count_ortho_pairs
+        Returns:
+            int or dict: The number of paralog pairs, or the counts per key
+        Raises:
+            ValueError: If by is not a known breakdown
+        """
+        return self._count_pairs(True, by)
+
     def to_ortho_pairs_of_gene(self, gene_id: str, filepath=None, sep=",") -> list[(str, str)]:
         """
-        Recursively traverse the tree and return all of the
-        ortholog pairs of a specific gene in the tree.
+        Return all of the ortholog pairs of a specific gene in the tree,
+        in the order of to_ortho_pairs.
+
+        Only the groups on the path from the gene up to its rootHOG are visited,
+        using the index from gene_index.
 
         Args:
             gene_id: Gene ID to get ortholog pairs for
         Returns:
             list[(str, str)]: List of ortholog pairs for the gene
         """
-        # TODO: Refactor this to do it efficiently
-        pairs = []
-        for ortho in self.groups:
-            if isinstance(ortho, OrthologGroup):
-                _, valid_pairs = get_ortho_pairs_recursive(ortho)
-                for pair in valid_pairs:
-                    if gene_id in pair:
-                        pairs.append(pair)
-        
+        pairs = self.gene_index().pairs_of_gene(gene_id)
+
         if filepath:
             with open(filepath, "w") as f:
                 f.writelines(f"{a}{sep}{b}\n" for a, b in pairs)
 
         return pairs
     
-    def to_paralog_pairs(self, filepath=None, sep=",") -> list[(str, str)]:
+    def _pairs_of_genes(self, gene_ids, paralogs, filepath, sep):
+        gene_ids = list(dict.fromkeys(gene_ids))
+        batches = self.gene_index().iter_pairs_of_genes(gene_ids, paralogs=paralogs)
+        if filepath:
+            with open(filepath, "w") as f:
+                for gene_id, pairs in batches:
+                    f.writelines(f"{gene_id}{sep}{a}{sep}{b}\n" for a, b in pairs)
+            return None
+
+        pairs_of_gene = {gene_id: [] for gene_id in gene_ids}
+        for gene_id, pairs in batches:
+            pairs_of_gene[gene_id].extend(pairs)
+        return pairs_of_gene
+
+    def to_ortho_pairs_of_genes(self, gene_ids: list[str], filepath=None, sep=","):
+        """
+        Batch version of to_ortho_pairs_of_gene for many genes.
+
+        The query genes are grouped by rootHOG, so every rootHOG is visited once
+        and the leaves of its branches are shared between its query genes.
+
+        Args:
+            gene_ids: Gene IDs to get ortholog pairs for
+            filepath: If given, stream the pairs to this file as lines
+                query gene, gene 1, gene 2 (in rootHOG order) instead of returning them
+            sep: Separator to use when writing to file
+        Returns:
+            dict[str, list[(str, str)]]: The ortholog pairs of each query gene, as returned by
+            to_ortho_pairs_of_gene, or None if filepath is given
+        """
+        return self._pairs_of_genes(gene_ids, False, filepath, sep)
+
+    def to_paralog_pairs_of_genes(self, gene_ids: list[str], filepath=None, sep=","):
+        """
+        Batch version of to_paralog_pairs_of_gene for many genes.
+
+        Args:
+            gene_ids: Gene IDs to get paralog pairs for
+            filepath: If given, stream the pairs to this file as lines
+                query gene, gene 1, gene 2 (in rootHOG order) instead of returning them
+            sep: Separator to use when writing to file
+        Returns:
+            dict[str, list[(str, str)]]: The paralog pairs of each query gene, as returned by
+            to_paralog_pairs_of_gene, or None if filepath is given
+        """
+        return self._pairs_of_genes(gene_ids, True, filepath, sep)
+
+    def relationship(self, gene_a: str, gene_b: str) -> tuple[str, str]:
+        """
+        Classify a pair of genes from their lowest common ancestor group, without enumerating pairs.
+
+        The LCA structure (Euler tour with a sparse table) of a rootHOG is built on its first
+        query, after which every query costs two dictionary lookups and a range-minimum lookup.
+
+        Example:
+            >>> otree.relationship("hs1", "mm2")
+            ('ortholog', 'Mammalia')
+
+        Args:
+            gene_a: First gene ID
+            gene_b: Second gene ID
+        Returns:
+            tuple[str, str]: "ortholog" or "paralog" depending on the kind of the LCA group, or
+            "unrelated" if the genes are not in the same rootHOG, together with the taxonId of
+            the LCA group (None if unrelated). Genes listed by several groups are located by
+            their first occurrence.
+        """
+        return self.gene_index().relationship(gene_a, gene_b)
+
+    def to_paralog_pairs(self, filepath=None, sep=",", format=None) -> list[(str, str)]:
         """
         Recursively traverse the tree and return all of the
         paralog pairs in the tree.
@@ -399,9 +1245,12 @@ class OrthoXMLTree:
 
         Args:
             filepath: Path to write the pairs to
+            format: Output format, one of writers.PAIR_FORMATS. Guessed from the extension of
+                filepath by default.
         Returns:
             list[(str, str)]: List of paralog pairs
         """
+        self._require_groups("to_paralog_pairs")
         pairs = []
         
         for grp in self.groups:
@@ -409,53 +1258,59 @@ class OrthoXMLTree:
             pairs.extend(valid_pairs)
 
         if filepath:
-            with open(filepath, "w") as f:
-                f.writelines(f"{a}{sep}{b}\n" for a, b in pairs)
+            with open_pair_writer(filepath, format, sep) as writer:
+                writer.write_pairs(pairs)
         
         return pairs
 
     def to_paralog_pairs_of_gene(self, gene_id: str, filepath=None, sep=",") -> list[(str, str)]:
         """
-        Recursively traverse the tree and return all of the
-        paralog pairs of a specific gene in the tree.
+        Return all of the paralog pairs of a specific gene in the tree,
+        in the order of to_paralog_pairs.
         Specify a filepath if you want to write the pairs to file.
 
+        Only the groups on the path from the gene up to its rootHOG are visited,
+        using the index from gene_index.
+
         Args:
             gene_id: Gene ID to get paralog pairs for
         Returns:
             list[(str, str)]: List of paralog pairs for the gene
         """
-        pairs = []
-        for grp in self.groups:
-            _, valid_pairs = get_paralog_pairs_recursive(grp)
-            for pair in valid_pairs:
-                if gene_id in pair:
-                    pairs.append(pair)
+        pairs = self.gene_index().pairs_of_gene(gene_id, paralogs=True)
         if filepath:
             with open(filepath, "w") as f:
                 f.writelines(f"{a}{sep}{b}\n" for a, b in pairs)
         
         return pairs
 
-    def to_ogs(self, filepath=None) -> list[list[str]]:
+    def to_ogs(self, filepath=None, workers=1) -> list[list[str]]:
         """
         Find the maximal OGs for each rHOGs.
 
         Args:
             filepath: Path to write the pairs to
+            workers: Number of processes to split the rootHOGs across (default: 1)
         Returns:
             list[list[str]: list of maximal ogs for each rHOG
         """
+        self._require_groups("to_ogs")
         species_dic = {}
         for species in self.species:
             for gene in species.genes:
                 species_dic[gene._id] = species.name
-        
-        max_ogs = []
 
-        for group in self.groups:
-            if isinstance(group, OrthologGroup):
-                max_ogs.append(get_maximal_og(group, species_dic))
+        if workers > 1:
+            root_hogs = [g for g in self.groups if isinstance(g, OrthologGroup)]
+            # The work of a rootHOG is linear in its size
+            bins = partition_by_weight(root_hogs, workers, weight=len)
+            results = map_in_pool(maximal_ogs_of_groups, [([root_hogs[i] for i in positions], species_dic) for positions in bins], workers)
+            max_ogs = [None] * len(root_hogs)
+            for positions, batch_ogs in zip(bins, results):
+                for i, og in zip(positions, batch_ogs):
+                    max_ogs[i] = og
+        else:
+            max_ogs = maximal_ogs_of_groups(([g for g in self.groups if isinstance(g, OrthologGroup)], species_dic))
 
         if filepath:
             for i, og in enumerate(max_ogs):
@@ -478,6 +1333,8 @@ class OrthoXMLTree:
         :returns: a dict of {roothogid: tree} in NHX format, or a tuple (trees, gene_to_species) if requested.
         """
         # TODO: the gene_to_species=True will break the code here!
+        if self.xml_tree is None:
+            raise ValueError("to_gene_tree requires the XML tree; load the file without streaming.")
 
         target = OrthoxmlToNewick(
             xref_tag=xref_tag,
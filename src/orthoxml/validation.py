@@ -0,0 +1,263 @@
+# validation.py
+
+import functools
+import re
+from importlib import resources
+from typing import NamedTuple
+
+from lxml import etree
+from .exceptions import OrthoXMLParsingError
+from .models import ORTHO_NS
+
+XS_NS = "http://www.w3.org/2001/XMLSchema"
+
+
+class ValidationIssue(NamedTuple):
+    """A schema error: its line, the libxml2 message and, when known, the byte offset of its line."""
+    line: int
+    message: str
+    offset: int = None
+
+
+def _schema_document(orthoxml_version: str) -> etree._Element:
+    # The XSD of a version, from the package resources
+    schema_file = resources.files("orthoxml.schemas").joinpath(f"orthoxml-{orthoxml_version}.xsd")
+    if not schema_file.is_file():
+        raise OrthoXMLParsingError(f"No schema for OrthoXML version {orthoxml_version}")
+    with schema_file.open("rb") as f:
+        return etree.XML(f.read())
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema(orthoxml_version: str) -> etree.XMLSchema:
+    """
+    The compiled schema of an OrthoXML version, compiled once and reused.
+
+    :param orthoxml_version: The OrthoXML version, e.g. "0.5".
+    :raises OrthoXMLParsingError: If there is no schema for this version.
+    """
+    return etree.XMLSchema(_schema_document(orthoxml_version))
+
+
+@functools.lru_cache(maxsize=None)
+def get_streaming_schema(orthoxml_version: str) -> tuple[etree.XMLSchema, frozenset[str], frozenset[str]]:
+    """
+    A schema derived from the schema of an OrthoXML version to validate a document one piece
+    at a time: the children of the root element (species, taxonomy, groups...) and the groups
+    are declared as global elements, and the root element accepts any content in its children,
+    so that a skeleton of the root only checks its attributes and the order of its children.
+
+    The identity constraints of the root (keys, keyrefs and unique ids) span the whole document;
+    they are removed and checked by StreamingValidator instead.
+
+    :return: The compiled schema, the names of the removed identity constraints and the tags of
+             the global elements.
+    :raises OrthoXMLParsingError: If there is no schema for this version.
+    """
+    xs = f"{{{XS_NS}}}"
+    schema_root = _schema_document(orthoxml_version)
+    root_decl = schema_root.find(f"{xs}element[@name='orthoXML']")
+
+    constraints = set()
+    for constraint in root_decl.findall(f"{xs}key") + root_decl.findall(f"{xs}keyref") + root_decl.findall(f"{xs}unique"):
+        constraints.add(constraint.get("name"))
+        root_decl.remove(constraint)
+
+    global_decls = []
+    for child_decl in root_decl.iterfind(f"{xs}complexType/{xs}sequence/{xs}element"):
+        if child_decl.get("type") is not None:
+            global_decls.append((child_decl.get("name"), child_decl.get("type")))
+            del child_decl.attrib["type"]
+    global_decls.extend(
+        (group_decl.get("name"), group_decl.get("type"))
+        for group_decl in schema_root.iterfind(f"{xs}complexType[@name='groups']//{xs}element")
+    )
+
+    declared = {decl.get("name") for decl in schema_root.findall(f"{xs}element")}
+    for name, type_name in global_decls:
+        if name not in declared:
+            etree.SubElement(schema_root, f"{xs}element", name=name, type=type_name)
+            declared.add(name)
+    target_ns = schema_root.get("targetNamespace")
+    return etree.XMLSchema(schema_root), frozenset(constraints), frozenset(f"{{{target_ns}}}{name}" for name in declared)
+
+
+class StreamingValidator:
+    """
+    Validate an OrthoXML document against its schema while it is parsed incrementally.
+
+    Every child of the root element and every top-level group is validated on its own, as soon
+    as it is parsed, so it can be released afterwards; the order of the children of the root is
+    validated at the end on a skeleton of the root. The identity constraints are checked from the
+    ids seen so far: gene and score ids are defined before the groups referring to them.
+    All the errors are collected as ValidationIssue instead of stopping at the first one.
+    """
+
+    def __init__(self, root_el: etree._Element):
+        """
+        :param root_el: The root element, from the start event of iterparse.
+        """
+        self.errors = []
+        self._root_tag = root_el.tag
+        self._root_attrib = dict(root_el.attrib)
+        self._root_line = root_el.sourceline
+        self._children = []  # (tag, line) of the children of the root
+        self._groups_line = None
+        self._n_groups = 0
+        self._gene_ids = set()
+        self._score_ids = set()
+        self._taxon_ids = set()
+        self._group_ids = set()
+        try:
+            self.schema, self.constraints, self.elements = get_streaming_schema(root_el.get("version"))
+        except OrthoXMLParsingError as e:
+            self.schema, self.constraints, self.elements = None, frozenset(), frozenset()
+            self.errors.append(ValidationIssue(self._root_line, str(e)))
+
+    def _validate(self, el: etree._Element) -> None:
+        if self.schema is None:
+            return
+        if el.tag not in self.elements:
+            self.errors.append(ValidationIssue(el.sourceline, f"Element '{el.tag}': This element is not expected."))
+        elif not self.schema.validate(el):
+            self.errors.extend(ValidationIssue(error.line, error.message) for error in self.schema.error_log)
+
+    def _add_key(self, ids: set, el: etree._Element, key: str, kind: str = "key") -> None:
+        self._add_id(ids, el.tag, el.get("id"), el.sourceline, key, kind)
+
+    def _add_id(self, ids: set, tag: str, value: str, line: int, key: str, kind: str = "key", offset: int = None) -> None:
+        if key not in self.constraints or value is None:
+            return
+        if value in ids:
+            self.errors.append(ValidationIssue(line, f"Element '{tag}': Duplicate key-sequence ['{value}'] in {kind} identity-constraint '{{{ORTHO_NS}}}{key}'.", offset))
+        ids.add(value)
+
+    def _check_ref(self, ids: set, el: etree._Element, keyref: str) -> None:
+        value = el.get("id")
+        if keyref in self.constraints and value is not None and value not in ids:
+            self.errors.append(ValidationIssue(el.sourceline, f"Element '{el.tag}': No match found for key-sequence ['{value}'] of keyref '{{{ORTHO_NS}}}{keyref}'."))
+
+    def check_header(self, el: etree._Element) -> None:
+        """Validate a child of the root element other than <groups>, e.g. a <species>."""
+        self._children.append((el.tag, el.sourceline))
+        if el.tag in self.elements:
+            # an unknown child is reported by the validation of the skeleton
+            self._validate(el)
+        for gene in el.iterfind(f"{{{ORTHO_NS}}}database/{{{ORTHO_NS}}}genes/{{{ORTHO_NS}}}gene"):
+            self._add_key(self._gene_ids, gene, "geneidKey")
+        if el.tag == f"{{{ORTHO_NS}}}scores":
+            for score_def in el.iterfind(f"{{{ORTHO_NS}}}scoreDef"):
+                self._add_key(self._score_ids, score_def, "scoreidKey")
+        for taxon in el.iter(f"{{{ORTHO_NS}}}taxon"):
+            self._add_key(self._taxon_ids, taxon, "taxonidKey")
+
+    def start_groups(self, el: etree._Element) -> None:
+        """Record the start of <groups>, from the start event of iterparse."""
+        self._children.append((el.tag, el.sourceline))
+        self._groups_line = el.sourceline
+
+    def check_group(self, el: etree._Element) -> None:
+        """Validate a top-level element of <groups>, before it is modified or released."""
+        self._n_groups += 1
+        self._validate(el)
+        for node in el.iter():
+            if node.tag == f"{{{ORTHO_NS}}}geneRef":
+                self._check_ref(self._gene_ids, node, "geneidRef")
+            elif node.tag == f"{{{ORTHO_NS}}}score":
+                self._check_ref(self._score_ids, node, "scoreidRef")
+            elif node.tag in (f"{{{ORTHO_NS}}}orthologGroup", f"{{{ORTHO_NS}}}paralogGroup"):
+                self._add_key(self._group_ids, node, "uniqueGroupId", kind="unique")
+
+    def chunk_worker_args(self) -> tuple:
+        """The arguments of init_chunk_worker: the ids defined by the header, once it is validated."""
+        return frozenset(self._gene_ids), frozenset(self._score_ids)
+
+    def add_chunk(self, result: tuple) -> None:
+        """Merge the result of validate_chunk on the next slice of <groups>, in file order."""
+        errors, group_ids, n_groups = result
+        self.errors.extend(errors)
+        self._n_groups += n_groups
+        for tag, group_id, line, offset in group_ids:
+            self._add_id(self._group_ids, tag, group_id, line, "uniqueGroupId", kind="unique", offset=offset)
+
+    def finish(self) -> list[ValidationIssue]:
+        """
+        Validate the skeleton of the root element once the whole document was parsed.
+
+        :return: All the errors, sorted by line.
+        """
+        skeleton = etree.Element(self._root_tag, self._root_attrib)
+        skeleton.sourceline = self._root_line
+        for tag, line in self._children:
+            etree.SubElement(skeleton, tag).sourceline = line
+        if self.schema is not None and not self.schema.validate(skeleton):
+            self.errors.extend(ValidationIssue(error.line, error.message) for error in self.schema.error_log)
+        if self.schema is not None and self._groups_line is not None and not self._n_groups:
+            self.errors.append(ValidationIssue(self._groups_line, f"Element '{{{ORTHO_NS}}}groups': Missing child element(s)."))
+        return sorted(self.errors, key=lambda error: error.line or 0)
+
+
+# Ids defined by the header of the file, set in every chunk validation worker by init_chunk_worker.
+_chunk_ids = {}
+
+
+def init_chunk_worker(gene_ids: frozenset[str], score_ids: frozenset[str]) -> None:
+    """Initialize a validate_chunk worker, see StreamingValidator.chunk_worker_args."""
+    _chunk_ids["gene_ids"] = gene_ids
+    _chunk_ids["score_ids"] = score_ids
+
+
+def validate_chunk(task: tuple[bytes, bytes, bytes, int, int]) -> tuple[list[ValidationIssue], list[tuple[str, str, int, int]], int]:
+    """
+    Validate a slice of the content of <groups> wrapped in a minimal envelope, in a worker
+    initialized by init_chunk_worker. Used as a process pool task.
+
+    :param task: A tuple of (prefix, chunk, suffix, offset, line): the start tags of the root
+                 and of <groups> on a single line, the bytes of the slice, the matching end tags,
+                 and the byte offset and line of the slice in the file.
+
+    :return: The errors, located in the file, the (tag, id, line, offset) of the groups, whose
+             uniqueness is checked across slices by StreamingValidator.add_chunk, and the number
+             of top-level elements in the slice.
+    :raises OrthoXMLParsingError: If the slice is unparsable, with the lines of the file in the message.
+    """
+    prefix, chunk, suffix, offset, line = task
+    line_starts = [0] + [m.end() for m in re.finditer(b"\n", chunk)]
+
+    def locate(envelope_line):
+        # The slice starts on the first line of the envelope
+        i = min(max((envelope_line or 1) - 1, 0), len(line_starts) - 1)
+        return line + i, offset + line_starts[i]
+
+    try:
+        root = etree.fromstring(prefix + chunk + suffix, etree.XMLParser(remove_comments=True))
+    except etree.XMLSyntaxError as e:
+        # libxml2 cites lines of the envelope, e.g. "tag mismatch: paralogGroup line 4 and ...".
+        # The columns of its first line, which starts with the envelope, are dropped.
+        def file_line(m):
+            envelope_line = int(m.group(1))
+            return f"line {locate(envelope_line)[0]}" + ((m.group(2) or "") if envelope_line > 1 else "")
+
+        message = re.sub(r"\bline (\d+)(, column \d+)?", file_line, e.msg)
+        raise OrthoXMLParsingError(f"Failed to load OrthoXML file: {message}") from None
+
+    validator = StreamingValidator(root)
+    # the uniqueness of group ids spans the slices, it is checked when they are merged
+    validator.constraints = validator.constraints - {"uniqueGroupId"}
+    validator._gene_ids = _chunk_ids["gene_ids"]
+    validator._score_ids = _chunk_ids["score_ids"]
+
+    group_ids = []
+    n_groups = 0
+    for el in root[0]:
+        n_groups += 1
+        validator.check_group(el)
+        for node in el.iter(f"{{{ORTHO_NS}}}orthologGroup", f"{{{ORTHO_NS}}}paralogGroup"):
+            if node.get("id") is not None:
+                group_ids.append((node.tag, node.get("id"), *locate(node.sourceline)))
+
+    errors = []
+    for error in validator.errors:
+        error_line, error_offset = locate(error.line)
+        errors.append(ValidationIssue(error_line, error.message, error_offset))
+    return errors, group_ids, n_groups
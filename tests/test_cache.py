@@ -0,0 +1,61 @@
+import shutil
+
+import pytest
+
+from orthoxml.cache import has_fresh_cache, cache_path
+from orthoxml.exceptions import OrthoXMLParsingError
+from orthoxml.tree import OrthoXMLTree
+
+
+def test_cache_round_trip(tmp_path):
+    filepath = str(tmp_path / "case.orthoxml")
+    shutil.copy("tests/test-data/case_filtering.orthoxml", filepath)
+    otree = OrthoXMLTree.from_file(filepath)
+
+    otree.save_cache(cache_path(filepath), source=filepath)
+    assert has_fresh_cache(filepath)
+    cached = OrthoXMLTree.load_cache(cache_path(filepath), source=filepath)
+
+    assert repr(cached.species) == repr(otree.species)
+    assert repr(cached.taxonomy) == repr(otree.taxonomy)
+    assert list(cached.genes) == list(otree.genes)
+    assert len(cached.groups) == len(otree.groups)
+    assert repr(list(cached.groups)) == repr(otree.groups)
+    assert cached.to_ortho_pairs() == otree.to_ortho_pairs()
+    cached.close()
+
+def test_cached_groups_behave_as_a_list(tmp_path):
+    filepath = str(tmp_path / "ex3.orthoxml")
+    shutil.copy("examples/data/ex3-int-taxon.orthoxml", filepath)
+    otree = OrthoXMLTree.from_file(filepath)
+    otree.save_cache(cache_path(filepath), source=filepath)
+
+    with OrthoXMLTree.load_cache(cache_path(filepath), source=filepath) as cached:
+        combined = cached.groups + otree.groups
+        assert isinstance(combined, list) and repr(combined) == repr(otree.groups + otree.groups)
+        first = cached.groups[0]
+        cached.groups.append(otree.groups[0])
+        del cached.groups[1]
+        assert cached.groups[0] is first
+        assert repr(list(cached.groups)) == repr([otree.groups[0]] + otree.groups[2:] + [otree.groups[0]])
+    assert cached.groups.closed
+    # every rootHOG was rebuilt by the first modification
+    assert len(cached.groups[:]) == len(otree.groups)
+
+    # the file is no longer mapped and can be replaced
+    with OrthoXMLTree.load_cache(cache_path(filepath)) as cached:
+        cached.groups[0]
+    with pytest.raises(ValueError):
+        cached.groups[1]
+    otree.save_cache(cache_path(filepath), source=filepath)
+
+def test_stale_cache_is_rejected(tmp_path):
+    filepath = str(tmp_path / "ex3.orthoxml")
+    shutil.copy("examples/data/ex3-int-taxon.orthoxml", filepath)
+    OrthoXMLTree.from_file(filepath).save_cache(cache_path(filepath), source=filepath)
+
+    with open(filepath, "a") as f:
+        f.write("\n")
+    assert not has_fresh_cache(filepath)
+    with pytest.raises(OrthoXMLParsingError):
+        OrthoXMLTree.load_cache(cache_path(filepath), source=filepath)
@@ -1,4 +1,7 @@
-from orthoxml.exporters import get_ortho_pairs_recursive, get_ogs
+import pytest
+
+from orthoxml.exporters import get_ortho_pairs_recursive, get_ogs, get_maximal_og
+from orthoxml.tree import OrthoXMLTree
 
 
 def test_get_ortho_pairs_recursive():
@@ -6,3 +9,261 @@ def test_get_ortho_pairs_recursive():
 
 def test_get_ogs():
     pass
+
+def test_ortho_pairs_with_workers(tmp_path):
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    otree.groups = otree.groups + OrthoXMLTree.from_file("examples/data/ex3-int-taxon.orthoxml").groups
+    expected = otree.to_ortho_pairs()
+
+    assert otree.to_ortho_pairs(workers=2) == expected
+    assert list(otree.to_ortho_pairs_iter(workers=2)) == expected
+
+    outfile = tmp_path / "pairs.csv"
+    otree.to_ortho_pairs_iter(filepath=str(outfile), workers=2)
+    assert sorted(outfile.read_text().splitlines()) == sorted(f"{a},{b}" for a, b in expected)
+
+    shard_paths = otree.to_ortho_pairs_iter(filepath=str(outfile), workers=2, shards=True)
+    assert len(shard_paths) == 2
+    lines = []
+    for path in shard_paths:
+        with open(path) as f:
+            lines.extend(f.read().splitlines())
+    assert sorted(lines) == sorted(f"{a},{b}" for a, b in expected)
+
+def test_pairs_array_matches_tuples():
+    pytest.importorskip("numpy")
+    otree = OrthoXMLTree.from_file("examples/data/ex3-int-taxon.orthoxml")
+
+    pairs, ids = otree.to_ortho_pairs_array()
+    assert pairs.shape[1] == 2 and pairs.dtype.name == "int32"
+    assert [tuple(pair) for pair in ids[pairs]] == otree.to_ortho_pairs()
+
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    pairs, ids = otree.to_paralog_pairs_array()
+    assert [tuple(pair) for pair in ids[pairs]] == otree.to_paralog_pairs()
+
+def test_pairs_of_gene_match_full_enumeration():
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    ortho_pairs = otree.to_ortho_pairs()
+    paralog_pairs = otree.to_paralog_pairs()
+
+    for gene_id in otree.genes:
+        assert otree.to_ortho_pairs_of_gene(gene_id) == [pair for pair in ortho_pairs if gene_id in pair]
+        assert otree.to_paralog_pairs_of_gene(gene_id) == [pair for pair in paralog_pairs if gene_id in pair]
+    assert otree.to_ortho_pairs_of_gene("unknown") == []
+
+def test_pairs_of_genes_batch(tmp_path):
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    gene_ids = ["hs1", "gg1", "unknown", "mm2"]
+
+    pairs_of_gene = otree.to_ortho_pairs_of_genes(gene_ids)
+    assert list(pairs_of_gene) == gene_ids
+    for gene_id in gene_ids:
+        assert pairs_of_gene[gene_id] == otree.to_ortho_pairs_of_gene(gene_id)
+    assert otree.to_paralog_pairs_of_genes(gene_ids)["hs1"] == otree.to_paralog_pairs_of_gene("hs1")
+
+    outfile = tmp_path / "pairs.csv"
+    assert otree.to_ortho_pairs_of_genes(gene_ids, filepath=str(outfile)) is None
+    assert sorted(outfile.read_text().splitlines()) == sorted(
+        f"{gene_id},{a},{b}" for gene_id, pairs in pairs_of_gene.items() for a, b in pairs
+    )
+
+def test_relationship_matches_pairs():
+    otree = OrthoXMLTree.from_file("examples/data/ex4-int-taxon.orthoxml")
+    ortho_pairs = otree.to_ortho_pairs()
+    paralog_pairs = otree.to_paralog_pairs()
+
+    for a, b in ortho_pairs:
+        assert otree.relationship(a, b)[0] == "ortholog"
+        assert otree.relationship(b, a)[0] == "ortholog"
+    for a, b in paralog_pairs:
+        assert otree.relationship(a, b)[0] == "paralog"
+    assert otree.relationship("1", "2") == ("ortholog", "3")
+    assert otree.relationship("1", "unknown") == ("unrelated", None)
+    assert otree.relationship("1", "1") == ("unrelated", None)
+
+def test_count_pairs_without_enumeration():
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    ortho_pairs = otree.to_ortho_pairs()
+    paralog_pairs = otree.to_paralog_pairs()
+
+    assert otree.count_ortho_pairs() == len(ortho_pairs)
+    assert otree.count_paralog_pairs() == len(paralog_pairs)
+    assert otree.count_ortho_pairs(by="rootHOG") == {"HOG_Eukaryota": len(ortho_pairs)}
+    assert sum(otree.count_ortho_pairs(by="taxon").values()) == len(ortho_pairs)
+
+    species_of = {gene._id: species.name for species in otree.species for gene in species.genes}
+    for counts, pairs in [(otree.count_ortho_pairs(by="species"), ortho_pairs),
+                          (otree.count_paralog_pairs(by="species"), paralog_pairs)]:
+        expected = {}
+        for a, b in pairs:
+            key = tuple(sorted((species_of[a], species_of[b])))
+            expected[key] = expected.get(key, 0) + 1
+        assert counts == expected
+
+    with pytest.raises(ValueError):
+        otree.count_ortho_pairs(by="genus")
+
+def test_ortho_pairs_by_species(tmp_path):
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    species_of = {gene._id: species.name for species in otree.species for gene in species.genes}
+
+    paths = otree.to_ortho_pairs_by_species(str(tmp_path), max_open_files=2)
+
+    lines = []
+    for (species_a, species_b), path in paths.items():
+        with open(path) as f:
+            for line in f.read().splitlines():
+                a, b = line.split(",")
+                assert (species_of[a], species_of[b]) == (species_a, species_b)
+                lines.append(tuple(sorted((a, b))))
+    assert sorted(lines) == sorted(tuple(sorted(pair)) for pair in otree.to_ortho_pairs())
+
+    # species names that are the same once made safe for a file name get distinct files
+    otree.species[0].name, otree.species[1].name = "Homo sapiens", "Homo/sapiens"
+    paths = otree.to_ortho_pairs_by_species(str(tmp_path / "colliding"))
+    assert len(set(paths.values())) == len(paths)
+    assert ("Homo sapiens", "Homo/sapiens") in paths or ("Homo/sapiens", "Homo sapiens") in paths
+
+
+def test_incomplete_pair_writer_fails_on_creation():
+    from orthoxml.writers import PairWriter
+
+    class ChunkOnlyWriter(PairWriter):
+        def _write_chunk(self, chunk):
+            pass
+
+    with pytest.raises(TypeError):
+        ChunkOnlyWriter()
+
+
+def test_ortho_pairs_formats(tmp_path):
+    import gzip
+    from orthoxml.writers import read_binary_pairs
+
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    expected = otree.to_ortho_pairs()
+
+    gz_path = tmp_path / "pairs.csv.gz"
+    otree.to_ortho_pairs(filepath=str(gz_path))
+    with gzip.open(gz_path, "rt") as f:
+        assert f.read().splitlines() == [f"{a},{b}" for a, b in expected]
+
+    # gzip shards are concatenated into a single valid stream
+    otree.to_ortho_pairs_iter(filepath=str(gz_path), workers=2)
+    with gzip.open(gz_path, "rt") as f:
+        assert sorted(f.read().splitlines()) == sorted(f"{a},{b}" for a, b in expected)
+
+    bin_path = tmp_path / "pairs.out"
+    otree.to_ortho_pairs_iter(filepath=str(bin_path), format="bin", workers=2)
+    values, ids = read_binary_pairs(str(bin_path))
+    assert [(ids[values[i]], ids[values[i + 1]]) for i in range(0, len(values), 2)] == expected
+
+    with pytest.raises(ValueError):
+        otree.to_ortho_pairs(filepath=str(bin_path), format="xlsx")
+
+
+def test_ortho_pairs_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    path = tmp_path / "pairs.parquet"
+    expected = otree.to_ortho_pairs(filepath=str(path))
+    table = parquet.read_table(path)
+    assert list(zip(table["gene1"].to_pylist(), table["gene2"].to_pylist())) == expected
+
+def test_to_orthoxml_roundtrip(tmp_path):
+    import gzip
+
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    xml = otree.to_orthoxml()
+    outfile = tmp_path / "out.orthoxml.gz"
+    otree.to_orthoxml(str(outfile))
+    assert gzip.decompress(outfile.read_bytes()).decode("utf-8") == xml
+
+    # no namespace declaration besides the one of the root element
+    assert xml.count("xmlns") == 1
+    reloaded = OrthoXMLTree.from_file(str(outfile))
+    assert repr(reloaded.groups) == repr(otree.groups)
+    assert repr(reloaded.species) == repr(otree.species)
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_split_to_directory(tmp_path, batch_size):
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    expected = otree.split_by_rootHOGs()
+
+    manifest = otree.split_to_directory(str(tmp_path), batch_size=batch_size, workers=2)
+    with open(manifest) as f:
+        header, *rows = [line.rstrip("\n").split("\t") for line in f]
+    assert header == ["file", "rootHOGs", "genes", "species"]
+    assert len(rows) == -(-len(expected) // batch_size)
+
+    for i, (filename, hog_ids, n_genes, n_species) in enumerate(rows):
+        shard = OrthoXMLTree.from_file(str(tmp_path / filename))
+        batch = expected[i * batch_size:(i + 1) * batch_size]
+        assert repr(shard.groups) == repr([g for t in batch for g in t.groups])
+        assert hog_ids == ",".join(g.id for g in shard.groups)
+        assert int(n_genes) == len(shard.genes) == sum(len(t.genes) for t in batch)
+        assert int(n_species) == len(shard.species)
+        if batch_size == 1:
+            assert repr(shard.species) == repr(batch[0].species)
+
+def test_split_in_process_releases_header(tmp_path):
+    from orthoxml import exporters
+
+    otree = OrthoXMLTree.from_file("examples/data/ex4-int-taxon.orthoxml")
+    otree.split_to_directory(str(tmp_path), workers=1)
+    assert exporters._split_context == {}
+
+@pytest.mark.parametrize("filepath", ["tests/test-data/case_filtering.orthoxml", "examples/data/ex4-int-taxon.orthoxml"])
+def test_level_stats(tmp_path, filepath):
+    from orthoxml.models import OrthologGroup, ParalogGroup
+
+    otree = OrthoXMLTree.from_file(filepath)
+
+    # one recursive walk per statistic
+    expected = {}
+    def walk(node, enclosing):
+        if isinstance(node, OrthologGroup):
+            enclosing = node.taxonId
+            row = expected.setdefault(node.taxonId, {"hogs": 0, "genes": 0, "duplications": 0, "scores": []})
+            row["hogs"] += 1
+            row["genes"] += len(node.get_all_leaves())
+            row["scores"] += [s.value for s in node.scores if s.key == "CompletenessScore"]
+        else:
+            level = node.taxonId if node.taxonId is not None else enclosing
+            expected.setdefault(level, {"hogs": 0, "genes": 0, "duplications": 0, "scores": []})["duplications"] += 1
+        for child in node.orthologGroups + node.paralogGroups:
+            walk(child, enclosing)
+    for group in otree.groups:
+        if isinstance(group, (OrthologGroup, ParalogGroup)):
+            walk(group, None)
+
+    outfile = tmp_path / "levels.tsv"
+    stats = otree.level_stats(filepath=str(outfile))
+    assert set(stats) == set(expected)
+    for level, row in stats.items():
+        scores = expected[level]["scores"]
+        assert (row["hogs"], row["genes"], row["duplications"]) == (expected[level]["hogs"], expected[level]["genes"], expected[level]["duplications"])
+        assert row["scored_hogs"] == len(scores)
+        assert row["mean_score"] == (pytest.approx(sum(scores) / len(scores)) if scores else None)
+        assert row["min_score"] == (min(scores) if scores else None)
+
+    lines = outfile.read_text().splitlines()
+    assert lines[0].split("\t") == ["taxonId", "name", "hogs", "genes", "duplications", "scored_hogs", "mean_score", "min_score"]
+    assert len(lines) == len(stats) + 1
+
+def test_maximal_ogs():
+    from orthoxml.models import OrthologGroup, ParalogGroup
+
+    # a duplication with a two-species branch and a one-species branch, and a leaf duplication
+    species = {"h1": "human", "h2": "human", "m1": "mouse", "m2": "mouse", "r1": "rat", "r2": "rat", "x": "rat"}
+    hog = OrthologGroup(geneRefs=["x"], paralogGroups=[
+        ParalogGroup(geneRefs=["r1"], orthologGroups=[OrthologGroup(geneRefs=["h2"]), OrthologGroup(geneRefs=["h1", "m1"])]),
+        ParalogGroup(geneRefs=["m2", "r2"]),
+    ])
+    assert get_maximal_og(hog, species) == ["x", "h1", "m1", "m2"]
+
+    otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+    otree.groups = otree.groups + OrthoXMLTree.from_file("examples/data/ex4-int-taxon.orthoxml").groups
+    assert otree.to_ogs(workers=2) == otree.to_ogs()
@@ -1,3 +1,126 @@
+import pytest
+from lxml import etree
+
+from orthoxml.loaders import load_orthoxml_file, filter_by_score
+from orthoxml.models import ORTHO_NS, OrthologGroup, ParalogGroup
 from orthoxml.tree import OrthoXMLTree
 
 otree = OrthoXMLTree.from_file("tests/test-data/case_filtering.orthoxml")
+
+
+def group_structure(xml_tree):
+    # Ids of the remaining groups in document order, indented by depth.
+    lines = []
+
+    def walk(el, depth):
+        for child in el.iterchildren("{%s}orthologGroup" % ORTHO_NS, "{%s}paralogGroup" % ORTHO_NS):
+            lines.append("  " * depth + (child.get("id") or etree.QName(child).localname))
+            walk(child, depth + 1)
+
+    walk(xml_tree.getroot().find("{%s}groups" % ORTHO_NS), 0)
+    return lines
+
+
+KEPT_PARENTS = [
+    "HOG_Eukaryota",
+    "  HOG_Opistokonta",
+    "    HOG_Tetrapoda",
+    "      HOG_Sauria",
+    "        HOG_Cryptodira",
+    "      paralogGroup",
+    "        HOG_Mammals_1",
+    "          HOG_Primates",
+    "        HOG_Mammals_2",
+    "          HOG_Primates",
+    "  HOG_Viridiplantae",
+    "    HOG_Pentapetalae",
+]
+
+
+@pytest.mark.parametrize("keep_low_score_parents, high_child_as_rhogs, expected", [
+    (False, False, []),
+    (False, True, [
+        "HOG_Tetrapoda",
+        "  paralogGroup",
+        "HOG_Cryptodira",
+        "HOG_Mammals_1",
+        "HOG_Primates",
+        "HOG_Primates",
+        "HOG_Pentapetalae",
+    ]),
+    (True, False, KEPT_PARENTS),
+    (True, True, KEPT_PARENTS),
+])
+def test_filter_by_score_strategies(keep_low_score_parents, high_child_as_rhogs, expected):
+    xml_tree = load_orthoxml_file("tests/test-data/case_filtering.orthoxml")
+    filter_by_score(xml_tree, "CompletenessScore", 0.5, False, keep_low_score_parents, high_child_as_rhogs)
+    assert group_structure(xml_tree) == expected
+
+
+def model_structure(groups):
+    lines = []
+
+    def walk(nodes, depth):
+        for node in nodes:
+            if isinstance(node, (OrthologGroup, ParalogGroup)):
+                lines.append("  " * depth + (node.id or type(node).__name__[0].lower() + type(node).__name__[1:]))
+                walk(node.orthologGroups + node.paralogGroups, depth + 1)
+
+    walk(groups, 0)
+    return lines
+
+
+@pytest.mark.parametrize("strategy", ["topdown", "bottomup"])
+@pytest.mark.parametrize("threshold", [0.1, 0.25, 0.5, 0.75, 0.95])
+def test_filter_after_loading_matches_filter_at_loading(strategy, threshold):
+    path = "tests/test-data/case_filtering.orthoxml"
+    expected = OrthoXMLTree.from_file(path, score_id="CompletenessScore", score_threshold=threshold,
+                                      high_child_as_rhogs=strategy == "bottomup")
+    before = model_structure(otree.groups)
+
+    filtered = otree.filter_by_score("CompletenessScore", threshold, strategy=strategy)
+
+    assert model_structure(filtered.groups) == model_structure(expected.groups)
+    assert model_structure(otree.groups) == before
+    assert filtered.genes is otree.genes
+
+
+def test_filter_after_loading_shares_unchanged_subtrees():
+    filtered = otree.filter_by_score("CompletenessScore", 0.5, strategy="bottomup")
+    cryptodira = otree.groups[0].orthologGroups[0].orthologGroups[1].orthologGroups[0].orthologGroups[1]
+    assert cryptodira.id == "HOG_Cryptodira"
+    assert any(group is cryptodira for group in filtered.groups)
+
+    with pytest.raises(ValueError):
+        otree.filter_by_score("CompletenessScore", 0.5, strategy="sideways")
+
+
+@pytest.mark.parametrize("strategy", ["topdown", "bottomup"])
+def test_sweep_thresholds_matches_filter(strategy, tmp_path):
+    thresholds = [0.1, 0.25, 0.5, 0.75, 0.95]
+    counts = otree.sweep_thresholds("CompletenessScore", thresholds, strategy=strategy,
+                                    output_pattern=str(tmp_path / "filtered_{threshold}.orthoxml"))
+
+    for threshold, row in zip(thresholds, counts):
+        filtered = otree.filter_by_score("CompletenessScore", threshold, strategy=strategy)
+        root_hogs = [g for g in filtered.groups if isinstance(g, OrthologGroup)]
+        assert row == {
+            "threshold": threshold,
+            "rootHOGs": len(root_hogs),
+            "genes": sum(len(g) for g in filtered.groups if isinstance(g, (OrthologGroup, ParalogGroup))),
+            "pairs": len(filtered.to_ortho_pairs()),
+        }
+        written = OrthoXMLTree.from_file(str(tmp_path / f"filtered_{threshold}.orthoxml"))
+        assert model_structure(written.groups) == model_structure(filtered.groups)
+
+@pytest.mark.parametrize("high_child_as_rhogs", [True, False])
+def test_filter_file_matches_filter_at_loading(high_child_as_rhogs, tmp_path):
+    filepath = "tests/test-data/case_filtering.orthoxml"
+    outfile = tmp_path / "filtered.orthoxml"
+    n_groups = OrthoXMLTree.filter_file(filepath, str(outfile), score_id="CompletenessScore", score_threshold=0.5,
+                                        high_child_as_rhogs=high_child_as_rhogs)
+
+    loaded = OrthoXMLTree.from_file(filepath, score_id="CompletenessScore", score_threshold=0.5,
+                                    high_child_as_rhogs=high_child_as_rhogs)
+    assert n_groups == len(loaded.groups)
+    assert outfile.read_text() == loaded.to_orthoxml()
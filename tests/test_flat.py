@@ -0,0 +1,100 @@
+import pytest
+
+from orthoxml.models import OrthologGroup, ParalogGroup
+from orthoxml.tree import OrthoXMLTree
+
+np = pytest.importorskip("numpy")
+
+
+def test_flat_forest_traversal():
+    otree = OrthoXMLTree.from_file("examples/data/ex3-int-taxon.orthoxml")
+    forest = otree.to_flat()
+    groups = [g for g in otree.groups if isinstance(g, (OrthologGroup, ParalogGroup))]
+
+    assert len(forest.roots) == len(groups)
+    for root, group in zip(forest.roots, groups):
+        assert forest.leaf_ids(root) == group.get_all_leaves()
+        assert forest.leaf_counts()[root] == len(group)
+        for node in forest.subtree(root):
+            assert forest.is_ancestor(root, node)
+            for child in forest.children(node):
+                assert forest.parent[child] == node
+                assert forest.depth[child] == forest.depth[node] + 1
+
+
+def test_flat_load_matches_object_graph():
+    for path in ["examples/data/ex3-int-taxon.orthoxml", "tests/test-data/case_filtering.orthoxml"]:
+        otree = OrthoXMLTree.from_file(path)
+        ftree = OrthoXMLTree.from_file(path, flat=True)
+        assert ftree.groups == [] and ftree.forest is not None
+
+        for method in ["to_ortho_pairs_array", "to_paralog_pairs_array"]:
+            pairs, ids = getattr(ftree, method)()
+            expected_pairs, expected_ids = getattr(otree, method)()
+            assert ids[pairs].tolist() == expected_ids[expected_pairs].tolist()
+
+
+def test_flat_load_with_filter():
+    path = "tests/test-data/case_filtering.orthoxml"
+    otree = OrthoXMLTree.from_file(path, score_id="CompletenessScore", score_threshold=0.75)
+    ftree = OrthoXMLTree.from_file(path, score_id="CompletenessScore", score_threshold=0.75, flat=True)
+
+    forest = otree.to_flat()
+    assert list(ftree.forest.node_ids) == list(forest.node_ids)
+    assert np.array_equal(ftree.forest.subtree_end, forest.subtree_end)
+    assert np.allclose(ftree.forest.score, forest.score, equal_nan=True)
+
+
+def test_flat_pair_counts():
+    path = "tests/test-data/case_filtering.orthoxml"
+    otree = OrthoXMLTree.from_file(path)
+    ftree = OrthoXMLTree.from_file(path, flat=True)
+
+    assert ftree.count_ortho_pairs() == otree.count_ortho_pairs()
+    assert ftree.count_paralog_pairs(by="rootHOG") == otree.count_paralog_pairs(by="rootHOG")
+    assert ftree.count_ortho_pairs(by="taxon") == otree.count_ortho_pairs(by="taxon")
+
+
+def test_flat_tree_needs_group_objects():
+    path = "tests/test-data/case_filtering.orthoxml"
+    otree = OrthoXMLTree.from_file(path)
+    ftree = OrthoXMLTree.from_file(path, flat=True)
+
+    for call in [
+        lambda t: t.to_ortho_pairs(),
+        lambda t: t.to_ogs(),
+        lambda t: t.split_by_rootHOGs(),
+        lambda t: t.relationship("hs1", "mm1"),
+        lambda t: t.level_stats(),
+    ]:
+        with pytest.raises(ValueError, match="flat=True"):
+            call(ftree)
+    assert repr(ftree) == repr(otree)
+    assert ftree.base_stats() == otree.base_stats()
+
+
+def test_flat_pairs_follow_group_order():
+    # top-level paralogGroups between the orthologGroups, listed after them in groups
+    path = "tests/test-data/interleaved.orthoxml"
+    otree = OrthoXMLTree.from_file(path)
+    ftree = OrthoXMLTree.from_file(path, flat=True)
+
+    assert [ftree.forest.node_ids[root] for root in ftree.forest.group_order_roots()] == [g.id for g in otree.groups]
+    for method in ["to_ortho_pairs_array", "to_paralog_pairs_array"]:
+        pairs, ids = getattr(ftree, method)()
+        expected_pairs, expected_ids = getattr(otree, method)()
+        assert ids[pairs].tolist() == expected_ids[expected_pairs].tolist()
+
+
+def test_flat_pair_counts_match_object_graph():
+    # rootHOGs without id are keyed by their position in groups, taxa without pairs are kept
+    for path in ["tests/test-data/interleaved.orthoxml", "tests/test-data/case_filtering.orthoxml"]:
+        otree = OrthoXMLTree.from_file(path)
+        ftree = OrthoXMLTree.from_file(path, flat=True)
+        for by in [None, "rootHOG", "taxon", "species"]:
+            assert ftree.count_ortho_pairs(by=by) == otree.count_ortho_pairs(by=by), (path, by)
+            assert ftree.count_paralog_pairs(by=by) == otree.count_paralog_pairs(by=by), (path, by)
+
+    otree = OrthoXMLTree.from_file("tests/test-data/interleaved.orthoxml")
+    assert otree.count_ortho_pairs(by="rootHOG") == {0: 2, "hog1": 1, 2: 3}
+    assert otree.count_ortho_pairs(by="taxon")["4"] == 0
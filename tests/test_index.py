@@ -0,0 +1,81 @@
+import gzip
+import io
+import os
+import shutil
+
+import pytest
+
+from orthoxml.index import RootHOGIndex, scan_root_hogs
+from orthoxml.tree import OrthoXMLTree
+
+
+@pytest.fixture
+def orthoxml_copy(tmp_path):
+    filepath = tmp_path / "ex3.orthoxml"
+    shutil.copy("examples/data/ex3-int-taxon.orthoxml", filepath)
+    return str(filepath)
+
+def test_scan_is_independent_of_chunk_size():
+    with open("tests/test-data/case_filtering.orthoxml", "rb") as f:
+        data = f.read()
+    expected = scan_root_hogs(io.BytesIO(data))
+    for chunk_size in (1, 5, 64):
+        assert scan_root_hogs(io.BytesIO(data), chunk_size=chunk_size) == expected
+    _, _, entries = expected
+    assert [hog_id for hog_id, _, _ in entries] == ["HOG_Eukaryota"]
+    offset, length = entries[0][1:]
+    assert data[offset:offset + length].startswith(b"<orthologGroup")
+    assert data[offset:offset + length].endswith(b"</orthologGroup>")
+
+def test_get_root_hog_from_index(tmp_path):
+    filepath = str(tmp_path / "case.orthoxml")
+    shutil.copy("tests/test-data/case_filtering.orthoxml", filepath)
+
+    full = OrthoXMLTree.from_file(filepath)
+    indexed = OrthoXMLTree.from_index(filepath)
+
+    assert os.path.exists(filepath + ".idx")
+    assert indexed.groups == []
+    assert repr(indexed.get_root_hog("HOG_Eukaryota")) == repr(full.groups[0])
+    assert repr(full.get_root_hog("HOG_Eukaryota")) == repr(full.groups[0])
+    with pytest.raises(KeyError):
+        indexed.get_root_hog("missing")
+
+def test_stale_index_is_rebuilt(orthoxml_copy):
+    index = RootHOGIndex.open(orthoxml_copy)
+    assert RootHOGIndex.load(orthoxml_copy).entries == index.entries
+
+    with open(orthoxml_copy, "a") as f:
+        f.write("\n")
+    assert not index.is_fresh()
+    assert RootHOGIndex.open(orthoxml_copy).is_fresh()
+
+def test_index_of_compressed_file(tmp_path):
+    for source in ("examples/data/ex3-int-taxon.orthoxml", "tests/test-data/case_filtering.orthoxml"):
+        filepath = str(tmp_path / (os.path.basename(source) + ".gz"))
+        with open(source, "rb") as f, gzip.open(filepath, "wb") as out:
+            out.write(f.read())
+        # offsets are positions in the decompressed document
+        assert RootHOGIndex.build(filepath).entries == RootHOGIndex.build(source).entries
+
+    indexed = OrthoXMLTree.from_index(filepath)
+    full = OrthoXMLTree.from_file(source)
+    assert repr(indexed.get_root_hog("HOG_Eukaryota")) == repr(full.groups[0])
+
+def test_index_unescapes_ids(tmp_path):
+    filepath = str(tmp_path / "escaped.orthoxml")
+    with open("examples/data/ex3-int-taxon.orthoxml") as f:
+        data = f.read()
+    # the id holds an entity, a quote and a tab
+    data = data.replace('<orthologGroup taxonId="5">', '<orthologGroup id="a&amp;b&quot;&#9;c" taxonId="5">', 1)
+    with open(filepath, "w") as f:
+        f.write(data)
+
+    full = OrthoXMLTree.from_file(filepath)
+    assert full.groups[0].id == 'a&b"\tc'
+    assert RootHOGIndex.build(filepath).entries[0][0] == 'a&b"\tc'
+
+    indexed = OrthoXMLTree.from_index(filepath)
+    # read back from the sidecar written by from_index
+    assert RootHOGIndex.load(filepath).entries == indexed.index.entries
+    assert repr(indexed.get_root_hog('a&b"\tc')) == repr(full.groups[0])
@@ -0,0 +1,121 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from orthoxml.tree import OrthoXMLTree
+from orthoxml.models import OrthologGroup
+
+
+def test_streaming_load_matches_full_load():
+    # interleaved.orthoxml has paralogGroups before and between the orthologGroups
+    for filepath in ["examples/data/ex3-int-taxon.orthoxml", "tests/test-data/interleaved.orthoxml"]:
+        full = OrthoXMLTree.from_file(filepath)
+        streamed = OrthoXMLTree.from_file(filepath, streaming=True)
+
+        assert streamed.xml_tree is None
+        assert repr(streamed.species) == repr(full.species)
+        assert repr(streamed.taxonomy) == repr(full.taxonomy)
+        assert repr(streamed.groups) == repr(full.groups)
+
+def test_streaming_load_with_filter():
+    filepath = "tests/test-data/case_filtering.orthoxml"
+    full = OrthoXMLTree.from_file(filepath, score_id="CompletenessScore", score_threshold=0.5, high_child_as_rhogs=True)
+    streamed = OrthoXMLTree.from_file(filepath, score_id="CompletenessScore", score_threshold=0.5, high_child_as_rhogs=True, streaming=True)
+
+    assert [g.id for g in streamed.groups if isinstance(g, OrthologGroup)] == [g.id for g in full.groups if isinstance(g, OrthologGroup)]
+
+def test_iter_root_hogs():
+    filepath = "examples/data/ex3-int-taxon.orthoxml"
+    full = OrthoXMLTree.from_file(filepath)
+
+    pairs = []
+    n_rhogs = 0
+    for rhog_tree in OrthoXMLTree.iter_root_hogs(filepath):
+        assert len(rhog_tree.groups) == 1
+        n_rhogs += 1
+        pairs.extend(rhog_tree.to_ortho_pairs())
+
+    assert n_rhogs == len([g for g in full.groups if isinstance(g, OrthologGroup)])
+    assert pairs == full.to_ortho_pairs()
+
+@pytest.mark.parametrize("compress", [gzip.compress, bz2.compress, lzma.compress])
+def test_load_compressed(tmp_path, compress):
+    filepath = "examples/data/ex3-int-taxon.orthoxml"
+    # the extension is deliberately wrong: the compression is detected from the content
+    compressed = tmp_path / "ex3.orthoxml"
+    with open(filepath, "rb") as f:
+        compressed.write_bytes(compress(f.read()))
+    full = OrthoXMLTree.from_file(filepath)
+
+    assert repr(OrthoXMLTree.from_file(str(compressed)).groups) == repr(full.groups)
+    streamed = OrthoXMLTree.from_file(str(compressed), streaming=True)
+    assert repr(streamed.groups) == repr(full.groups)
+
+def test_streaming_validation(tmp_path):
+    from lxml import etree
+    from orthoxml.exceptions import OrthoXMLValidationError
+    from orthoxml.loaders import validate_orthoxml_file
+    from orthoxml.validation import get_schema
+
+    assert get_schema("0.5") is get_schema("0.5")
+    assert validate_orthoxml_file("examples/data/ex1.orthoxml") == []
+
+    # the same errors, with the same lines, as the validation of the full tree
+    filepath = "tests/test-data/case_filtering.orthoxml"
+    schema = get_schema("0.5")
+    schema.validate(etree.parse(filepath))
+    expected = [(error.line, error.message) for error in schema.error_log if "Warning" not in error.message]
+    errors = validate_orthoxml_file(filepath)
+    found = [(error.line, error.message) for error in errors]
+    assert [error for error in found if error in expected] == sorted(expected)
+    assert any("uniqueGroupId" in error.message for error in errors)
+
+    with pytest.raises(OrthoXMLValidationError) as e:
+        OrthoXMLTree.from_file(filepath, streaming=True, validate=True)
+    assert e.value.errors == errors
+
+def test_parallel_validation():
+    from orthoxml.loaders import validate_orthoxml_file
+
+    filepath = "tests/test-data/case_filtering.orthoxml"
+    errors = validate_orthoxml_file(filepath)
+    # a chunk per rootHOG, validated in two processes
+    parallel = validate_orthoxml_file(filepath, jobs=2, chunk_size=1)
+    assert [(e.line, e.message) for e in parallel] == [(e.line, e.message) for e in errors]
+
+    with open(filepath, "rb") as f:
+        lines = f.read().split(b"\n")
+    line_offsets = [0]
+    for line in lines:
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+    assert all(e.offset == line_offsets[e.line - 1] for e in parallel if e.offset is not None)
+    assert validate_orthoxml_file("examples/data/ex1.orthoxml", jobs=2, chunk_size=1) == []
+
+def test_parallel_validation_of_unparsable_file(tmp_path):
+    from orthoxml.exceptions import OrthoXMLParsingError
+    from orthoxml.loaders import validate_orthoxml_file
+
+    with open("examples/data/ex3-int-taxon.orthoxml") as f:
+        lines = f.read().split("\n")
+    assert lines[41].strip() == "</paralogGroup>"
+    lines[41] = lines[41].replace("</paralogGroup>", "</paralogGrop>")
+    filepath = tmp_path / "broken.orthoxml"
+    filepath.write_text("\n".join(lines))
+
+    # raised in both modes, citing the lines of the file
+    messages = []
+    for jobs in (1, 2):
+        with pytest.raises(OrthoXMLParsingError) as e:
+            validate_orthoxml_file(str(filepath), jobs=jobs, chunk_size=1)
+        messages.append(str(e.value))
+    expected = "Opening and ending tag mismatch: paralogGroup line 38 and paralogGrop, line 42, column 23"
+    assert all(expected in message for message in messages)
+
+    # an unknown version is reported once, without a spurious error on <groups>
+    filepath = tmp_path / "unknown_version.orthoxml"
+    with open("examples/data/ex3-int-taxon.orthoxml") as f:
+        filepath.write_text(f.read().replace('version="0.5"', 'version="9.9"'))
+    assert validate_orthoxml_file(str(filepath), jobs=2, chunk_size=1) == validate_orthoxml_file(str(filepath))
+    assert [e.message for e in validate_orthoxml_file(str(filepath), jobs=2, chunk_size=1)] == ["No schema for OrthoXML version 9.9"]
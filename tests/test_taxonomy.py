@@ -0,0 +1,110 @@
+import itertools
+
+from orthoxml.models import Taxon
+from orthoxml.taxonomy import TaxonomyIndex
+from orthoxml.tree import OrthoXMLTree
+
+
+def taxonomy():
+    #        0
+    #     /  |  \
+    #    1   4   5
+    #   / \     / \
+    #  2   3   6   9
+    #         / \
+    #        7   8
+    return Taxon("0", "root", [
+        Taxon("1", "A", [Taxon("2", "a1"), Taxon("3", "a2")]),
+        Taxon("4", "b"),
+        Taxon("5", "C", [Taxon("6", "D", [Taxon("7", "d1"), Taxon("8", "d2")]), Taxon("9", "c1")]),
+    ])
+
+
+def brute_force_induced(root, ids):
+    # Keep the taxa with a kept taxon in their subtree, then cut the root down to the LCA
+    def keep(taxon):
+        children = [c for c in (keep(child) for child in taxon.children) if c is not None]
+        if taxon.id in ids or children:
+            return Taxon(taxon.id, taxon.name, children)
+        return None
+
+    pruned = keep(root)
+    while len(pruned.children) == 1 and pruned.id not in ids:
+        pruned = pruned.children[0]
+    return pruned
+
+
+def test_taxonomy_index_structure():
+    index = TaxonomyIndex(taxonomy())
+
+    assert [t.id for t in index.taxa] == [str(i) for i in range(10)]
+    assert index.parent == [-1, 0, 1, 1, 0, 0, 5, 6, 6, 5]
+    assert index.depth == [0, 1, 2, 2, 1, 1, 2, 3, 3, 2]
+    assert index.end == [10, 4, 3, 4, 5, 10, 9, 8, 9, 10]
+    assert [t.id for t in index.leaf_taxa("5")] == ["7", "8", "9"]
+    assert [t.id for t in index.leaf_taxa("0")] == ["2", "3", "4", "7", "8", "9"]
+    assert index.is_ancestor("5", "8") and index.is_ancestor("8", "8") and not index.is_ancestor("1", "8")
+
+
+def test_induced_taxonomy_matches_brute_force():
+    root = taxonomy()
+    index = TaxonomyIndex(root)
+    for size in range(4):
+        for ids in itertools.combinations([str(i) for i in range(10)], size):
+            pruned = index.induced_taxonomy(index.number(i) for i in ids)
+            expected = brute_force_induced(root, set(ids)) if ids else Taxon("0", "root")
+            assert repr(pruned) == repr(expected), ids
+
+
+def test_split_with_pruned_taxonomy():
+    otree = OrthoXMLTree.from_file("examples/data/ex4-int-taxon.orthoxml")
+    full = otree.split_by_rootHOGs()
+    pruned = otree.split_by_rootHOGs(prune_taxonomy=True)
+
+    assert [repr(t.groups) for t in pruned] == [repr(t.groups) for t in full]
+    # the second "Mus musculus" leaf has no species, Rattus norvegicus is not in the taxonomy
+    assert pruned[0].taxonomy.to_str() == "\n".join([
+        "Root",
+        "├── Rodentia",
+        "│   └── Mus musculus",
+        "└── Primates",
+        "    ├── Homo sapiens",
+        "    └── Pan troglodytes",
+    ])
+    # the taxonomy of the tree is not modified
+    assert len(TaxonomyIndex(otree.taxonomy).taxa) == 7
+
+
+def test_lookups_and_lca():
+    root = taxonomy()
+    index = TaxonomyIndex(root)
+
+    assert len(index) == len(root) == 6
+    assert index["6"].name == "D" and "6" in index and "x" not in index and index.get("x") is None
+    assert index.parent_of("7").id == "6" and index.parent_of("0") is None
+    assert [t.id for t in index.ancestors("8")] == ["6", "5", "0"]
+    assert index.depth_of("8") == 3
+    for taxon in index.taxa:
+        assert index.leaf_count(taxon.id) == len(taxon)
+
+    def path(taxon_id):
+        return [taxon_id] + [t.id for t in index.ancestors(taxon_id)]
+
+    for ids in itertools.chain(itertools.combinations(map(str, range(10)), 2), itertools.combinations(map(str, range(10)), 3)):
+        common = set.intersection(*(set(path(i)) for i in ids))
+        expected = max(common, key=index.depth_of)
+        assert index.lca(ids).id == expected, ids
+    assert index.lca(["7"]).id == "7" and index.lca([]) is None
+
+
+def test_tree_taxonomy_index():
+    otree = OrthoXMLTree.from_file("examples/data/ex3-int-taxon.orthoxml")
+    index = otree.taxonomy_index()
+
+    assert otree.taxonomy_index() is index
+    assert otree.base_stats()["taxonomy"] == len(otree.taxonomy) == len(index)
+    assert otree.species_lca(["Homo sapiens", "Pan troglodytes"]).name == "Primates"
+    assert otree.species_lca(["Homo sapiens", "Mus musculus"]).name == "Root"
+
+    otree.taxonomy = Taxon("0", "root")
+    assert otree.taxonomy_index() is not index and len(otree.taxonomy_index()) == 1